@@ -0,0 +1,69 @@
+"""catalog indexes
+
+Revision ID: 3f9c2b7d1e4a
+Revises: 827ae5da5293
+Create Date: 2026-10-18 12:00:00.000000
+
+Tables are created by `init_db` on startup, which also creates these
+indexes on a fresh database; on existing databases they are added here.
+Indexes of tables that don't exist yet are skipped.
+On PostgreSQL indexes are built CONCURRENTLY, without locking writes.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel # added
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9c2b7d1e4a'
+down_revision: Union[str, None] = '827ae5da5293'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (name, table, columns, unique)
+INDEXES = [
+    ("ix_sweet_price_id", "sweet", ["price", "id"], False),
+    ("ix_sweet_created_at_id", "sweet", ["created_at", "id"], False),
+    ("ix_sweet_in_stock_price_id", "sweet", ["in_stock", "price", "id"], False),
+    ("ix_sweet_user_id", "sweet", ["user_id"], False),
+    ("ix_sweetcategory_category_id", "sweetcategory", ["category_id"], False),
+    ("ix_sweetingredient_ingredient_id", "sweetingredient", ["ingredient_id"], False),
+    ("ix_token_token", "token", ["token"], True),
+    ("ix_token_user_id", "token", ["user_id"], False),
+    ("ix_user_email", "user", ["email"], True),
+]
+
+
+def _concurrently() -> str:
+    return "CONCURRENTLY " if op.get_context().dialect.name == "postgresql" else ""
+
+
+def _create_index(name, table, columns, unique=False):
+    # IF NOT EXISTS of op.create_index requires SQLAlchemy 2.0
+    op.execute(
+        f'CREATE {"UNIQUE " if unique else ""}INDEX {_concurrently()}IF NOT EXISTS {name} '
+        f'ON "{table}" ({", ".join(columns)})'
+    )
+
+
+def _drop_index(name):
+    op.execute(f"DROP INDEX {_concurrently()}IF EXISTS {name}")
+
+
+def upgrade() -> None:
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique in INDEXES:
+            if table in tables:
+                _create_index(name, table, columns, unique)
+        # Superseded by ix_sweet_price_id
+        _drop_index("ix_sweet_price")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        _create_index("ix_sweet_price", "sweet", ["price"])
+        for name, _, _, _ in reversed(INDEXES):
+            _drop_index(name)
@@ -0,0 +1,59 @@
+"""token lifecycle indexes
+
+Revision ID: 7b1d4e9a2c60
+Revises: 3f9c2b7d1e4a
+Create Date: 2026-10-18 16:00:00.000000
+
+`ix_token_user_id_expires` serves the lookup of a reusable token on login
+and replaces `ix_token_user_id`; `ix_token_expires` serves the sweeper of
+expired tokens. On PostgreSQL indexes are built CONCURRENTLY. On a fresh
+database `init_db` creates them with the table, so they are skipped here.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel # added
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b1d4e9a2c60'
+down_revision: Union[str, None] = '3f9c2b7d1e4a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (name, table, columns)
+INDEXES = [
+    ("ix_token_user_id_expires", "token", ["user_id", "expires"]),
+    ("ix_token_expires", "token", ["expires"]),
+]
+
+
+def _concurrently() -> str:
+    return "CONCURRENTLY " if op.get_context().dialect.name == "postgresql" else ""
+
+
+def _create_index(name, table, columns):
+    # IF NOT EXISTS of op.create_index requires SQLAlchemy 2.0
+    op.execute(f'CREATE INDEX {_concurrently()}IF NOT EXISTS {name} ON "{table}" ({", ".join(columns)})')
+
+
+def _drop_index(name):
+    op.execute(f"DROP INDEX {_concurrently()}IF EXISTS {name}")
+
+
+def upgrade() -> None:
+    if not sa.inspect(op.get_bind()).has_table("token"):
+        return
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            _create_index(name, table, columns)
+        # Superseded by ix_token_user_id_expires
+        _drop_index("ix_token_user_id")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        _create_index("ix_token_user_id", "token", ["user_id"])
+        for name, _, _ in reversed(INDEXES):
+            _drop_index(name)
@@ -0,0 +1,51 @@
+"""sweet search
+
+Revision ID: a5d3f8c61b27
+Revises: e1a7c3d92f48
+Create Date: 2026-10-18 21:00:00.000000
+
+Adds the `sweetsearch` documents of full-text search with the GIN index of
+their weighted vectors and, on PostgreSQL, the `pg_trgm` trigram index of
+titles serving substring matches. Tables are created by `init_db` on
+startup, here the table is added to existing databases; documents of
+existing sweets are built on startup by `search.index_missing_sweets`.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel # added
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a5d3f8c61b27'
+down_revision: Union[str, None] = 'e1a7c3d92f48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    # On a fresh database `init_db` creates the table after `sweet` it refers to
+    if inspector.has_table("sweetsearch") or not inspector.has_table("sweet"):
+        return
+    op.create_table(
+        "sweetsearch",
+        sa.Column("sweet_id", sa.Integer(), sa.ForeignKey("sweet.id"), primary_key=True),
+        sa.Column("title", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("description", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("tags", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("search_vector", postgresql.TSVECTOR().with_variant(sa.Text(), "sqlite"), nullable=True),
+    )
+    op.create_index("ix_sweetsearch_search_vector", "sweetsearch", ["search_vector"], postgresql_using="gin")
+    if bind.dialect.name == "postgresql":
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute("CREATE INDEX IF NOT EXISTS ix_sweetsearch_title_trgm "
+                   "ON sweetsearch USING gin (title gin_trgm_ops)")
+
+
+def downgrade() -> None:
+    # `pg_trgm` stays installed, other objects of the database may use it
+    op.drop_table("sweetsearch")
@@ -0,0 +1,58 @@
+"""sweet cards
+
+Revision ID: c4e8a1f05b39
+Revises: 7b1d4e9a2c60
+Create Date: 2026-10-18 17:00:00.000000
+
+Adds the `sweetcard` read model. Tables are created by `init_db` on
+startup, here the table is added to existing databases; cards of existing
+sweets are built on startup by `cards.refresh_missing_cards`.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel # added
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e8a1f05b39'
+down_revision: Union[str, None] = '7b1d4e9a2c60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (name, columns)
+INDEXES = [
+    ("ix_sweetcard_user_id", ["user_id"]),
+    ("ix_sweetcard_price_id", ["price", "id"]),
+    ("ix_sweetcard_created_at_id", ["created_at", "id"]),
+    ("ix_sweetcard_in_stock_price_id", ["in_stock", "price", "id"]),
+]
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    # On a fresh database `init_db` creates the table after `sweet` it refers to
+    if inspector.has_table("sweetcard") or not inspector.has_table("sweet"):
+        return
+    json_type = sa.JSON().with_variant(postgresql.JSONB(), "postgresql")
+    op.create_table(
+        "sweetcard",
+        sa.Column("id", sa.Integer(), sa.ForeignKey("sweet.id"), primary_key=True),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("title", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("description", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("price", sa.Integer(), nullable=False),
+        sa.Column("in_stock", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("edited_at", sa.DateTime(), nullable=False),
+        sa.Column("categories", json_type, nullable=False),
+        sa.Column("ingredients", json_type, nullable=False),
+    )
+    for name, columns in INDEXES:
+        op.create_index(name, "sweetcard", columns)
+
+
+def downgrade() -> None:
+    op.drop_table("sweetcard")
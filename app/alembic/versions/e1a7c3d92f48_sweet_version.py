@@ -0,0 +1,38 @@
+"""sweet version
+
+Revision ID: e1a7c3d92f48
+Revises: c4e8a1f05b39
+Create Date: 2026-10-18 19:00:00.000000
+
+Adds `version` to sweets and their cards, the counter of updates compared
+by conditional updates (`If-Match`). Existing rows start at version 1.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1a7c3d92f48'
+down_revision: Union[str, None] = 'c4e8a1f05b39'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ["sweet", "sweetcard"]
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    for table in TABLES:
+        # Tables of a fresh database are created with the column by `init_db`
+        if not inspector.has_table(table):
+            continue
+        if "version" in {column["name"] for column in inspector.get_columns(table)}:
+            continue
+        op.add_column(table, sa.Column("version", sa.Integer(), nullable=False, server_default="1"))
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.drop_column(table, "version")
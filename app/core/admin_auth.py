@@ -11,7 +11,7 @@ from app.core.app_config import settings
 from app.core.db_config import get_session, admin_session
 from app.users import db_manager
 from app.users.models import User, Token
-from app.users.security import validate_password
+from app.users.security import validate_password_async, needs_rehash
 
 
 class AdminAuth(AuthenticationBackend):
@@ -19,33 +19,25 @@ class AdminAuth(AuthenticationBackend):
         form = await request.form()
         email, password = form["username"], form["password"]
 
-        with admin_session(expire_on_commit=True) as session:
+        async with admin_session(expire_on_commit=True) as session:
             stmt = select(User).where(User.email == email)
-            result = session.execute(stmt)
+            result = await session.execute(stmt)
             user = result.scalar_one_or_none()
 
         if not user:
             raise HTTPException(status_code=400, detail="Incorrect email or password")
 
-        if not validate_password(
+        if not await validate_password_async(
                 password=password, hashed_password=user.hashed_password
         ):
             raise HTTPException(status_code=400, detail="Incorrect email or password")
 
-        print(user)
+        if needs_rehash(user.hashed_password):
+            async with admin_session(expire_on_commit=False) as session:
+                await db_manager.rehash_user_password(user, password, session)
 
-        with admin_session(expire_on_commit=True) as session:
-            user_token = Token(user_id=user.id,
-                               expires=datetime.now() + timedelta(weeks=2))
-
-            session.add(user_token)
-            session.commit()
-
-        with admin_session(expire_on_commit=True) as session:
-            stmt = select(Token).where(Token.user_id == user.id)
-            result = session.execute(stmt)
-            user_token = result.scalars()
-            res = user_token.first()
+        async with admin_session(expire_on_commit=False) as session:
+            res = await db_manager.get_or_create_user_token(user.id, session)
 
         uuid_to_str = str(res.token)
 
@@ -55,7 +47,10 @@ class AdminAuth(AuthenticationBackend):
         return True
 
     async def logout(self, request: Request) -> bool:
-        # Usually you'd want to just clear the session
+        token = request.session.get("token")
+        if token:
+            async with admin_session() as session:
+                await db_manager.revoke_token(token, session)
         request.session.clear()
         return True
 
@@ -65,8 +60,10 @@ class AdminAuth(AuthenticationBackend):
         if not token:
             return False
 
-        # Check the token in depth
-        return True
+        # Revoked and expired tokens end the admin session
+        async with admin_session() as session:
+            user = await db_manager.get_user_by_token(token, session)
+        return user is not None and user[0].is_active
 
 
 authentication_backend = AdminAuth(secret_key=settings.SECRET_KEY)
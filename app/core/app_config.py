@@ -22,9 +22,9 @@ Note, complex types like lists are read as json-encoded strings.
 """
 import tomllib
 from pathlib import Path
-from typing import Literal
+from typing import List, Literal, Optional
 
-from pydantic import BaseSettings
+from pydantic import BaseSettings, constr
 
 PROJECT_DIR = Path(__file__).parent.parent.parent
 with open(f"{PROJECT_DIR}/pyproject.toml", "rb") as f:
@@ -50,6 +50,18 @@ class Settings(BaseSettings):
     DEFAULT_DB_NAME: str
     DEFAULT_SQLALCHEMY_DATABASE_URI: str = ""
 
+    # DATABASE CONNECTION POOL (timeout and recycle in seconds, SQL echo defaults to DEV only)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_ECHO: Optional[bool] = None
+
+    # READ REPLICA (optional, skipped for REPLICA_RETRY_AFTER seconds after a failure)
+    REPLICA_SQLALCHEMY_DATABASE_URI: str = ""
+    REPLICA_RETRY_AFTER: float = 30.0
+
     # POSTGRESQL TEST DATABASE
     TEST_DATABASE_HOSTNAME: str = "postgres"
     TEST_DATABASE_USER: str = "postgres"
@@ -58,6 +70,69 @@ class Settings(BaseSettings):
     TEST_DATABASE_DB: str = "postgres"
     TEST_SQLALCHEMY_DATABASE_URI: str = ""
 
+    # ADMINS (emails of users allowed to read exports and service data, a JSON list)
+    ADMIN_EMAILS: List[str] = []
+
+    # PAGINATION
+    SWEETS_PER_PAGE: int = 10
+    SWEETS_MAX_PER_PAGE: int = 100
+    USERS_PER_PAGE: int = 50
+    USERS_MAX_PER_PAGE: int = 500
+
+    # CATALOG QUERY (max IDs per filter and length of the text query)
+    CATALOG_MAX_FILTER_IDS: int = 20
+    CATALOG_MAX_QUERY_LENGTH: int = 100
+
+    # TOKEN LIFECYCLE (logins reuse a token with at least TOKEN_REUSE_MIN_DAYS left,
+    # expired tokens are deleted every TOKEN_SWEEP_INTERVAL seconds, 0 disables the sweeper)
+    TOKEN_LIFETIME_DAYS: int = 14
+    TOKEN_REUSE_MIN_DAYS: int = 7
+    TOKEN_SWEEP_INTERVAL: int = 3600
+    TOKEN_SWEEP_BATCH: int = 1000
+
+    # ACCESS TOKENS ISSUED ON LOGIN ("database" rows or stateless "signed" tokens, lifetime in seconds)
+    AUTH_TOKEN_MODE: Literal["database", "signed"] = "database"
+    SIGNED_TOKEN_LIFETIME: int = 900
+
+    # AUTHENTICATION CACHE (tokens -> users, TTL in seconds)
+    TOKEN_CACHE_SIZE: int = 10_000
+    TOKEN_CACHE_TTL: int = 60
+
+    # PASSWORD HASHING (PBKDF2 cost and the hashing thread pool)
+    PASSWORD_HASH_ITERATIONS: int = 100_000
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_QUEUE: int = 64
+    PASSWORD_HASH_TIMEOUT: float = 5.0
+
+    # BULK IMPORT/EXPORT (rows per transaction and per export batch)
+    BULK_CHUNK_SIZE: int = 1000
+
+    # TAXONOMY CACHE (titles of categories and ingredients reloaded every TAXONOMY_CACHE_TTL seconds,
+    # facet counts cached per filter until the catalog changes, at most FACETS_CACHE_TTL seconds)
+    TAXONOMY_CACHE_TTL: int = 300
+    FACETS_CACHE_SIZE: int = 256
+    FACETS_CACHE_TTL: int = 60
+
+    # IN-MEMORY INDEX OF SWEETS (ingredient matching, similar sweets and price statistics,
+    # rebuilt every SWEET_INDEX_TTL seconds)
+    SWEET_INDEX_TTL: int = 600
+    MATCH_MAX_INGREDIENTS: int = 100
+    PRICE_STATS_MAX_BUCKETS: int = 100
+
+    # HTTP RESPONSE CACHE OF PUBLIC CATALOG READS (TTL in seconds)
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_SIZE: int = 1024
+    RESPONSE_CACHE_TTL: int = 30
+
+    # REQUEST PROFILING (share of requests run under cProfile, slow request threshold in seconds)
+    PROFILING_ENABLED: bool = False
+    PROFILING_SAMPLE_RATE: float = 0.0
+    PROFILING_SLOW_REQUEST: float = 0.5
+    PROFILING_KEEP: int = 20
+
+    # FULL TEXT SEARCH (PostgreSQL text search configuration)
+    SEARCH_LANGUAGE: constr(regex=r"^[a-z_]+$") = "russian"
+
     class Config:
         env_file = f"{PROJECT_DIR}/.env"
         case_sensitive = True
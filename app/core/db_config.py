@@ -1,7 +1,17 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.core.app_config import settings
-from sqlmodel import create_engine, SQLModel, Session
+from app.core.metrics import TimedQueuePool, query_metrics
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 DB_USER = settings.DEFAULT_DB_USER
 DB_PASS = settings.DEFAULT_DB_PASS
@@ -9,18 +19,109 @@ DB_HOST = settings.DEFAULT_DB_HOST
 DB_PORT = settings.DEFAULT_DB_PORT
 DB_NAME = settings.DEFAULT_DB_NAME
 
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+logger = logging.getLogger(__name__)
+
+DATABASE_URL = (settings.DEFAULT_SQLALCHEMY_DATABASE_URI
+                or f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}")
+
+# Logging every statement is only affordable in development
+DB_ECHO = settings.ENVIRONMENT == "DEV" if settings.DB_ECHO is None else settings.DB_ECHO
+
+
+def _engine_options(url: str) -> dict:
+    # SQLite (local runs) keeps the default pool of its dialect
+    if make_url(url).get_backend_name() != "postgresql":
+        return {}
+    return dict(
+        poolclass=TimedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+
 
-engine = create_engine(DATABASE_URL, echo=True)
+engine = create_async_engine(DATABASE_URL, echo=DB_ECHO, future=True, **_engine_options(DATABASE_URL))
+query_metrics.attach(engine)
+
+# Optional read replica, used by read-only handlers through `get_read_session`
+replica_engine = None
+if settings.REPLICA_SQLALCHEMY_DATABASE_URI:
+    replica_engine = create_async_engine(settings.REPLICA_SQLALCHEMY_DATABASE_URI, echo=DB_ECHO, future=True,
+                                         **_engine_options(settings.REPLICA_SQLALCHEMY_DATABASE_URI))
+    query_metrics.attach(replica_engine)
+
+# Objects must stay readable after commit: lazy refresh is not possible in async code
+async_session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+replica_session = sessionmaker(bind=replica_engine, class_=AsyncSession, expire_on_commit=False)
 
 # Session for sqladmin
-admin_session = sessionmaker(bind=engine, class_=Session)
+admin_session = sessionmaker(bind=engine, class_=AsyncSession)
+
+
+async def init_db():
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+
+async def get_session():
+    async with async_session() as session:
+        yield session
+
+
+class ReplicaRouter:
+    """Chooses the database of read-only sessions, skips the replica for a while after a failure"""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        self.down_until = 0.0
+        self.fallbacks = 0
+
+    @property
+    def available(self) -> bool:
+        return replica_engine is not None and time.monotonic() >= self.down_until
+
+    def mark_down(self):
+        self.down_until = time.monotonic() + self.retry_after
+        self.fallbacks += 1
+
+    def stats(self) -> dict:
+        return {
+            "configured": replica_engine is not None,
+            "available": self.available,
+            "fallbacks": self.fallbacks,
+        }
+
+
+replica_router = ReplicaRouter(retry_after=settings.REPLICA_RETRY_AFTER)
+
+
+@asynccontextmanager
+async def read_session():
+    """
+    Opens a session on the replica, or on the primary if the replica is not configured or fails to connect.
 
+    Replicas lag behind the primary: paths reading their own writes must use `async_session`.
+    """
+    if replica_router.available:
+        session = replica_session()
+        try:
+            # Connect before the handler runs, so a dead replica is noticed while we can still switch
+            await session.connection()
+        except (DBAPIError, OSError, asyncio.TimeoutError) as exc:
+            await session.close()
+            replica_router.mark_down()
+            logger.warning("Read replica unavailable, falling back to primary: %r", exc)
+        else:
+            async with session:
+                yield session
+            return
 
-def init_db():
-    SQLModel.metadata.create_all(engine)
+    async with async_session() as session:
+        yield session
 
 
-def get_session():
-    with Session(engine) as session:
-        yield session
\ No newline at end of file
+async def get_read_session():
+    async with read_session() as session:
+        yield session
@@ -1,7 +1,8 @@
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app.core.app_config import settings
 from app.core.db_config import get_session
-from app.users import db_manager
+from app.users import db_manager, signed_tokens
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 
@@ -9,8 +10,12 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth")
 
 
 async def get_current_user(token: str = Depends(oauth2_scheme),
-                           session: Session = Depends(get_session)):
-    user = db_manager.get_user_by_token(token, session=session)
+                           session: AsyncSession = Depends(get_session)):
+    # Signed tokens are verified in-process, without the database
+    if signed_tokens.is_signed_token(token):
+        user = signed_tokens.get_user_by_token(token)
+    else:
+        user = await db_manager.get_user_by_token(token, session=session)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -23,3 +28,13 @@ async def get_current_user(token: str = Depends(oauth2_scheme),
             status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user"
         )
     return user
+
+
+async def get_current_admin(current_user=Depends(get_current_user)):
+    # Admins are listed by email in the settings
+    if current_user[0].email not in settings.ADMIN_EMAILS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins have access to this resource",
+        )
+    return current_user
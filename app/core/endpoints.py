@@ -0,0 +1,152 @@
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import text
+
+from app.core.db_config import engine, replica_engine, replica_router
+from app.core.dependencies import get_current_admin
+from app.core.metrics import pool_status, query_metrics, prometheus_histogram, prometheus_sample, TimedQueuePool
+from app.core.profiling import request_profiler
+
+service_router = APIRouter()
+prometheus_router = APIRouter()
+
+
+async def _ping(bind) -> float:
+    started = time.perf_counter()
+    async with bind.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+    return time.perf_counter() - started
+
+
+@service_router.get("/health")
+async def health():
+    """
+    **Checks that the databases answer**
+
+    A failing replica is reported without failing the check, reads fall back to the primary.
+
+    Returns: Dictionary containing round trip times of `SELECT 1` in seconds and pool states.
+
+    Raises: HTTPException: If the primary database is unavailable.
+    """
+    try:
+        latency = await _ping(engine)
+    except Exception as exc:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Database unavailable: {type(exc).__name__}",
+        )
+    result = {"database": "ok", "latency": latency, "pool": pool_status(engine.pool)}
+
+    if replica_engine is not None:
+        try:
+            replica = {"database": "ok", "latency": await _ping(replica_engine)}
+        except Exception as exc:
+            replica = {"database": f"unavailable: {type(exc).__name__}"}
+        result["replica"] = {**replica, "pool": pool_status(replica_engine.pool), **replica_router.stats()}
+    return result
+
+
+@service_router.get("/metrics/db")
+async def db_metrics(top: int = 20, current_user=Depends(get_current_admin)):
+    """
+    **Retrieves statistics of the connection pools and timings of SQL statements**
+
+    Only users listed in `ADMIN_EMAILS` have access.
+
+    Args:
+     - top (int, optional): Number of statements with the largest total time. Defaults to 20.
+
+    Returns: Dictionary containing pool states and timing histograms in seconds.
+    """
+    result = {"pool": pool_status(engine.pool), "queries": query_metrics.snapshot(top=top)}
+    if replica_engine is not None:
+        result["replica"] = {"pool": pool_status(replica_engine.pool), **replica_router.stats()}
+    return result
+
+
+@service_router.get("/profiles")
+async def slow_request_profiles(current_user=Depends(get_current_admin)):
+    """
+    **Retrieves sampled cProfile profiles of slow requests**
+
+    Profiles are only recorded with `PROFILING_ENABLED` and a non-zero `PROFILING_SAMPLE_RATE`.
+    Only users listed in `ADMIN_EMAILS` have access.
+
+    Returns: List of profiles, the most recent last.
+    """
+    return list(request_profiler.profiles)
+
+
+def _prometheus_metrics() -> str:
+    lines = [
+        "# HELP http_request_duration_seconds Latency of HTTP requests.",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    routes = sorted(request_profiler.routes.items())
+    for (method, route), metrics in routes:
+        lines += prometheus_histogram("http_request_duration_seconds", metrics.latency,
+                                      {"method": method, "route": route})
+    lines += [
+        "# HELP http_requests_total Number of HTTP responses.",
+        "# TYPE http_requests_total counter",
+    ]
+    for (method, route), metrics in routes:
+        for status_code, count in sorted(metrics.responses.items()):
+            lines.append(prometheus_sample("http_requests_total", count,
+                                           {"method": method, "route": route, "status": status_code}))
+    lines += [
+        "# HELP http_request_sql_statements SQL statements per HTTP request.",
+        "# TYPE http_request_sql_statements histogram",
+    ]
+    for (method, route), metrics in routes:
+        lines += prometheus_histogram("http_request_sql_statements", metrics.statements,
+                                      {"method": method, "route": route})
+    lines += [
+        "# HELP http_request_db_seconds Time spent in SQL statements per HTTP request.",
+        "# TYPE http_request_db_seconds histogram",
+    ]
+    for (method, route), metrics in routes:
+        lines += prometheus_histogram("http_request_db_seconds", metrics.db_time,
+                                      {"method": method, "route": route})
+
+    lines += [
+        "# HELP db_query_duration_seconds Latency of SQL statements.",
+        "# TYPE db_query_duration_seconds histogram",
+        *prometheus_histogram("db_query_duration_seconds", query_metrics.total),
+        "# HELP db_query_errors_total Failed SQL statements.",
+        "# TYPE db_query_errors_total counter",
+        prometheus_sample("db_query_errors_total", query_metrics.errors),
+    ]
+
+    pools = [("primary", engine.pool)]
+    if replica_engine is not None:
+        pools.append(("replica", replica_engine.pool))
+    pools = [(database, pool) for database, pool in pools if isinstance(pool, TimedQueuePool)]
+    for name, help_text in (("size", "Connections kept by the pool."),
+                            ("checked_out", "Connections in use."),
+                            ("overflow", "Connections above the pool size.")):
+        lines += [f"# HELP db_pool_{name} {help_text}", f"# TYPE db_pool_{name} gauge"]
+        for database, pool in pools:
+            lines.append(prometheus_sample(f"db_pool_{name}", pool_status(pool)[name], {"database": database}))
+    lines += [
+        "# HELP db_pool_wait_seconds Time spent waiting for a pooled connection.",
+        "# TYPE db_pool_wait_seconds histogram",
+    ]
+    for database, pool in pools:
+        lines += prometheus_histogram("db_pool_wait_seconds", pool.metrics.wait, {"database": database})
+    lines += ["# HELP db_pool_timeouts_total Connection requests timed out.",
+              "# TYPE db_pool_timeouts_total counter"]
+    for database, pool in pools:
+        lines.append(prometheus_sample("db_pool_timeouts_total", pool.metrics.timeouts, {"database": database}))
+    return "\n".join(lines) + "\n"
+
+
+@prometheus_router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def prometheus_metrics():
+    """
+    **Exposes metrics of requests, SQL statements and connection pools in Prometheus text format**
+    """
+    return PlainTextResponse(_prometheus_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,227 @@
+"""
+HTTP response cache for anonymous read-mostly endpoints.
+
+`ResponseCacheMiddleware` stores successful GET responses keyed on path and
+query string under the current catalog version. Any change of the catalog
+calls `response_cache.invalidate()`, which bumps the version, so earlier
+entries are never served again and age out of the backend.
+
+Responses carry `ETag` (set by the handler, otherwise derived from the
+version and the key) and, with a backend that knows the time of the last
+catalog change, `Last-Modified`; conditional requests with a matching
+`If-None-Match`/`If-Modified-Since` get `304 Not Modified` without touching
+the database.
+
+The default backend lives in the memory of the worker: changes made by
+other workers are only seen after `RESPONSE_CACHE_TTL` seconds. Its version
+also rolls over every `RESPONSE_CACHE_TTL` seconds, so ETags it issued stop
+matching by then, and it sends no `Last-Modified`, which a worker that
+didn't see a change would keep confirming. Plug a shared backend
+(e.g. Redis) by subclassing `CacheBackend`.
+"""
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional, Sequence, Tuple
+
+from app.core.app_config import settings
+
+# (status, headers, body) of a stored response
+CachedResponse = Tuple[int, list, bytes]
+
+
+class CacheBackend:
+    """Storage of cached responses and of the catalog version"""
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        raise NotImplementedError
+
+    async def set(self, key: str, response: CachedResponse, ttl: float):
+        raise NotImplementedError
+
+    async def get_version(self) -> Tuple[str, Optional[datetime]]:
+        """Returns current version and time of the last change, None if it is not known to all workers"""
+        raise NotImplementedError
+
+    async def bump_version(self):
+        raise NotImplementedError
+
+    async def clear(self):
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """LRU cache in the memory of the worker"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # Versions of different workers must never collide in ETags
+        self._instance = uuid.uuid4().hex[:8]
+        self._version = 0
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        response, deadline = entry
+        if deadline <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return response
+
+    async def set(self, key, response, ttl):
+        self._entries[key] = (response, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get_version(self):
+        # Changes of other workers are unknown here, the period bounds how long they go unnoticed
+        period = int(time.time() // self.ttl) if self.ttl > 0 else 0
+        return f"{self._instance}.{self._version}.{period}", None
+
+    async def bump_version(self):
+        self._version += 1
+
+    async def clear(self):
+        self._entries.clear()
+
+
+class ResponseCache:
+    """Cache of responses with hit/miss counters"""
+
+    def __init__(self, backend: CacheBackend, ttl: float, enabled: bool = True):
+        self.backend = backend
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    async def invalidate(self):
+        """Marks every cached response as outdated, call after a change of the catalog"""
+        await self.backend.bump_version()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+        }
+
+
+response_cache = ResponseCache(
+    backend=MemoryBackend(max_size=settings.RESPONSE_CACHE_SIZE, ttl=settings.RESPONSE_CACHE_TTL),
+    ttl=settings.RESPONSE_CACHE_TTL,
+    enabled=settings.RESPONSE_CACHE_ENABLED,
+)
+
+
+def _is_not_modified(request_headers: dict, etag: str, modified: Optional[datetime]) -> bool:
+    if_none_match = request_headers.get(b"if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.decode("latin-1").split(",")]
+        return etag in tags or "*" in tags
+    if_modified_since = request_headers.get(b"if-modified-since")
+    if if_modified_since is not None and modified is not None:
+        try:
+            return modified <= parsedate_to_datetime(if_modified_since.decode("latin-1"))
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _etag_of(headers: list) -> Optional[str]:
+    for name, value in headers:
+        if name.lower() == b"etag":
+            return value.decode("latin-1")
+    return None
+
+
+class ResponseCacheMiddleware:
+    """ASGI middleware serving GET requests of the given path prefixes from the cache"""
+
+    def __init__(self, app, cache: ResponseCache, paths: Sequence[str], exclude: Sequence[str] = ()):
+        self.app = app
+        self.cache = cache
+        self.paths = tuple(paths)
+        self.exclude = tuple(exclude)
+
+    def _is_cacheable(self, scope) -> bool:
+        return (self.cache.enabled
+                and scope["type"] == "http"
+                and scope["method"] == "GET"
+                and scope["path"].startswith(self.paths)
+                and not scope["path"].startswith(self.exclude))
+
+    async def _send_not_modified(self, send, headers: list):
+        self.cache.not_modified += 1
+        await send({"type": "http.response.start", "status": 304, "headers": headers})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def __call__(self, scope, receive, send):
+        if not self._is_cacheable(scope):
+            await self.app(scope, receive, send)
+            return
+
+        query = "&".join(sorted(scope["query_string"].decode("latin-1").split("&")))
+        version, modified = await self.cache.backend.get_version()
+        key = f"{version}:{scope['path']}?{query}"
+        etag = f'W/"{version}-{zlib.crc32(key.encode()):08x}"'
+        validators = [(b"cache-control", b"no-cache")]
+        if modified is not None:
+            validators.append((b"last-modified", format_datetime(modified, usegmt=True).encode()))
+        request_headers = dict(scope["headers"])
+
+        if _is_not_modified(request_headers, etag, modified):
+            await self._send_not_modified(send, [(b"etag", etag.encode())] + validators)
+            return
+
+        cached = await self.cache.backend.get(key)
+        if cached is not None:
+            self.cache.hits += 1
+            status, headers, body = cached
+            own_etag = _etag_of(headers)
+            if own_etag is None:
+                headers = headers + [(b"etag", etag.encode())]
+            elif _is_not_modified(request_headers, own_etag, modified):
+                await self._send_not_modified(send, [(b"etag", own_etag.encode())] + validators)
+                return
+            await send({"type": "http.response.start", "status": status,
+                        "headers": headers + validators + [(b"x-cache", b"HIT")]})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        self.cache.misses += 1
+        start = {}
+        body = []
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+                return
+            body.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            status = start["status"]
+            # An ETag set by the handler (e.g. the version of a sweet) is kept
+            headers = [(name, value) for name, value in start.get("headers", [])
+                       if name.lower() not in (b"last-modified", b"cache-control")]
+            content = b"".join(body)
+            if status == 200:
+                await self.cache.backend.set(key, (status, headers, content), self.cache.ttl)
+                if _etag_of(headers) is None:
+                    headers = headers + [(b"etag", etag.encode())]
+                headers = headers + validators
+            await send({"type": "http.response.start", "status": status,
+                        "headers": headers + [(b"x-cache", b"MISS")]})
+            await send({"type": "http.response.body", "body": content})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,236 @@
+"""
+In-process metrics of the database layer.
+
+`QueryMetrics` times every SQL statement through engine events and keeps a
+`Histogram` per statement fingerprint (the statement with bind parameter
+lists collapsed), `TimedQueuePool` measures how long requests wait for a
+pooled connection. Both are read by the `/api/service/metrics/db` endpoint
+and rendered in Prometheus text format on `/metrics`.
+
+Statements are also added to the `RequestStats` of the current request, if
+`ProfilingMiddleware` (`app.core.profiling`) set one.
+"""
+import bisect
+import re
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Sequence
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# Upper bounds of histogram buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Distinct statements with their own histogram, the rest is counted as "other"
+MAX_FINGERPRINTS = 200
+
+_PARAMETER_LIST_RE = re.compile(r"\((?:\s*(?:\?|%s|\$\d+|%\(\w+\)s|:\w+)(?:::\w+)?\s*,?)+\)")
+_REPEATED_ROWS_RE = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+_SPACES_RE = re.compile(r"\s+")
+
+
+class RequestStats:
+    """SQL statements and database time of the current request"""
+
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+
+
+# Set by `ProfilingMiddleware` for the duration of a request
+current_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("current_request_stats", default=None)
+
+
+class Histogram:
+    """Histogram of observed values with fixed buckets"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimates a quantile as the upper bound of the bucket it falls in.
+
+        Returns: Bucket bound, infinity for the overflow bucket, None without observations.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        buckets["+Inf"] = self.count
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": buckets,
+        }
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    values = ",".join('{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                      for name, value in labels.items())
+    return "{" + values + "}"
+
+
+def prometheus_histogram(name: str, histogram: Histogram, labels: dict = None) -> list:
+    """
+    Renders a histogram in Prometheus text format, without HELP and TYPE lines.
+
+    Returns: List of lines.
+    """
+    labels = labels or {}
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{_format_labels({**labels, 'le': bound})} {cumulative}")
+    lines.append(f"{name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {histogram.count}")
+    lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+    return lines
+
+
+def prometheus_sample(name: str, value, labels: dict = None) -> str:
+    """
+    Returns: Line of a counter or gauge in Prometheus text format.
+    """
+    return f"{name}{_format_labels(labels or {})} {value}"
+
+
+def fingerprint(statement: str) -> str:
+    """
+    Normalizes a statement: collapses bind parameter lists and rows of multi-row INSERTs.
+
+    Returns: Statement fingerprint.
+    """
+    statement = _SPACES_RE.sub(" ", statement).strip()
+    statement = _PARAMETER_LIST_RE.sub("(...)", statement)
+    return _REPEATED_ROWS_RE.sub("(...)", statement)
+
+
+class QueryMetrics:
+    """Timing histograms of SQL statements executed by engines"""
+
+    def __init__(self, max_fingerprints: int = MAX_FINGERPRINTS):
+        self.max_fingerprints = max_fingerprints
+        self.total = Histogram()
+        self.statements: Dict[str, Histogram] = {}
+        self.errors = 0
+
+    def attach(self, engine):
+        engine = engine.sync_engine if hasattr(engine, "sync_engine") else engine
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine, "after_cursor_execute", self._after_execute)
+        event.listen(engine, "handle_error", self._on_error)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_started
+        self.total.observe(elapsed)
+        key = fingerprint(statement)
+        histogram = self.statements.get(key)
+        if histogram is None:
+            if len(self.statements) >= self.max_fingerprints:
+                key = "other"
+            histogram = self.statements.setdefault(key, Histogram())
+        histogram.observe(elapsed)
+        stats = current_request_stats.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.db_time += elapsed
+
+    def _on_error(self, context):
+        self.errors += 1
+
+    def reset(self):
+        self.__init__(self.max_fingerprints)
+
+    def snapshot(self, top: int = 20) -> dict:
+        """
+        Returns: Overall histogram and histograms of statements with the largest total time.
+        """
+        slowest = sorted(self.statements.items(), key=lambda item: item[1].sum, reverse=True)[:top]
+        return {
+            "total": self.total.snapshot(),
+            "errors": self.errors,
+            "statements": [{"statement": key, **histogram.snapshot()} for key, histogram in slowest],
+        }
+
+
+class PoolMetrics:
+    """Waits for connections of `TimedQueuePool`"""
+
+    def __init__(self):
+        self.wait = Histogram()
+        self.timeouts = 0
+
+
+query_metrics = QueryMetrics()
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool of async engines recording time spent waiting for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def recreate(self):
+        # Engines recreate the pool on dispose, the metrics carry over
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        finally:
+            self.metrics.wait.observe(time.perf_counter() - started)
+
+
+def pool_status(pool) -> dict:
+    """
+    Returns: Current state of a pool, sizes are only known for queue pools.
+    """
+    status = {"class": type(pool).__name__}
+    if hasattr(pool, "checkedout"):
+        status.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+        )
+    if isinstance(pool, TimedQueuePool):
+        status.update(wait=pool.metrics.wait.snapshot(), timeouts=pool.metrics.timeouts)
+    return status
@@ -0,0 +1,37 @@
+"""
+Opaque cursors for keyset pagination.
+
+A cursor is the urlsafe base64 of a JSON object holding the sort key of the
+last returned row, so the client can't depend on its content and the server
+can change it without breaking the API.
+"""
+import base64
+import json
+
+
+def encode_cursor(payload: dict) -> str:
+    """
+    Encodes sort key values into an opaque cursor.
+
+    Returns: Cursor string.
+    """
+    raw = json.dumps(payload, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """
+    Decodes an opaque cursor.
+
+    Returns: Dictionary with sort key values.
+
+    Raises: ValueError: If the cursor is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+    except (ValueError, TypeError) as exc:
+        raise ValueError("Malformed cursor") from exc
+    if not isinstance(payload, dict):
+        raise ValueError("Malformed cursor")
+    return payload
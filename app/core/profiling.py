@@ -0,0 +1,154 @@
+"""
+Request-level profiling, enabled by `PROFILING_ENABLED`.
+
+`ProfilingMiddleware` records for every route (path template, e.g.
+`/api/sweets/{sweet_id}`) a latency histogram, the number of SQL statements
+and the database time per request. Statements are counted through the
+engine events of `app.core.metrics`.
+
+A `PROFILING_SAMPLE_RATE` share of requests runs under cProfile; profiles of
+requests slower than `PROFILING_SLOW_REQUEST` seconds are kept in memory.
+cProfile sees the whole event loop thread, so a profile also contains work
+of requests served concurrently.
+"""
+import cProfile
+import io
+import pstats
+import random
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Tuple
+
+from starlette.routing import Match
+
+from app.core.app_config import settings
+from app.core.metrics import Histogram, RequestStats, current_request_stats
+
+# Buckets of SQL statements per request
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Lines of pstats output kept per profile
+PROFILE_LINES = 40
+
+
+class RouteMetrics:
+    """Latency, SQL statements and database time of requests of one route"""
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.statements = Histogram(STATEMENT_BUCKETS)
+        self.db_time = Histogram()
+        # status code -> number of responses
+        self.responses: Dict[int, int] = {}
+
+    def observe(self, status_code: int, latency: float, stats: RequestStats):
+        self.latency.observe(latency)
+        self.statements.observe(stats.statements)
+        self.db_time.observe(stats.db_time)
+        self.responses[status_code] = self.responses.get(status_code, 0) + 1
+
+
+class RequestProfiler:
+    """Per-route metrics and sampled profiles of slow requests"""
+
+    def __init__(self, enabled: bool, sample_rate: float, slow_request: float, keep: int):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.slow_request = slow_request
+        # (method, route) -> metrics
+        self.routes: Dict[Tuple[str, str], RouteMetrics] = {}
+        self.profiles = deque(maxlen=keep)
+        self._profiling = False
+
+    def route_metrics(self, method: str, route: str) -> RouteMetrics:
+        metrics = self.routes.get((method, route))
+        if metrics is None:
+            metrics = self.routes[(method, route)] = RouteMetrics()
+        return metrics
+
+    def start_profile(self):
+        # One profiler at a time: cProfile hooks the whole thread
+        if self._profiling or not self.sample_rate or random.random() >= self.sample_rate:
+            return None
+        self._profiling = True
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def finish_profile(self, profile, method: str, route: str, latency: float, stats: RequestStats):
+        profile.disable()
+        self._profiling = False
+        if latency < self.slow_request:
+            return
+        output = io.StringIO()
+        pstats.Stats(profile, stream=output).sort_stats("cumulative").print_stats(PROFILE_LINES)
+        self.profiles.append({
+            "method": method,
+            "route": route,
+            "latency": latency,
+            "statements": stats.statements,
+            "db_time": stats.db_time,
+            "recorded_at": datetime.now(timezone.utc),
+            "profile": output.getvalue(),
+        })
+
+    def reset(self):
+        self.routes.clear()
+        self.profiles.clear()
+
+
+request_profiler = RequestProfiler(
+    enabled=settings.PROFILING_ENABLED,
+    sample_rate=settings.PROFILING_SAMPLE_RATE,
+    slow_request=settings.PROFILING_SLOW_REQUEST,
+    keep=settings.PROFILING_KEEP,
+)
+
+
+def _route_of(scope) -> str:
+    # FastAPI leaves the matched route in the scope, responses served by
+    # middlewares (e.g. the response cache) never reach the router
+    route = scope.get("route")
+    if route is None:
+        for candidate in getattr(scope.get("app"), "routes", ()):
+            match, _ = candidate.matches(scope)
+            if match == Match.FULL:
+                route = candidate
+                break
+    return getattr(route, "path", None) or "unmatched"
+
+
+class ProfilingMiddleware:
+    """ASGI middleware recording metrics of HTTP requests in `RequestProfiler`"""
+
+    def __init__(self, app, profiler: RequestProfiler = request_profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if not self.profiler.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        profile = self.profiler.start_profile()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            latency = time.perf_counter() - started
+            current_request_stats.reset(token)
+            route = _route_of(scope)
+            if profile is not None:
+                self.profiler.finish_profile(profile, scope["method"], route, latency, stats)
+            self.profiler.route_metrics(scope["method"], route).observe(status_code, latency, stats)
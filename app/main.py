@@ -1,15 +1,21 @@
 
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
 from sqladmin import Admin
 from app.core.admin_auth import authentication_backend, AdminAuth
 from app.core.app_config import settings
-from app.core.db_config import init_db, engine
+from app.core.db_config import init_db, engine, async_session
+from app.core.endpoints import service_router, prometheus_router
+from app.core.http_cache import ResponseCacheMiddleware, response_cache
+from app.core.profiling import ProfilingMiddleware
 
 from app.users import admin as users_admin
 from app.users.endpoints import auth_router
+from app.users.security import HasherOverloaded
+from app.users.sweeper import token_sweeper
 
-from app.sweets import admin as sweets_admin
+from app.sweets import admin as sweets_admin, cards, search, db_manager as sweets_db_manager
 from app.sweets.endpoints import user_sweets, sweets, admin_only
 
 # Main app
@@ -21,6 +27,17 @@ app = FastAPI(
     docs_url="/",
 )
 
+# Cache of anonymous catalog reads, invalidated by changes of sweets
+app.add_middleware(
+    ResponseCacheMiddleware,
+    cache=response_cache,
+    paths=["/api/sweets", "/api/catalog", "/api/search", "/api/filter_by_price"],
+    exclude=["/api/sweets/export"],
+)
+
+# Per-route latency and SQL accounting (PROFILING_ENABLED), outermost to see cached responses too
+app.add_middleware(ProfilingMiddleware)
+
 # Admin panel (SQLAdmin)
 admin = Admin(app, engine, authentication_backend=authentication_backend)
 
@@ -38,11 +55,33 @@ app.include_router(auth_router, prefix="/api", tags=["Authentication"])
 app.include_router(user_sweets, prefix="/api/profile", tags=["Profile"])
 app.include_router(sweets, prefix="/api", tags=["Sweets"])
 app.include_router(admin_only, prefix="/api", tags=["Admin Only"])
+app.include_router(service_router, prefix="/api/service", tags=["Service"])
+app.include_router(prometheus_router)
+
+
+@app.exception_handler(HasherOverloaded)
+async def hasher_overloaded_handler(request: Request, exc: HasherOverloaded):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "1"},
+    )
 
 
 @app.on_event("startup")
-def on_startup():
-    init_db()
+async def on_startup():
+    await init_db()
+    async with async_session() as session:
+        await search.index_missing_sweets(session)
+        await cards.refresh_missing_cards(session)
+        await sweets_db_manager.load_taxonomy(session)
+        await sweets_db_manager.load_sweet_features(session)
+    token_sweeper.start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await token_sweeper.stop()
 
 
 if __name__ == "__main__":
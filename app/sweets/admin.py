@@ -1,5 +1,10 @@
+from datetime import datetime
+from typing import Dict, List
+
 from sqladmin import ModelView
 
+from app.core.db_config import async_session
+from app.sweets import db_manager
 from app.sweets.models import Sweet, Category, SweetCategory, Ingredient, SweetIngredient
 
 
@@ -14,27 +19,103 @@ class SweetAdmin(ModelView, model=Sweet):
                    Sweet.edited_at,
                    Sweet.categories,
                    Sweet.ingredients,]
+    # Set on every change, as updates through the API do
+    form_excluded_columns = [Sweet.version,
+                             Sweet.edited_at,]
 
     async def insert_model(self, request, data):
         data["user_id"] = request.session["user_id"]
         return await super().insert_model(request, data)
 
+    async def on_model_change(self, data, model, is_created):
+        if not is_created:
+            # Incremented in SQL, an update through the API in between is not lost.
+            # `If-Match` of clients holding the previous ETag fails afterwards
+            model.version = Sweet.version + 1
+            model.edited_at = datetime.utcnow()
+
+    # Search documents and cards are maintained by db_manager, changes made here are passed to it
+
+    async def after_model_change(self, data, model, is_created):
+        async with async_session() as session:
+            await db_manager.refresh_sweets([model.id], session)
+
+    async def on_model_delete(self, model):
+        async with async_session() as session:
+            await db_manager.forget_sweets([model.id], session)
+
 
 class CategoryAdmin(ModelView, model=Category):
     column_list = [Category.id,
                    Category.title,]
+    # Sweets linked to a deleted entity, from on_model_delete to after_model_delete
+    _linked_sweets: Dict[int, List[int]] = {}
+
+    async def after_model_change(self, data, model, is_created):
+        db_manager.taxonomy_changed(Category, model.id, model.title)
+        if not is_created:
+            async with async_session() as session:
+                await db_manager.refresh_sweets_linked_to(Category, model.id, session)
+
+    async def on_model_delete(self, model):
+        # Links are deleted with the category, sweets they linked are refreshed afterwards
+        async with async_session() as session:
+            self._linked_sweets[model.id] = await db_manager.get_sweets_linked_to(Category, model.id, session)
+
+    async def after_model_delete(self, model):
+        db_manager.taxonomy_changed(Category, model.id, None)
+        sweet_ids = self._linked_sweets.pop(model.id, [])
+        if sweet_ids:
+            async with async_session() as session:
+                await db_manager.refresh_sweets(sweet_ids, session)
 
 
 class SweetCategoryAdmin(ModelView, model=SweetCategory):
     column_list = [SweetCategory.sweet_id,
                    SweetCategory.category_id]
 
+    async def after_model_change(self, data, model, is_created):
+        async with async_session() as session:
+            await db_manager.refresh_sweets([model.sweet_id], session)
+
+    async def after_model_delete(self, model):
+        async with async_session() as session:
+            await db_manager.refresh_sweets([model.sweet_id], session)
+
 
 class IngredientAdmin(ModelView, model=Ingredient):
     column_list = [Ingredient.id,
                    Ingredient.title]
+    # Sweets linked to a deleted entity, from on_model_delete to after_model_delete
+    _linked_sweets: Dict[int, List[int]] = {}
+
+    async def after_model_change(self, data, model, is_created):
+        db_manager.taxonomy_changed(Ingredient, model.id, model.title)
+        if not is_created:
+            async with async_session() as session:
+                await db_manager.refresh_sweets_linked_to(Ingredient, model.id, session)
+
+    async def on_model_delete(self, model):
+        # Links are deleted with the ingredient, sweets they linked are refreshed afterwards
+        async with async_session() as session:
+            self._linked_sweets[model.id] = await db_manager.get_sweets_linked_to(Ingredient, model.id, session)
+
+    async def after_model_delete(self, model):
+        db_manager.taxonomy_changed(Ingredient, model.id, None)
+        sweet_ids = self._linked_sweets.pop(model.id, [])
+        if sweet_ids:
+            async with async_session() as session:
+                await db_manager.refresh_sweets(sweet_ids, session)
 
 
 class SweetIngredientAdmin(ModelView, model=SweetIngredient):
     column_list = [SweetIngredient.sweet_id,
                    SweetIngredient.ingredient_id]
+
+    async def after_model_change(self, data, model, is_created):
+        async with async_session() as session:
+            await db_manager.refresh_sweets([model.sweet_id], session)
+
+    async def after_model_delete(self, model):
+        async with async_session() as session:
+            await db_manager.refresh_sweets([model.sweet_id], session)
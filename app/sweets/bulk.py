@@ -0,0 +1,183 @@
+"""
+Bulk import and export of sweets in NDJSON and CSV.
+
+Uploads are parsed while the request body streams in and written in
+chunks of `settings.BULK_CHUNK_SIZE` rows, one transaction per chunk.
+Exports walk the catalog with keyset pagination in batches, so neither
+direction keeps the whole catalog in memory.
+
+CSV files have a header with columns of `SweetImport`; categories and
+ingredients cells hold titles separated by semicolons.
+"""
+import codecs
+import csv
+import io
+import json
+from typing import AsyncIterator, List, Literal, Tuple
+
+from pydantic import ValidationError
+
+from app.core.app_config import settings
+from app.core.db_config import read_session
+from app.sweets import db_manager
+from app.sweets.schemas import SweetImport, SweetImportError, SweetImportResult
+
+BulkFormat = Literal["ndjson", "csv"]
+
+CSV_COLUMNS = ["title", "description", "price", "in_stock", "categories", "ingredients"]
+
+# Rejected rows reported back to the client, the rest is only counted
+MAX_REPORTED_ERRORS = 100
+
+
+async def _read_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    tail = ""
+    async for chunk in stream:
+        lines = (tail + decoder.decode(chunk)).split("\n")
+        tail = lines.pop()
+        for line in lines:
+            yield line
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+async def _parse_ndjson(stream: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, object]]:
+    line_number = 0
+    async for line in _read_lines(stream):
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as exc:
+            yield line_number, exc
+
+
+async def _parse_csv(stream: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, object]]:
+    header = None
+    record: List[str] = []
+    line_number = 0
+    record_line = 0
+    async for line in _read_lines(stream):
+        line_number += 1
+        if not record:
+            record_line = line_number
+        record.append(line)
+        # A quoted cell spans several lines until its quotes are balanced
+        if sum(part.count('"') for part in record) % 2:
+            continue
+        text, record = "\n".join(record), []
+        if not text.strip():
+            continue
+        values = next(csv.reader(io.StringIO(text)))
+        if header is None:
+            header = [column.strip() for column in values]
+            continue
+        if len(values) != len(header):
+            yield record_line, ValueError(f"Expected {len(header)} columns, got {len(values)}")
+            continue
+        yield record_line, {column: value for column, value in zip(header, values) if value != ""}
+    if record:
+        yield record_line, ValueError("Unterminated quoted cell")
+
+
+async def import_sweets(stream: AsyncIterator[bytes], fmt: BulkFormat, session, user,
+                        chunk_size: int = None) -> SweetImportResult:
+    """
+    Imports sweets from a streamed NDJSON or CSV body.
+
+    Args:
+     - stream: Async iterator over chunks of the request body.
+     - fmt (str): "ndjson" or "csv".
+     - session (AsyncSession): SQLAlchemy database session.
+     - user: User object, owner of imported sweets.
+     - chunk_size (int): Rows per transaction. Defaults to `settings.BULK_CHUNK_SIZE`.
+
+    Returns: SweetImportResult with counts of imported and rejected rows.
+    """
+    chunk_size = chunk_size or settings.BULK_CHUNK_SIZE
+    parser = _parse_ndjson if fmt == "ndjson" else _parse_csv
+    result = SweetImportResult(imported=0, rejected=0, errors=[])
+    chunk: List[SweetImport] = []
+
+    def reject(line_number, error):
+        result.rejected += 1
+        if len(result.errors) < MAX_REPORTED_ERRORS:
+            result.errors.append(SweetImportError(line=line_number, error=str(error)))
+
+    async def flush():
+        sweet_ids = await db_manager.bulk_create_sweets(chunk, session, user)
+        result.imported += len(sweet_ids)
+        chunk.clear()
+        # Imported rows are not needed anymore, keep the identity map small
+        session.expunge_all()
+
+    async for line_number, item in parser(stream):
+        if isinstance(item, Exception):
+            reject(line_number, item)
+            continue
+        try:
+            chunk.append(SweetImport.parse_obj(item))
+        except ValidationError as exc:
+            reject(line_number, "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}"
+                                          for error in exc.errors()))
+            continue
+        if len(chunk) >= chunk_size:
+            await flush()
+    if chunk:
+        await flush()
+    return result
+
+
+def _export_row(sweet) -> dict:
+    return {
+        "id": sweet.id,
+        "user_id": sweet.user_id,
+        "title": sweet.title,
+        "description": sweet.description,
+        "price": sweet.price,
+        "in_stock": sweet.in_stock,
+        "categories": [category["title"] for category in sweet.categories],
+        "ingredients": [ingredient["title"] for ingredient in sweet.ingredients],
+    }
+
+
+async def export_sweets(fmt: BulkFormat, batch_size: int = None) -> AsyncIterator[str]:
+    """
+    Streams the whole catalog as NDJSON or CSV.
+
+    Uses its own read-only session, as the response outlives the request handler.
+
+    Args:
+     - fmt (str): "ndjson" or "csv".
+     - batch_size (int): Sweets loaded per query. Defaults to `settings.BULK_CHUNK_SIZE`.
+
+    Returns: Async iterator over chunks of the response body.
+    """
+    batch_size = batch_size or settings.BULK_CHUNK_SIZE
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=["id", "user_id", *CSV_COLUMNS])
+    if fmt == "csv":
+        writer.writeheader()
+
+    async with read_session() as session:
+        cursor = None
+        while True:
+            sweets, cursor = await db_manager.get_deserts_after(cursor, session, per_page=batch_size)
+            for sweet in sweets:
+                row = _export_row(sweet)
+                if fmt == "ndjson":
+                    buffer.write(json.dumps(row, ensure_ascii=False))
+                    buffer.write("\n")
+                else:
+                    row["categories"] = ";".join(row["categories"])
+                    row["ingredients"] = ";".join(row["ingredients"])
+                    writer.writerow(row)
+            session.expunge_all()
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            if cursor is None:
+                break
@@ -0,0 +1,128 @@
+"""
+In-process caches of the sweets catalog.
+
+Values here live in the memory of a single worker, so every cache is
+maintained by the `db_manager` functions that mutate the underlying rows
+and may be reset at any moment to be reloaded from the database.
+"""
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from app.core.app_config import settings
+
+
+class SweetsCounter:
+    """Total count of sweets maintained on create/delete"""
+
+    def __init__(self):
+        self.total: Optional[int] = None
+
+    def set(self, total: int):
+        self.total = total
+
+    def add(self, delta: int):
+        # Unknown total stays unknown until the next exact count
+        if self.total is not None:
+            self.total = max(self.total + delta, 0)
+
+    def reset(self):
+        self.total = None
+
+
+sweets_counter = SweetsCounter()
+
+
+class TaxonomyCache:
+    """
+    Titles of categories and ingredients and facet counts of sweets in them.
+
+    Titles are loaded at startup and kept up to date by changes made in this
+    worker; every change bumps `version`. A whole reload happens after `ttl`
+    seconds to pick up changes of other workers. Facets are cached per filter
+    for `facets_ttl` seconds and dropped on every change of the catalog.
+    """
+
+    def __init__(self, ttl: float, facets_size: int, facets_ttl: float):
+        self.ttl = ttl
+        self.facets_size = facets_size
+        self.facets_ttl = facets_ttl
+        self.version = 0
+        # Bumped by every change of titles or of the catalog, facets counted before it are dropped
+        self.facets_generation = 0
+        # Model name ("Category" or "Ingredient") -> ID -> title
+        self._titles: Dict[str, Dict[int, str]] = {}
+        self._loaded_at: Optional[float] = None
+        self._facets: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def load(self, titles: Dict[str, Dict[int, str]]):
+        changed = titles != self._titles
+        self._titles = titles
+        self._loaded_at = time.monotonic()
+        if changed:
+            self._changed()
+
+    def titles(self, model) -> Dict[int, str]:
+        return self._titles.get(model.__name__, {})
+
+    def add_titles(self, model, titles: Dict[int, str]):
+        known = self._titles.setdefault(model.__name__, {})
+        if any(known.get(entity_id) != title for entity_id, title in titles.items()):
+            known.update(titles)
+            self._changed()
+
+    def remove(self, model, entity_id: int):
+        self._titles.get(model.__name__, {}).pop(entity_id, None)
+        self._changed()
+
+    def get_facets(self, key: tuple) -> Optional[dict]:
+        entry = self._facets.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._facets.move_to_end(key)
+        return entry[0]
+
+    def set_facets(self, key: tuple, facets: dict, generation: int):
+        if generation != self.facets_generation:
+            # The catalog changed while the facets were counted
+            return
+        self._facets[key] = (facets, time.monotonic() + self.facets_ttl)
+        self._facets.move_to_end(key)
+        while len(self._facets) > self.facets_size:
+            self._facets.popitem(last=False)
+
+    def invalidate_facets(self):
+        self.facets_generation += 1
+        self._facets.clear()
+
+    def reset(self):
+        # Titles are reloaded from the database on the next access
+        self._loaded_at = None
+        self._changed()
+
+    def _changed(self):
+        self.version += 1
+        self.invalidate_facets()
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "loaded": self.loaded,
+            "categories": len(self._titles.get("Category", {})),
+            "ingredients": len(self._titles.get("Ingredient", {})),
+            "facets": len(self._facets),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+taxonomy_cache = TaxonomyCache(ttl=settings.TAXONOMY_CACHE_TTL, facets_size=settings.FACETS_CACHE_SIZE,
+                                facets_ttl=settings.FACETS_CACHE_TTL)
@@ -0,0 +1,113 @@
+"""
+Denormalized read model of sweets.
+
+Every sweet has a `SweetCard` with its columns and its categories and
+ingredients as JSON lists of `{"id", "title"}`, so public reads are single
+table index scans without joins to link tables. Cards are written by
+`refresh_cards`/`delete_cards`, which `db_manager` calls in the same
+transaction as the change of a sweet or its links, so reads never see a
+card older than the committed sweet.
+"""
+from typing import Iterable
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.sweets.models import Sweet, SweetCard, SweetCategory, Category, SweetIngredient, Ingredient
+
+# Cards per upsert statement, keeps bind parameters below limits of SQLite and PostgreSQL
+UPSERT_BATCH_SIZE = 1000
+
+CARD_COLUMNS = ("id", "user_id", "title", "description", "price", "in_stock", "created_at", "edited_at",
+                "version")
+
+# (card field, link model, linked model, link key)
+CARD_LINKS = (
+    ("categories", SweetCategory, Category, SweetCategory.category_id),
+    ("ingredients", SweetIngredient, Ingredient, SweetIngredient.ingredient_id),
+)
+
+
+async def refresh_cards(sweet_ids: Iterable[int], session: AsyncSession):
+    """
+    Builds cards of sweets from their rows and links, the caller commits the session.
+
+    Args:
+     - sweet_ids (list): IDs of the sweets.
+     - session (AsyncSession): SQLAlchemy database session.
+    """
+    sweet_ids = sorted(set(sweet_ids))
+    if not sweet_ids:
+        return
+
+    results = await session.execute(
+        select(*(getattr(Sweet, column) for column in CARD_COLUMNS)).where(Sweet.id.in_(sweet_ids))
+    )
+    rows = {row.id: {**row._mapping, "categories": [], "ingredients": []} for row in results}
+    if not rows:
+        return
+
+    for field, link, model, key in CARD_LINKS:
+        results = await session.execute(
+            select(link.sweet_id, model.id, model.title)
+            .join(model, model.id == key)
+            .where(link.sweet_id.in_(list(rows)))
+            .order_by(link.sweet_id, model.id)
+        )
+        for sweet_id, linked_id, title in results:
+            rows[sweet_id][field].append({"id": linked_id, "title": title})
+
+    insert = pg_insert if session.bind.dialect.name == "postgresql" else sqlite_insert
+    cards = list(rows.values())
+    for start in range(0, len(cards), UPSERT_BATCH_SIZE):
+        statement = insert(SweetCard).values(cards[start:start + UPSERT_BATCH_SIZE])
+        statement = statement.on_conflict_do_update(
+            index_elements=[SweetCard.id],
+            set_={column: statement.excluded[column]
+                  for column in (*CARD_COLUMNS[1:], "categories", "ingredients")},
+        )
+        await session.execute(statement)
+
+
+async def delete_cards(sweet_ids: Iterable[int], session: AsyncSession):
+    """
+    Removes cards of sweets, must run before the sweets are deleted.
+
+    Args:
+     - sweet_ids (list): IDs of the sweets.
+     - session (AsyncSession): SQLAlchemy database session.
+    """
+    await session.execute(delete(SweetCard).where(SweetCard.id.in_(list(sweet_ids))))
+
+
+async def refresh_missing_cards(session: AsyncSession, batch_size: int = 1000):
+    """
+    Builds cards of sweets without one, e.g. after a migration.
+
+    Args:
+     - session (AsyncSession): SQLAlchemy database session.
+     - batch_size (int): Number of sweets per statement.
+
+    Returns: Number of built cards.
+    """
+    refreshed = 0
+    last_id = 0
+    while True:
+        results = await session.exec(
+            select(Sweet.id)
+            .outerjoin(SweetCard, SweetCard.id == Sweet.id)
+            .where(SweetCard.id.is_(None), Sweet.id > last_id)
+            .order_by(Sweet.id)
+            .limit(batch_size)
+        )
+        sweet_ids = results.all()
+        if not sweet_ids:
+            break
+        await refresh_cards(sweet_ids, session)
+        await session.commit()
+        refreshed += len(sweet_ids)
+        last_id = sweet_ids[-1]
+    return refreshed
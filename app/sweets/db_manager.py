@@ -1,16 +1,61 @@
-from sqlmodel import Session, select
-
-from app.sweets.models import Sweet, Category, SweetCategory, Ingredient, SweetIngredient
-from app.sweets.schemas import SweetCreate, CategoryCreate, IngredientCreate
-
-
-def create_sweet(sweet: SweetCreate, session: Session, user):
+import asyncio
+from datetime import datetime
+from typing import Dict, Iterable, List, Literal, Optional
+
+from sqlalchemy import and_, delete, exists, insert, literal, text, tuple_, union_all, update
+from sqlalchemy.orm import selectinload
+from sqlmodel import select, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.http_cache import response_cache
+from app.core.pagination import encode_cursor, decode_cursor
+from app.sweets import cards, search
+from app.sweets.cache import sweets_counter, taxonomy_cache
+from app.sweets.features import sweet_features, MatchMode
+from app.sweets.models import Sweet, SweetCard, Category, SweetCategory, Ingredient, SweetIngredient
+from app.sweets.schemas import SweetCreate, CategoryCreate, IngredientCreate, SweetImport, CatalogFilter
+
+# Loads link tables of fetched sweets in one batched query per relationship,
+# public reads are served from `SweetCard` instead
+SWEET_RELATIONSHIPS = (
+    selectinload(Sweet.categories),
+    selectinload(Sweet.ingredients),
+)
+
+# Bind parameters per multi-row INSERT: asyncpg allows 32767, SQLite 32766 (since 3.32).
+# Rows per statement are derived from the number of columns of the table, columns
+# missing in rows are filled with their defaults and take parameters as well
+MAX_BIND_PARAMETERS = 32766
+
+# Sort keys of sweets listing, `SweetCard.id` is always appended as a tie-breaker
+SWEETS_ORDERING = {
+    "id": (),
+    "price": (SweetCard.price,),
+    "created_at": (SweetCard.created_at,),
+}
+
+# Sort keys of catalog query, "-" prefix sorts in descending order
+SweetsOrder = Literal["id", "-id", "price", "-price", "created_at", "-created_at"]
+
+
+def _sort_columns(order_by: str):
+    return (*SWEETS_ORDERING[order_by.lstrip("-")], SweetCard.id)
+
+
+def _order_clauses(order_by: str):
+    columns = _sort_columns(order_by)
+    if order_by.startswith("-"):
+        return [column.desc() for column in columns]
+    return list(columns)
+
+
+async def create_sweet(sweet: SweetCreate, session: AsyncSession, user):
     """
     Creates a new sweet.
 
     Args:
      - sweet (SweetCreate): Sweet creation data.
-     - session (Session): SQLAlchemy database session.
+     - session (AsyncSession): SQLAlchemy database session.
      - user: User object.
 
     Returns: Newly created sweet object.
@@ -20,136 +65,529 @@ def create_sweet(sweet: SweetCreate, session: Session, user):
         description=sweet.description,
         price=int(sweet.price),
         user_id=user[0].id,
-
+        categories=[],
+        ingredients=[],
     )
     session.add(new_sweet)
-    session.commit()
-    session.refresh(new_sweet)
+    await session.flush()
+    await _refresh_sweets([new_sweet.id], session)
+    await session.commit()
+    await _sweets_changed()
+    sweets_counter.add(1)
+    sweet_features.add_sweets([(new_sweet.id, new_sweet.price)])
 
     return new_sweet
 
 
-def get_my_sweets(session: Session, user):
+async def _refresh_sweets(sweet_ids: Iterable[int], session: AsyncSession):
+    # Search documents and cards follow every change of sweets or their links, in its transaction
+    sweet_ids = list(sweet_ids)
+    await search.index_sweets(sweet_ids, session)
+    await cards.refresh_cards(sweet_ids, session)
+
+
+async def _sweets_changed():
+    # Runs after every committed change of sweets or their links
+    taxonomy_cache.invalidate_facets()
+    await response_cache.invalidate()
+
+
+async def refresh_sweets(sweet_ids: Iterable[int], session: AsyncSession):
+    """
+    Rebuilds search documents and cards of sweets changed outside of db_manager,
+    e.g. in the admin panel, and commits them.
+
+    Args:
+     - sweet_ids (list): IDs of the sweets.
+     - session (AsyncSession): SQLAlchemy database session.
+    """
+    sweet_ids = list(sweet_ids)
+    await _refresh_sweets(sweet_ids, session)
+    await session.commit()
+    await _sweets_changed()
+    await _reload_sweet_features(sweet_ids, session)
+
+
+async def get_sweets_linked_to(model, entity_id: int, session: AsyncSession) -> List[int]:
+    """
+    Retrieves IDs of sweets linked to a category or ingredient.
+
+    Args:
+     - model: Category or Ingredient.
+     - entity_id (int): ID of the category or ingredient.
+     - session (AsyncSession): SQLAlchemy database session.
+
+    Returns: List of sweet IDs.
+    """
+    link, key = ((SweetCategory, SweetCategory.category_id) if model is Category
+                 else (SweetIngredient, SweetIngredient.ingredient_id))
+    results = await session.exec(select(link.sweet_id).where(key == entity_id))
+    return results.all()
+
+
+async def refresh_sweets_linked_to(model, entity_id: int, session: AsyncSession):
+    """
+    Rebuilds search documents and cards of sweets linked to a category or ingredient,
+    e.g. after its title changed.
+
+    Args:
+     - model: Category or Ingredient.
+     - entity_id (int): ID of the category or ingredient.
+     - session (AsyncSession): SQLAlchemy database session.
+    """
+    await refresh_sweets(await get_sweets_linked_to(model, entity_id, session), session)
+
+
+def taxonomy_changed(model, entity_id: int, title: Optional[str]):
+    """
+    Updates the taxonomy cache after a category or ingredient changed outside of db_manager.
+
+    Args:
+     - model: Category or Ingredient.
+     - entity_id (int): ID of the category or ingredient.
+     - title (str): New title, None if the entity was deleted.
+    """
+    if title is None:
+        taxonomy_cache.remove(model, entity_id)
+    else:
+        taxonomy_cache.add_titles(model, {entity_id: title})
+
+
+async def forget_sweets(sweet_ids: Iterable[int], session: AsyncSession):
+    """
+    Removes search documents and cards of sweets about to be deleted outside of db_manager.
+
+    Args:
+     - sweet_ids (list): IDs of the sweets.
+     - session (AsyncSession): SQLAlchemy database session.
+    """
+    sweet_ids = list(sweet_ids)
+    await search.unindex_sweets(sweet_ids, session)
+    await cards.delete_cards(sweet_ids, session)
+    await session.commit()
+    await _sweets_changed()
+    sweet_features.discard_sweets(sweet_ids)
+
+
+async def _insert_rows(model, rows: List[dict], session: AsyncSession):
+    batch_size = MAX_BIND_PARAMETERS // len(model.__table__.columns)
+    for start in range(0, len(rows), batch_size):
+        await session.execute(insert(model).values(rows[start:start + batch_size]))
+
+
+async def _get_or_create_titles(model, titles: Iterable[str], session: AsyncSession) -> Dict[str, int]:
+    """
+    Maps titles of categories or ingredients to IDs, creating missing ones.
+
+    Returns: Dictionary of title to ID.
+    """
+    titles = set(titles)
+    if not titles:
+        return {}
+
+    query = select(model.id, model.title).where(model.title.in_(titles)).order_by(model.id.desc())
+    results = await session.exec(query)
+    # The first created entity wins when titles are duplicated
+    ids = {title: entity_id for entity_id, title in results.all()}
+
+    missing = titles - ids.keys()
+    if missing:
+        await _insert_rows(model, [{"title": title} for title in missing], session)
+        query = select(model.id, model.title).where(model.title.in_(missing)).order_by(model.id.desc())
+        results = await session.exec(query)
+        ids.update({title: entity_id for entity_id, title in results.all()})
+    return ids
+
+
+async def bulk_create_sweets(sweets: List[SweetImport], session: AsyncSession, user):
+    """
+    Creates sweets with their categories and ingredients in one transaction.
+
+    Sweets and link rows are written with multi-row INSERTs, on PostgreSQL
+    IDs of new sweets are reserved from the sequence in one query.
+
+    Args:
+     - sweets (List[SweetImport]): Validated sweets.
+     - session (AsyncSession): SQLAlchemy database session.
+     - user: User object.
+
+    Returns: List of IDs of created sweets.
+    """
+    if not sweets:
+        return []
+
+    category_ids = await _get_or_create_titles(
+        Category, (title for sweet in sweets for title in sweet.categories), session)
+    ingredient_ids = await _get_or_create_titles(
+        Ingredient, (title for sweet in sweets for title in sweet.ingredients), session)
+
+    now = datetime.utcnow()
+    rows = [{
+        "title": sweet.title,
+        "description": sweet.description,
+        "price": sweet.price,
+        "in_stock": sweet.in_stock,
+        "created_at": now,
+        "edited_at": now,
+        "user_id": user[0].id,
+    } for sweet in sweets]
+
+    if session.bind.dialect.name == "postgresql":
+        query = text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :count)")
+        results = await session.execute(query, {"table": Sweet.__tablename__, "count": len(rows)})
+        sweet_ids = results.scalars().all()
+        for row, sweet_id in zip(rows, sweet_ids):
+            row["id"] = sweet_id
+        await _insert_rows(Sweet, rows, session)
+    else:
+        new_sweets = [Sweet(**row) for row in rows]
+        session.add_all(new_sweets)
+        await session.flush()
+        sweet_ids = [new_sweet.id for new_sweet in new_sweets]
+
+    sweet_categories = {(sweet_id, category_ids[title])
+                        for sweet_id, sweet in zip(sweet_ids, sweets) for title in sweet.categories}
+    sweet_ingredients = {(sweet_id, ingredient_ids[title])
+                         for sweet_id, sweet in zip(sweet_ids, sweets) for title in sweet.ingredients}
+    if sweet_categories:
+        await _insert_rows(SweetCategory, [{"sweet_id": sweet_id, "category_id": category_id}
+                                           for sweet_id, category_id in sweet_categories], session)
+    if sweet_ingredients:
+        await _insert_rows(SweetIngredient, [{"sweet_id": sweet_id, "ingredient_id": ingredient_id}
+                                             for sweet_id, ingredient_id in sweet_ingredients], session)
+
+    await _refresh_sweets(sweet_ids, session)
+    await session.commit()
+    taxonomy_cache.add_titles(Category, {category_id: title for title, category_id in category_ids.items()})
+    taxonomy_cache.add_titles(Ingredient, {ingredient_id: title for title, ingredient_id in ingredient_ids.items()})
+    await _sweets_changed()
+    sweets_counter.add(len(sweet_ids))
+    sweet_features.add_sweets(zip(sweet_ids, (row["price"] for row in rows)))
+    sweet_features.add_links(SweetCategory, sweet_categories)
+    sweet_features.add_links(SweetIngredient, sweet_ingredients)
+
+    return sweet_ids
+
+
+async def get_my_sweets(session: AsyncSession, user):
     """
     Retrieves a sweets of current user
 
     Args:
-     - session (Session): SQLAlchemy database session.
+     - session (AsyncSession): SQLAlchemy database session.
      - user: User object.
 
-    Returns: List of Sweets objects or None.
+    Returns: List of SweetCard objects.
     """
     user = user[0]
-    query = select(Sweet).where(Sweet.user_id == user.id)
-    result = session.exec(query)
+    query = select(SweetCard).where(SweetCard.user_id == user.id)
+    result = await session.exec(query)
     sweets = result.all()
-    print(sweets[0].categories)
-    print(sweets[0].ingredients)
     return sweets
 
 
-def get_sweet_by_id(sweet_id: int, session):
+async def get_sweet_by_id(sweet_id: int, session):
     """
     Retrieves a sweet by ID.
 
     Args:
      - sweet_id (int): ID of the sweet.
-     - session (Session): SQLAlchemy database session.
+     - session (AsyncSession): SQLAlchemy database session.
 
     Returns: Sweet object or None if not found.
     """
-    query = select(Sweet).where(Sweet.id == sweet_id)
-    result = session.exec(query)
+    query = select(Sweet).where(Sweet.id == sweet_id).options(*SWEET_RELATIONSHIPS)
+    result = await session.exec(query)
     sweet = result.one_or_none()
     return sweet
 
 
-def get_deserts(page: int, session):
+async def get_sweet_card(sweet_id: int, session):
+    """
+    Retrieves the card of a sweet by ID.
+
+    Args:
+     - sweet_id (int): ID of the sweet.
+     - session (AsyncSession): SQLAlchemy database session.
+
+    Returns: SweetCard object or None if not found.
+    """
+    query = select(SweetCard).where(SweetCard.id == sweet_id)
+    result = await session.exec(query)
+    return result.one_or_none()
+
+
+async def get_deserts(page: int, session,
+                      per_page: int = 10,
+                      order_by: str = "id"):
     """
     Retrieves a list of sweets with pagination.
 
     Args:
      - page (int): Page number.
-     - session (Session): SQLAlchemy database session.
+     - session (AsyncSession): SQLAlchemy database session.
+     - per_page (int): Number of sweets per page.
+     - order_by (str): Sort key, one of `SweetsOrder`.
 
-    Returns: List of Sweet objects.
+    Returns: List of SweetCard objects.
     """
-    max_per_page = 10
-    offset1 = (page - 1) * max_per_page
-    sweets = select(Sweet).offset(offset1).limit(max_per_page)
-    results = session.exec(sweets)
+    offset1 = (page - 1) * per_page
+    sweets = (select(SweetCard)
+              .order_by(*_order_clauses(order_by))
+              .offset(offset1)
+              .limit(per_page))
+    results = await session.exec(sweets)
     all_sweets = results.all()
     return all_sweets
 
 
-def get_deserts_count(session):
+def _cursor_value(column, value):
+    # Keys come from the client, values of a wrong type would reach the database
+    if column.key == "created_at":
+        try:
+            return datetime.fromisoformat(value)
+        except (TypeError, ValueError) as exc:
+            raise ValueError("Malformed cursor") from exc
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ValueError("Malformed cursor")
+    return value
+
+
+async def _get_page_after(query, cursor: Optional[str], session: AsyncSession,
+                          per_page: int, order_by: str):
+    columns = _sort_columns(order_by)
+    query = query.order_by(*_order_clauses(order_by)).limit(per_page + 1)
+
+    if cursor is not None:
+        payload = decode_cursor(cursor)
+        key = payload.get("key")
+        if payload.get("order_by") != order_by or not isinstance(key, list) or len(key) != len(columns):
+            raise ValueError("Cursor does not match the sort order")
+        key = [_cursor_value(column, value) for column, value in zip(columns, key)]
+        if order_by.startswith("-"):
+            query = query.where(tuple_(*columns) < tuple_(*key))
+        else:
+            query = query.where(tuple_(*columns) > tuple_(*key))
+
+    results = await session.exec(query)
+    sweets = results.all()
+
+    next_cursor = None
+    if len(sweets) > per_page:
+        sweets = sweets[:per_page]
+        next_cursor = get_sweets_cursor(sweets[-1], order_by)
+    return sweets, next_cursor
+
+
+async def get_deserts_after(cursor: Optional[str], session: AsyncSession,
+                            per_page: int = 10,
+                            order_by: str = "id"):
+    """
+    Retrieves a list of sweets with keyset pagination.
+
+    Rows are selected by `WHERE (sort key, id) > cursor ORDER BY sort key, id`,
+    so the cost of a page doesn't depend on how deep it is.
+
+    Args:
+     - cursor (str, optional): Cursor of the previous page, None for the first page.
+     - session (AsyncSession): SQLAlchemy database session.
+     - per_page (int): Number of sweets per page.
+     - order_by (str): Sort key, one of `SweetsOrder`.
+
+    Returns: Tuple of list of SweetCard objects and cursor of the next page (None on the last page).
+
+    Raises: ValueError: If the cursor is malformed or was issued for another sort key.
+    """
+    query = select(SweetCard)
+    return await _get_page_after(query, cursor, session, per_page, order_by)
+
+
+async def get_catalog_page(filters: CatalogFilter, cursor: Optional[str], session: AsyncSession,
+                           per_page: int = 10,
+                           order_by: str = "id"):
+    """
+    Retrieves a page of sweets matching catalog filters with keyset pagination.
+
+    All filters are combined in the WHERE clause of one statement over sweet
+    cards: price and stock are served by `(in_stock, price, id)`, links by
+    EXISTS subqueries on primary keys of link tables, the text query by the
+    search index.
+
+    Args:
+     - filters (CatalogFilter): Filters of the query:
+        - min_price, max_price - price range, bounds included;
+        - in_stock - availability;
+        - user_id - owner of sweets;
+        - category_ids - sweets in any of the categories;
+        - ingredient_ids - sweets having all of the ingredients;
+        - exclude_ingredient_ids - sweets having none of the ingredients;
+        - query - text matched as in `search_sweets`.
+     - cursor (str, optional): Cursor of the previous page, None for the first page.
+     - session (AsyncSession): SQLAlchemy database session.
+     - per_page (int): Number of sweets per page.
+     - order_by (str): Sort key, one of `SweetsOrder`.
+
+    Returns: Tuple of list of SweetCard objects and cursor of the next page (None on the last page).
+
+    Raises: ValueError: If the cursor is malformed or was issued for another sort key.
+    """
+    conditions = []
+    if filters.in_stock is not None:
+        conditions.append(SweetCard.in_stock == filters.in_stock)
+    if filters.min_price is not None:
+        conditions.append(SweetCard.price >= filters.min_price)
+    if filters.max_price is not None:
+        conditions.append(SweetCard.price <= filters.max_price)
+    if filters.user_id is not None:
+        conditions.append(SweetCard.user_id == filters.user_id)
+    if filters.category_ids:
+        conditions.append(exists().where(SweetCategory.sweet_id == SweetCard.id,
+                                         SweetCategory.category_id.in_(filters.category_ids)))
+    for ingredient_id in set(filters.ingredient_ids):
+        conditions.append(exists().where(SweetIngredient.sweet_id == SweetCard.id,
+                                         SweetIngredient.ingredient_id == ingredient_id))
+    if filters.exclude_ingredient_ids:
+        conditions.append(~exists().where(SweetIngredient.sweet_id == SweetCard.id,
+                                          SweetIngredient.ingredient_id.in_(filters.exclude_ingredient_ids)))
+    if filters.query and search.tokenize(filters.query):
+        conditions.append(await search.search_condition(filters.query, session))
+
+    query = select(SweetCard)
+    if conditions:
+        query = query.where(*conditions)
+    return await _get_page_after(query, cursor, session, per_page, order_by)
+
+
+def get_sweets_cursor(sweet: Sweet, order_by: str = "id"):
+    """
+    Builds a keyset pagination cursor pointing after the sweet.
+
+    Args:
+     - sweet (SweetCard): Last sweet of the page.
+     - order_by (str): Sort key, one of `SweetsOrder`.
+
+    Returns: Cursor string.
+    """
+    return encode_cursor({
+        "order_by": order_by,
+        "key": [getattr(sweet, column.key) for column in _sort_columns(order_by)],
+    })
+
+
+async def get_deserts_count(session: AsyncSession,
+                            mode: Literal["exact", "cached", "estimated"] = "cached"):
     """
     Retrieves the count of sweets.
 
     Args:
-     - session (Session): SQLAlchemy database session.
+     - session (AsyncSession): SQLAlchemy database session.
+     - mode (str): How to count sweets:
+        - "exact" - COUNT(*) on the database side, a scan of the whole table;
+        - "cached" (default) - in-process total maintained on create/delete,
+          loaded with an exact count on first use;
+        - "estimated" - planner statistics of PostgreSQL (`pg_class.reltuples`),
+          falls back to an exact count on other databases or unanalyzed table.
 
     Returns: Count of sweets.
     """
-    sweets = select(Sweet)
-    results = session.exec(sweets)
-    sweets_result = results.all()
-    sweets_count = len(sweets_result)
+    if mode == "cached" and sweets_counter.total is not None:
+        return sweets_counter.total
+
+    if mode == "estimated" and session.bind.dialect.name == "postgresql":
+        query = text("SELECT reltuples::bigint FROM pg_class WHERE relname = :table")
+        results = await session.execute(query, {"table": Sweet.__tablename__})
+        estimate = results.scalar_one_or_none()
+        if estimate is not None and estimate >= 0:
+            return estimate
+
+    query = select(func.count()).select_from(Sweet)
+    results = await session.exec(query)
+    sweets_count = results.one()
+    sweets_counter.set(sweets_count)
     return sweets_count
 
 
-def update_sweet(sweet_id: int, payload: SweetCreate, session):
+async def update_sweet(sweet_id: int, changes: dict, session, user_id: int,
+                       expected_version: Optional[int] = None):
     """
-    Deletes a sweet.
+    Updates a sweet of a user with one conditional statement.
+
+    The sweet is changed only if it belongs to the user and, with `expected_version`,
+    only if it was not updated since that version, so concurrent updates are not lost.
+    Every update increments the version of the sweet and sets `edited_at`.
 
     Args:
      - sweet_id (int): ID of the sweet.
-     - session (Session): SQLAlchemy database session.
+     - changes (dict): New values of columns, any of title, description, price and in_stock.
+     - session (AsyncSession): SQLAlchemy database session.
+     - user_id (int): ID of the owner of the sweet.
+     - expected_version (int, optional): Version of the sweet the changes are based on.
 
-    Returns: Deleted sweet object.
+    Returns: Updated SweetCard object or None if no sweet matched the conditions.
     """
-    statement = select(Sweet).where(Sweet.id == sweet_id)
-    results = session.exec(statement)
-    sweet = results.one()
-
-    # Update
-    sweet.title = payload.title
-    sweet.description = payload.description
-    sweet.price = payload.price
-    session.add(sweet)
-    session.commit()
-    session.refresh(sweet)
+    conditions = [Sweet.id == sweet_id, Sweet.user_id == user_id]
+    if expected_version is not None:
+        conditions.append(Sweet.version == expected_version)
+    edited_at = datetime.utcnow()
+    result = await session.execute(
+        update(Sweet).where(*conditions).values(**changes, version=Sweet.version + 1, edited_at=edited_at)
+    )
+    if result.rowcount == 0:
+        return None
+
+    # Links are unchanged, so the card takes the new values instead of a rebuild
+    result = await session.execute(
+        update(SweetCard).where(SweetCard.id == sweet_id).values(
+            **changes, edited_at=edited_at,
+            version=select(Sweet.version).where(Sweet.id == sweet_id).scalar_subquery(),
+        )
+    )
+    if result.rowcount == 0:
+        await cards.refresh_cards([sweet_id], session)
+    if "title" in changes or "description" in changes:
+        await search.index_sweets([sweet_id], session)
+    results = await session.exec(select(SweetCard).where(SweetCard.id == sweet_id))
+    card = results.one()
+    await session.commit()
+    await _sweets_changed()
+    if "price" in changes:
+        sweet_features.add_sweets([(card.id, card.price)])
 
-    return sweet
+    return card
 
 
-def delete_sweet(sweet_id: int, session):
+async def delete_sweet(sweet_id: int, session):
     """
     Deletes a sweet.
 
     Args:
      - sweet_id (int): ID of the sweet.
-     - session (Session): SQLAlchemy database session.
+     - session (AsyncSession): SQLAlchemy database session.
 
     Returns: Deleted sweet object.
     """
-    query = select(Sweet).where(Sweet.id == sweet_id)
-    results = session.exec(query)
+    query = select(Sweet).where(Sweet.id == sweet_id).options(*SWEET_RELATIONSHIPS)
+    results = await session.exec(query)
     sweet = results.one()
 
-    session.delete(sweet)
-    session.commit()
+    await search.unindex_sweets([sweet.id], session)
+    await cards.delete_cards([sweet.id], session)
+    await session.delete(sweet)
+    await session.commit()
+    await _sweets_changed()
+    sweets_counter.add(-1)
+    sweet_features.discard_sweets([sweet_id])
 
     return sweet
 
 
-def create_category(category: CategoryCreate, session):
+async def create_category(category: CategoryCreate, session):
     """
     Creates a new category of sweets.
 
     Args:
      - category (CategoryCreate): category creation data.
-     - session (Session): SQLAlchemy database session.
+     - session (AsyncSession): SQLAlchemy database session.
      - user: User object.
 
     Returns: Newly created category object.
@@ -158,36 +596,35 @@ def create_category(category: CategoryCreate, session):
         title=category.title
     )
     session.add(new_category)
-    session.commit()
-    session.refresh(new_category)
+    await session.commit()
+    await session.refresh(new_category)
+    taxonomy_cache.add_titles(Category, {new_category.id: new_category.title})
 
     return new_category
 
 
-def get_category_by_id(category_id: int, session):
+async def get_category_by_id(category_id: int, session):
     """
-    Retrieves a category by ID.
+    Retrieves a category by ID from the taxonomy cache.
 
     Args:
      - category_id (int): ID of the category.
-     - session (Session): SQLAlchemy database session.
+     - session (AsyncSession): SQLAlchemy database session.
 
-    Returns: Category object or None if not found.
+    Returns: Detached Category object or None if not found.
     """
-    query = select(Category).where(Category.id == category_id)
-    result = session.exec(query)
-    category = result.one_or_none()
-    return category
+    title = (await get_titles(Category, [category_id], session)).get(category_id)
+    return None if title is None else Category(id=category_id, title=title)
 
 
-def add_category_of_sweet(sweet_id: int, category_id: int, session):
+async def add_category_of_sweet(sweet_id: int, category_id: int, session):
     """
     Adds a category to a sweet.
 
     Args:
     - sweet_id (int): ID of the sweet.
     - category_id (int): ID of the category.
-    - session (Session): SQLAlchemy database session.
+    - session (AsyncSession): SQLAlchemy database session.
 
     Returns: Newly created SweetCategory object.
     """
@@ -196,37 +633,47 @@ def add_category_of_sweet(sweet_id: int, category_id: int, session):
         category_id=category_id
     )
     session.add(new_sweet_category)
-    session.commit()
-    session.refresh(new_sweet_category)
+    await session.flush()
+    await _refresh_sweets([sweet_id], session)
+    await session.commit()
+    await _sweets_changed()
+    sweet_features.add_links(SweetCategory, [(sweet_id, category_id)])
+    await session.refresh(new_sweet_category)
     return new_sweet_category
 
 
-def remove_category_of_sweet(sweet_id: int, category_id: int, session):
+async def remove_category_of_sweet(sweet_id: int, category_id: int, session):
     """
     Removes a category from a sweet.
 
     Args:
      - sweet_id (int): ID of the sweet.
      - category_id (int): ID of the category.
-     - session (Session): SQLAlchemy database session.
+     - session (AsyncSession): SQLAlchemy database session.
 
-    Returns: Removed SweetCategory object.
+    Returns: Removed SweetCategory object or None if the sweet has no such category.
     """
     query = select(SweetCategory).where(SweetCategory.sweet_id == sweet_id, SweetCategory.category_id == category_id)
-    results = session.exec(query)
-    sweet_category = results.one()
-    session.delete(sweet_category)
-    session.commit()
+    results = await session.exec(query)
+    sweet_category = results.one_or_none()
+    if sweet_category is None:
+        return None
+    await session.delete(sweet_category)
+    await session.flush()
+    await _refresh_sweets([sweet_id], session)
+    await session.commit()
+    await _sweets_changed()
+    sweet_features.remove_links(SweetCategory, [(sweet_id, category_id)])
     return sweet_category
 
 
-def create_ingredient(ingredient: IngredientCreate, session):
+async def create_ingredient(ingredient: IngredientCreate, session):
     """
     Creates a new ingredient of sweets.
 
     Args:
      - ingredient (IngredientCreate): ingredient payload data.
-     - session (Session): SQLAlchemy database session.
+     - session (AsyncSession): SQLAlchemy database session.
      - user: User object.
 
     Returns: Newly created ingredient object.
@@ -235,38 +682,35 @@ def create_ingredient(ingredient: IngredientCreate, session):
         title=ingredient.title
     )
     session.add(new_ingredient)
-    session.commit()
-    session.refresh(new_ingredient)
+    await session.commit()
+    await session.refresh(new_ingredient)
+    taxonomy_cache.add_titles(Ingredient, {new_ingredient.id: new_ingredient.title})
 
     return new_ingredient
 
 
-def get_ingredient_by_id(ingredient_id: int, session):
+async def get_ingredient_by_id(ingredient_id: int, session):
     """
-    Retrieves a ingredient by ID.
+    Retrieves a ingredient by ID from the taxonomy cache.
 
     Args:
      - ingredient_id (int): ID of the ingredient.
-     - session (Session): SQLAlchemy database session.
+     - session (AsyncSession): SQLAlchemy database session.
 
-    Returns: Ingredient object or None if not found.
+    Returns: Detached Ingredient object or None if not found.
     """
-    print(ingredient_id)
-    query = select(Ingredient).where(Ingredient.id == ingredient_id)
-    result = session.exec(query)
-    ingredient = result.one_or_none()
-    print(ingredient)
-    return ingredient
+    title = (await get_titles(Ingredient, [ingredient_id], session)).get(ingredient_id)
+    return None if title is None else Ingredient(id=ingredient_id, title=title)
 
 
-def add_ingredient_to_sweet(sweet_id: int, ingredient_id: int, session):
+async def add_ingredient_to_sweet(sweet_id: int, ingredient_id: int, session):
     """
     Adds a ingredient to a sweet.
 
     Args:
     - sweet_id (int): ID of the sweet.
     - ingredient_id (int): ID of the ingredient.
-    - session (Session): SQLAlchemy database session.
+    - session (AsyncSession): SQLAlchemy database session.
 
     Returns: Newly created SweetIngredient object.
     """
@@ -275,64 +719,430 @@ def add_ingredient_to_sweet(sweet_id: int, ingredient_id: int, session):
         ingredient_id=ingredient_id
     )
     session.add(new_sweet_ingredient)
-    session.commit()
-    session.refresh(new_sweet_ingredient)
+    await session.flush()
+    await _refresh_sweets([sweet_id], session)
+    await session.commit()
+    await _sweets_changed()
+    sweet_features.add_links(SweetIngredient, [(sweet_id, ingredient_id)])
+    await session.refresh(new_sweet_ingredient)
     return new_sweet_ingredient
 
 
-def remove_ingredient_of_sweet(sweet_id: int, ingredient_id: int, session):
+async def remove_ingredient_of_sweet(sweet_id: int, ingredient_id: int, session):
     """
     Removes a ingredient from a sweet.
 
     Args:
      - sweet_id (int): ID of the sweet.
      - ingredient_id (int): ID of the ingredient.
-     - session (Session): SQLAlchemy database session.
+     - session (AsyncSession): SQLAlchemy database session.
 
-    Returns: Removed SweetIngredient object.
+    Returns: Removed SweetIngredient object or None if the sweet has no such ingredient.
     """
     query = select(SweetIngredient).where(SweetIngredient.sweet_id == sweet_id,
                                           SweetIngredient.ingredient_id == ingredient_id)
-    results = session.exec(query)
-    sweet_ingredient = results.one()
-    session.delete(sweet_ingredient)
-    session.commit()
+    results = await session.exec(query)
+    sweet_ingredient = results.one_or_none()
+    if sweet_ingredient is None:
+        return None
+    await session.delete(sweet_ingredient)
+    await session.flush()
+    await _refresh_sweets([sweet_id], session)
+    await session.commit()
+    await _sweets_changed()
+    sweet_features.remove_links(SweetIngredient, [(sweet_id, ingredient_id)])
     return sweet_ingredient
 
 
-def search_sweets(search_query: str, session: Session):
+async def get_sweets_owners(sweet_ids: Iterable[int], session: AsyncSession) -> Dict[int, int]:
+    """
+    Retrieves owners of sweets.
+
+    Args:
+     - sweet_ids (list): IDs of the sweets.
+     - session (AsyncSession): SQLAlchemy database session.
+
+    Returns: Dictionary of sweet ID to user ID, missing sweets are absent.
+    """
+    query = select(Sweet.id, Sweet.user_id).where(Sweet.id.in_(set(sweet_ids)))
+    results = await session.exec(query)
+    return dict(results.all())
+
+
+async def get_existing_ids(model, ids: Iterable[int], session: AsyncSession) -> set:
+    """
+    Filters IDs of categories or ingredients which exist, see `get_titles`.
+
+    Args:
+     - model: Category or Ingredient.
+     - ids (list): IDs to check.
+     - session (AsyncSession): SQLAlchemy database session.
+
+    Returns: Set of existing IDs.
+    """
+    return set(await get_titles(model, ids, session))
+
+
+async def load_taxonomy(session: AsyncSession):
+    """
+    Loads titles of all categories and ingredients into the taxonomy cache in one query.
+
+    Args:
+     - session (AsyncSession): SQLAlchemy database session.
+    """
+    query = union_all(
+        select(literal(Category.__name__), Category.id, Category.title),
+        select(literal(Ingredient.__name__), Ingredient.id, Ingredient.title),
+    )
+    results = await session.execute(query)
+    titles = {Category.__name__: {}, Ingredient.__name__: {}}
+    for model_name, entity_id, title in results.all():
+        titles[model_name][entity_id] = title
+    taxonomy_cache.load(titles)
+
+
+async def get_titles(model, ids: Iterable[int], session: AsyncSession) -> Dict[int, str]:
+    """
+    Retrieves titles of categories or ingredients from the taxonomy cache.
+
+    IDs missing in the cache are looked up in the database, they may have
+    been created by another worker.
+
+    Args:
+     - model: Category or Ingredient.
+     - ids (list): IDs of categories or ingredients.
+     - session (AsyncSession): SQLAlchemy database session.
+
+    Returns: Dictionary of ID to title, missing entities are absent.
+    """
+    if not taxonomy_cache.loaded:
+        await load_taxonomy(session)
+    known = taxonomy_cache.titles(model)
+    ids = set(ids)
+    titles = {entity_id: known[entity_id] for entity_id in ids if entity_id in known}
+    missing = ids - titles.keys()
+    if missing:
+        results = await session.exec(select(model.id, model.title).where(model.id.in_(missing)))
+        found = dict(results.all())
+        if found:
+            taxonomy_cache.add_titles(model, found)
+            titles.update(found)
+    return titles
+
+
+def _count_facets(model, link_model, key, filters: CatalogFilter):
+    # Entities without matching sweets are counted as 0
+    conditions = [SweetCard.id == link_model.sweet_id]
+    if filters.min_price is not None:
+        conditions.append(SweetCard.price >= filters.min_price)
+    if filters.max_price is not None:
+        conditions.append(SweetCard.price <= filters.max_price)
+    if filters.in_stock is not None:
+        conditions.append(SweetCard.in_stock == filters.in_stock)
+    return (select(literal(model.__name__).label("facet"), model.id, model.title,
+                   func.count(SweetCard.id).label("count"))
+            .select_from(model)
+            .outerjoin(link_model, key == model.id)
+            .outerjoin(SweetCard, and_(*conditions))
+            .group_by(model.id, model.title))
+
+
+async def get_facets(filters: CatalogFilter, session: AsyncSession) -> dict:
+    """
+    Counts sweets in every category and ingredient, cached until the catalog changes.
+
+    Args:
+     - filters (CatalogFilter): Price range and availability of counted sweets,
+       other filters are ignored.
+     - session (AsyncSession): SQLAlchemy database session.
+
+    Returns: Dictionary containing taxonomy version and lists of categories
+    and ingredients with their sweet counts, largest first.
+    """
+    key = (filters.min_price, filters.max_price, filters.in_stock)
+    facets = taxonomy_cache.get_facets(key)
+    if facets is not None:
+        return facets
+
+    generation = taxonomy_cache.facets_generation
+    query = union_all(
+        _count_facets(Category, SweetCategory, SweetCategory.category_id, filters),
+        _count_facets(Ingredient, SweetIngredient, SweetIngredient.ingredient_id, filters),
+    )
+    results = await session.execute(query)
+    facets = {"version": taxonomy_cache.version, "categories": [], "ingredients": []}
+    for model_name, entity_id, title, count in results.all():
+        name = "categories" if model_name == Category.__name__ else "ingredients"
+        facets[name].append({"id": entity_id, "title": title, "count": count})
+    for name in ("categories", "ingredients"):
+        facets[name].sort(key=lambda facet: (-facet["count"], facet["id"]))
+    taxonomy_cache.set_facets(key, facets, generation)
+    return facets
+
+
+async def _add_links(link_model, key, links: Iterable[tuple], session: AsyncSession):
+    links = set(links)
+    sweet_ids = {sweet_id for sweet_id, _ in links}
+    query = select(link_model.sweet_id, key).where(link_model.sweet_id.in_(sweet_ids))
+    results = await session.exec(query)
+    new_links = sorted(links - set(results.all()))
+    if not new_links:
+        # Nothing changed, cached pages and facets stay valid
+        await session.commit()
+        return new_links
+    await _insert_rows(link_model, [{"sweet_id": sweet_id, key.key: linked_id}
+                                    for sweet_id, linked_id in new_links], session)
+    await _refresh_sweets({sweet_id for sweet_id, _ in new_links}, session)
+    await session.commit()
+    await _sweets_changed()
+    sweet_features.add_links(link_model, new_links)
+    return new_links
+
+
+async def _set_links(link_model, key, sweet_id: int, ids: Iterable[int], session: AsyncSession):
+    ids = set(ids)
+    query = select(key).where(link_model.sweet_id == sweet_id)
+    results = await session.exec(query)
+    current = set(results.all())
+    added, removed = sorted(ids - current), sorted(current - ids)
+    if not added and not removed:
+        # Nothing changed, cached pages and facets stay valid
+        await session.commit()
+        return added, removed
+    if removed:
+        await session.execute(delete(link_model).where(link_model.sweet_id == sweet_id, key.in_(removed)))
+    if added:
+        await _insert_rows(link_model, [{"sweet_id": sweet_id, key.key: linked_id} for linked_id in added],
+                           session)
+    await _refresh_sweets([sweet_id], session)
+    await session.commit()
+    await _sweets_changed()
+    sweet_features.set_links(link_model, sweet_id, ids)
+    return added, removed
+
+
+async def add_categories_of_sweets(links: Iterable[tuple], session: AsyncSession):
+    """
+    Adds categories to sweets, links which already exist are skipped.
+
+    Args:
+     - links (list): Pairs of (sweet_id, category_id).
+     - session (AsyncSession): SQLAlchemy database session.
+
+    Returns: List of created (sweet_id, category_id) pairs.
+    """
+    return await _add_links(SweetCategory, SweetCategory.category_id, links, session)
+
+
+async def set_categories_of_sweet(sweet_id: int, category_ids: Iterable[int], session: AsyncSession):
+    """
+    Replaces categories of a sweet with the given set in one transaction.
+
+    Args:
+     - sweet_id (int): ID of the sweet.
+     - category_ids (list): IDs of all categories the sweet must have.
+     - session (AsyncSession): SQLAlchemy database session.
+
+    Returns: Tuple of lists of added and removed category IDs.
+    """
+    return await _set_links(SweetCategory, SweetCategory.category_id, sweet_id, category_ids, session)
+
+
+async def add_ingredients_to_sweets(links: Iterable[tuple], session: AsyncSession):
+    """
+    Adds ingredients to sweets, links which already exist are skipped.
+
+    Args:
+     - links (list): Pairs of (sweet_id, ingredient_id).
+     - session (AsyncSession): SQLAlchemy database session.
+
+    Returns: List of created (sweet_id, ingredient_id) pairs.
+    """
+    return await _add_links(SweetIngredient, SweetIngredient.ingredient_id, links, session)
+
+
+async def set_ingredients_of_sweet(sweet_id: int, ingredient_ids: Iterable[int], session: AsyncSession):
+    """
+    Replaces ingredients of a sweet with the given set in one transaction.
+
+    Args:
+     - sweet_id (int): ID of the sweet.
+     - ingredient_ids (list): IDs of all ingredients the sweet must have.
+     - session (AsyncSession): SQLAlchemy database session.
+
+    Returns: Tuple of lists of added and removed ingredient IDs.
+    """
+    return await _set_links(SweetIngredient, SweetIngredient.ingredient_id, sweet_id, ingredient_ids, session)
+
+
+def _link_key(link_model):
+    return SweetCategory.category_id if link_model is SweetCategory else SweetIngredient.ingredient_id
+
+
+_sweet_features_lock = asyncio.Lock()
+
+
+async def load_sweet_features(session: AsyncSession):
+    """
+    Builds the in-memory index of sweets from the database, one query per table.
+
+    Args:
+     - session (AsyncSession): SQLAlchemy database session.
+    """
+    sweet_features.begin_build()
+    try:
+        # Core rows of the connection, ORM loading of every row costs more than the build
+        conn = await session.connection()
+        results = await conn.execute(select(Sweet.id, Sweet.price))
+        sweets = results.all()
+        links = {}
+        for link_model in sweet_features.link_models:
+            results = await conn.execute(select(link_model.sweet_id, _link_key(link_model)))
+            links[link_model.__name__] = results.all()
+    except BaseException:
+        sweet_features.cancel_build()
+        raise
+    sweet_features.build(sweets, links)
+
+
+async def _get_sweet_features(session: AsyncSession):
+    # Concurrent requests wait for one build instead of running their own
+    if not sweet_features.ready:
+        async with _sweet_features_lock:
+            if not sweet_features.ready:
+                await load_sweet_features(session)
+    return sweet_features
+
+
+async def _reload_sweet_features(sweet_ids: List[int], session: AsyncSession) -> List[int]:
+    # Sweets changed outside of db_manager or by another worker are read again from their cards
+    results = await session.execute(
+        select(SweetCard.id, SweetCard.price, SweetCard.categories, SweetCard.ingredients)
+        .where(SweetCard.id.in_(sweet_ids))
+    )
+    found = []
+    for card in results.all():
+        sweet_features.add_sweets([(card.id, card.price)])
+        for field, link_model, _, _ in cards.CARD_LINKS:
+            sweet_features.set_links(link_model, card.id, [linked["id"] for linked in getattr(card, field)])
+        found.append(card.id)
+    sweet_features.discard_sweets(set(sweet_ids) - set(found))
+    return found
+
+
+async def get_similar_sweets(sweet_id: int, session: AsyncSession, limit: int = 10) -> Optional[List[dict]]:
+    """
+    Finds sweets similar to a sweet by its ingredients, categories and price,
+    see `SweetFeatures.similar`.
+
+    Args:
+     - sweet_id (int): ID of the sweet.
+     - session (AsyncSession): SQLAlchemy database session.
+     - limit (int): Number of sweets to return.
+
+    Returns: List of dictionaries of SweetCard object and its similarity, most similar first,
+    or None if the sweet is not found.
+    """
+    features = await _get_sweet_features(session)
+    similar = features.similar(sweet_id, limit=limit)
+    if similar is None:
+        # Possibly created by another worker after the last build
+        if not await _reload_sweet_features([sweet_id], session):
+            return None
+        similar = features.similar(sweet_id, limit=limit)
+    if not similar:
+        return []
+    results = await session.exec(select(SweetCard).where(SweetCard.id.in_([similar_id for similar_id, _ in similar])))
+    sweets = {sweet.id: sweet for sweet in results.all()}
+    return [{"sweet": sweets[similar_id], "similarity": similarity}
+            for similar_id, similarity in similar if similar_id in sweets]
+
+
+async def match_ingredients(ingredient_ids: Iterable[int], exclude_ids: Iterable[int], session: AsyncSession,
+                            mode: MatchMode = "subset", page: int = 1, per_page: int = 10) -> List[dict]:
+    """
+    Finds sweets which can be made with the given ingredients, see `SweetFeatures.match_links`.
+
+    Args:
+     - ingredient_ids (list): IDs of available ingredients.
+     - exclude_ids (list): IDs of ingredients sweets must not have, e.g. allergens.
+     - session (AsyncSession): SQLAlchemy database session.
+     - mode (str): "subset" for sweets made only of available ingredients,
+       "overlap" for sweets having any of them.
+     - page (int): Page number.
+     - per_page (int): Number of sweets per page.
+
+    Returns: List of dictionaries of SweetCard object with counts of matched and missing ingredients,
+    most matched and least missing first.
+    """
+    features = await _get_sweet_features(session)
+    matches = features.match_links(SweetIngredient, ingredient_ids, exclude_ids, mode=mode,
+                                   offset=(page - 1) * per_page, limit=per_page)
+    if not matches:
+        return []
+    results = await session.exec(select(SweetCard).where(SweetCard.id.in_([sweet_id for sweet_id, _, _ in matches])))
+    sweets = {sweet.id: sweet for sweet in results.all()}
+    # Sweets deleted by another worker may still be in the index
+    return [{"sweet": sweets[sweet_id], "matched": matched, "missing": missing}
+            for sweet_id, matched, missing in matches if sweet_id in sweets]
+
+
+async def get_price_stats(min_price: Optional[int], max_price: Optional[int], session: AsyncSession,
+                          buckets: int = 10) -> dict:
+    """
+    Computes statistics of prices of sweets from the in-memory index, see `SortedPrices.stats`.
+
+    Args:
+     - min_price, max_price (int, optional): Price range, bounds included.
+     - session (AsyncSession): SQLAlchemy database session, used only to build the index.
+     - buckets (int): Maximum number of histogram buckets.
+
+    Returns: Dictionary containing count, min, max and median prices and histogram buckets.
+    """
+    features = await _get_sweet_features(session)
+    return features.sorted_prices.stats(min_price, max_price, buckets)
+
+
+async def search_sweets(search_query: str, session: AsyncSession,
+                        page: int = 1,
+                        per_page: int = 10):
     """
     Searches for sweets based on a search query.
 
+    Matches titles, descriptions and titles of categories and ingredients,
+    see `app.sweets.search`.
+
     Args:
      - search_query (str): Search query string.
-     - session (Session): SQLAlchemy database session.
+     - session (AsyncSession): SQLAlchemy database session.
+     - page (int): Page number.
+     - per_page (int): Number of sweets per page.
 
-    Returns: List of Sweet objects matching the search query.
+    Returns: List of SweetCard objects matching the search query, most relevant first.
     """
-    query = select(Sweet).where(Sweet.title.ilike('%' + search_query + '%'))
-    results = session.exec(query)
-    sweet = results.all()
-
-    return sweet
+    sweets = await search.search_sweets(search_query, session,
+                                        offset=(page - 1) * per_page,
+                                        limit=per_page)
+    return sweets
 
 
-def filter_sweets(min_price: int,
+async def filter_sweets(min_price: int,
                   max_price: int,
-                  session: Session):
+                  session: AsyncSession):
     """
     Filters sweets based on price range.
 
     Args:
      - min_price (int): Minimum price value.
      - max_price (int): Maximum price value.
-     - session (Session): SQLAlchemy database session.
+     - session (AsyncSession): SQLAlchemy database session.
 
-    Returns: List of Sweet objects within the specified price range.
+    Returns: List of SweetCard objects within the specified price range.
     """
 
-    query = select(Sweet).where(Sweet.price >= min_price, Sweet.price <= max_price)
-    results = session.exec(query)
+    query = (select(SweetCard)
+             .where(SweetCard.price >= min_price, SweetCard.price <= max_price))
+    results = await session.exec(query)
     sweets = results.all()
 
     return sweets
@@ -1,15 +1,19 @@
-from typing import Optional, List
-from urllib.request import Request
+from typing import Optional, List, Literal
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 
-from app.core.db_config import get_session
+from app.core.app_config import settings
+from app.core.db_config import get_session, get_read_session
 from app.users.models import User
-from app.sweets.schemas import SweetCreate, SweetResponse, CategoryCreate, CategoryResponse, SweetCategoryResponse, \
-    IngredientResponse, SweetIngredientResponse, IngredientCreate
-from app.sweets import db_manager
+from app.sweets.schemas import SweetCreate, SweetUpdate, SweetResponse, CategoryCreate, CategoryResponse, SweetCategoryResponse, \
+    IngredientResponse, SweetIngredientResponse, IngredientCreate, SweetsPage, SweetImportResult, \
+    SweetCategoryCreate, SweetIngredientCreate, SweetLinksDiff, CatalogFilter, CatalogPage, FacetsResponse, \
+    SweetMatch, SimilarSweet, PriceStats
+from app.sweets import bulk, db_manager
+from app.sweets.models import Category, Ingredient
 from app.core.dependencies import get_current_user
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 user_sweets = APIRouter()
 sweets = APIRouter()
@@ -17,8 +21,8 @@ admin_only = APIRouter()
 
 
 @user_sweets.post("/sweets", response_model=SweetResponse, status_code=201)
-def create_my_sweet(sweet_schema: SweetCreate,
-                    session: Session = Depends(get_session),
+async def create_my_sweet(sweet_schema: SweetCreate,
+                    session: AsyncSession = Depends(get_session),
                     current_user: User = Depends(get_current_user)):
     """
     **Creates a new sweet**
@@ -29,13 +33,35 @@ def create_my_sweet(sweet_schema: SweetCreate,
 
     Returns: Newly created sweet object.
     """
-    new_sweet = db_manager.create_sweet(sweet_schema, session, current_user)
+    new_sweet = await db_manager.create_sweet(sweet_schema, session, current_user)
     return new_sweet
 
 
+@user_sweets.post("/sweets/import", response_model=SweetImportResult)
+async def import_my_sweets(request: Request,
+                           fmt: bulk.BulkFormat = Query("ndjson", alias="format"),
+                           session: AsyncSession = Depends(get_session),
+                           current_user: User = Depends(get_current_user)):
+    """
+    **Imports sweets from a NDJSON or CSV upload**
+
+    The body is read as a stream and stored in chunks, one transaction per chunk.
+    Each row holds a sweet with titles of its categories and ingredients,
+    missing categories and ingredients are created.
+
+    Args:
+     - format (str, optional): "ndjson" or "csv". Defaults to "ndjson".
+     - current_user (User): Current authenticated user.
+
+    Returns: Numbers of imported and rejected rows with reasons of rejection.
+    """
+    result = await bulk.import_sweets(request.stream(), fmt, session, current_user)
+    return result
+
+
 @user_sweets.get("/my_sweets", response_model=List[SweetResponse])
-def get_my_sweets(
-        session: Session = Depends(get_session),
+async def get_my_sweets(
+        session: AsyncSession = Depends(get_session),
         current_user: User = Depends(get_current_user)
 ):
     """
@@ -47,43 +73,124 @@ def get_my_sweets(
     Returns: List of Sweet objects matching the current user.
 
     """
-    sweets_of_user = db_manager.get_my_sweets(session, current_user)
+    sweets_of_user = await db_manager.get_my_sweets(session, current_user)
     return sweets_of_user
 
 
+def sweet_etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """
+    Reads the sweet version of an `If-Match` header.
+
+    Returns: Version or None if the header is missing or "*".
+
+    Raises: HTTPException: If the header is not an ETag of a sweet version.
+    """
+    if if_match is None or if_match.strip() == "*":
+        return None
+    tag = if_match.strip().removeprefix("W/")
+    if len(tag) > 2 and tag[0] == tag[-1] == '"' and tag[1:-1].isdigit():
+        return int(tag[1:-1])
+    raise HTTPException(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        detail="If-Match must be an ETag of the sweet",
+    )
+
+
+async def apply_sweet_update(sweet_id: int, changes: dict, if_match: Optional[str], response: Response,
+                             session: AsyncSession, current_user):
+    """
+    Updates a sweet of the current user if it still has the version of `If-Match`.
+
+    Returns: Updated sweet object, its ETag is set on the response.
+
+    Raises: HTTPException: If the sweet does not exist, belongs to another user or has another version.
+    """
+    expected_version = parse_if_match(if_match)
+    sweet = await db_manager.update_sweet(sweet_id, changes, session,
+                                          user_id=current_user[0].id, expected_version=expected_version)
+    if sweet is None:
+        # Nothing was updated, the current sweet tells why
+        sweet = await db_manager.get_sweet_card(sweet_id, session)
+        if sweet is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Sweet {sweet_id} not exist",
+            )
+        if sweet.user_id != current_user[0].id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="You don't have access to modify this sweet",
+            )
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail=f"Sweet {sweet_id} was modified, its current version is {sweet.version}",
+            headers={"ETag": sweet_etag(sweet.version)},
+        )
+
+    response.headers["ETag"] = sweet_etag(sweet.version)
+    return sweet
+
+
 @user_sweets.put("/sweets/{sweet_id}", response_model=SweetResponse)
-def update_my_sweet(sweet_id: int,
+async def update_my_sweet(sweet_id: int,
                     sweet_data: SweetCreate,
-                    session: Session = Depends(get_session),
+                    response: Response,
+                    if_match: Optional[str] = Header(None),
+                    session: AsyncSession = Depends(get_session),
                     current_user=Depends(get_current_user)):
     """
     **Updates a sweet by ID**
 
+    With an `If-Match` header holding the ETag of the sweet (`"<version>"`) the sweet is
+    updated only if nobody has changed it since, otherwise the response is 412.
+
     Args:
      - sweet_id (int): ID of the sweet.
      - sweet_data (SweetCreate): Data for update sweet .
+     - if_match (str, optional): ETag of the sweet version the update is based on.
      - current_user (User): Current authenticated user.
 
-    Returns: Updated sweet object.
+    Returns: Updated sweet object with its new ETag.
     """
-    sweet = db_manager.get_sweet_by_id(sweet_id, session)
-    if sweet.user_id != current_user[0].id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You don't have access to modify this sweet",
-        )
+    return await apply_sweet_update(sweet_id, sweet_data.dict(), if_match, response, session, current_user)
 
-    sweet = db_manager.update_sweet(
-        sweet_id=sweet_id,
-        payload=sweet_data,
-        session=session)
 
-    return sweet
+@user_sweets.patch("/sweets/{sweet_id}", response_model=SweetResponse)
+async def patch_my_sweet(sweet_id: int,
+                         sweet_data: SweetUpdate,
+                         response: Response,
+                         if_match: Optional[str] = Header(None),
+                         session: AsyncSession = Depends(get_session),
+                         current_user=Depends(get_current_user)):
+    """
+    **Updates given fields of a sweet by ID**
+
+    Omitted fields keep their values. `If-Match` works as in the full update.
+
+    Args:
+     - sweet_id (int): ID of the sweet.
+     - sweet_data (SweetUpdate): Fields to change.
+     - if_match (str, optional): ETag of the sweet version the update is based on.
+     - current_user (User): Current authenticated user.
+
+    Returns: Updated sweet object with its new ETag.
+    """
+    changes = sweet_data.dict(exclude_unset=True)
+    if not changes:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Nothing to update",
+        )
+    return await apply_sweet_update(sweet_id, changes, if_match, response, session, current_user)
 
 
 @user_sweets.delete("/sweets/{sweet_id}", response_model=SweetResponse)
-def delete_my_sweet(sweet_id: int,
-                    session: Session = Depends(get_session),
+async def delete_my_sweet(sweet_id: int,
+                    session: AsyncSession = Depends(get_session),
                     current_user=Depends(get_current_user)):
     """
     **Deletes a sweet by ID**
@@ -94,7 +201,7 @@ def delete_my_sweet(sweet_id: int,
 
     Returns: Deleted sweet object.
     """
-    sweet = db_manager.get_sweet_by_id(sweet_id, session)
+    sweet = await db_manager.get_sweet_by_id(sweet_id, session)
     if sweet is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -107,14 +214,14 @@ def delete_my_sweet(sweet_id: int,
             detail="You don't have access to delete this sweet",
         )
 
-    sweet = db_manager.delete_sweet(sweet_id, session)
+    sweet = await db_manager.delete_sweet(sweet_id, session)
 
     return sweet
 
 
 @user_sweets.post("/sweet_category", response_model=SweetCategoryResponse, status_code=201)
-def add_sweet_to_category(sweet_id: int, category_id: int,
-                          session: Session = Depends(get_session),
+async def add_sweet_to_category(sweet_id: int, category_id: int,
+                          session: AsyncSession = Depends(get_session),
                           current_user: User = Depends(get_current_user)):
     """
     *Adds a sweet to a category*
@@ -122,12 +229,12 @@ def add_sweet_to_category(sweet_id: int, category_id: int,
     Args:
      - sweet_id (int): ID of the sweet.
      - category_id (int): ID of the category.
-     - session (Session): SQLAlchemy database session.
+     - session (AsyncSession): SQLAlchemy database session.
      - current_user (User): Current authenticated user.
 
     Returns: Newly created SweetCategory object.
     """
-    sweet = db_manager.get_sweet_by_id(sweet_id, session)
+    sweet = await db_manager.get_sweet_by_id(sweet_id, session)
     if sweet is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -139,20 +246,20 @@ def add_sweet_to_category(sweet_id: int, category_id: int,
             detail="You don't have access to manage this sweet",
         )
 
-    category = db_manager.get_category_by_id(category_id, session)
+    category = await db_manager.get_category_by_id(category_id, session)
     if category is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Category {category_id} not exist",
         )
 
-    new_sweet_category = db_manager.add_category_of_sweet(sweet_id, category_id, session)
+    new_sweet_category = await db_manager.add_category_of_sweet(sweet_id, category_id, session)
     return new_sweet_category
 
 
 @user_sweets.delete("/sweet_category", response_model=SweetCategoryResponse, status_code=201)
-def remove_sweet_from_category(sweet_id: int, category_id: int,
-                               session: Session = Depends(get_session),
+async def remove_sweet_from_category(sweet_id: int, category_id: int,
+                               session: AsyncSession = Depends(get_session),
                                current_user: User = Depends(get_current_user)):
     """
     **Removes a sweet from a category**
@@ -160,32 +267,42 @@ def remove_sweet_from_category(sweet_id: int, category_id: int,
     Args:
      - sweet_id (int): ID of the sweet.
      - category_id (int): ID of the category.
-     - session (Session): SQLAlchemy database session.
+     - session (AsyncSession): SQLAlchemy database session.
      - current_user (User): Current authenticated user.
 
     Returns: Removed SweetCategory object.
     """
-    sweet = db_manager.get_sweet_by_id(sweet_id, session)
+    sweet = await db_manager.get_sweet_by_id(sweet_id, session)
+    if sweet is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Sweet {sweet_id} not exist",
+        )
     if sweet.user_id != current_user[0].id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You don't have access to manage this sweet",
         )
 
-    category = db_manager.get_category_by_id(category_id, session)
+    category = await db_manager.get_category_by_id(category_id, session)
     if category is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Category {category_id} not exist",
         )
 
-    deleted_sweet_category = db_manager.remove_category_of_sweet(sweet_id, category_id, session)
+    deleted_sweet_category = await db_manager.remove_category_of_sweet(sweet_id, category_id, session)
+    if deleted_sweet_category is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Sweet {sweet_id} has no category {category_id}",
+        )
     return deleted_sweet_category
 
 
 @user_sweets.post("/sweet_ingredient", response_model=SweetIngredientResponse, status_code=201)
-def add_ingredient_to_sweet(sweet_id: int, ingredient_id: int,
-                            session: Session = Depends(get_session),
+async def add_ingredient_to_sweet(sweet_id: int, ingredient_id: int,
+                            session: AsyncSession = Depends(get_session),
                             current_user: User = Depends(get_current_user)):
     """
     *Adds a ingredient to a sweet*
@@ -193,12 +310,12 @@ def add_ingredient_to_sweet(sweet_id: int, ingredient_id: int,
     Args:
      - sweet_id (int): ID of the sweet.
      - ingredient_id (int): ID of the ingredient.
-     - session (Session): SQLAlchemy database session.
+     - session (AsyncSession): SQLAlchemy database session.
      - current_user (User): Current authenticated user.
 
     Returns: Newly created SweetIngredient object.
     """
-    sweet = db_manager.get_sweet_by_id(sweet_id, session)
+    sweet = await db_manager.get_sweet_by_id(sweet_id, session)
     if sweet is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -210,20 +327,20 @@ def add_ingredient_to_sweet(sweet_id: int, ingredient_id: int,
             detail="You don't have access to manage this sweet",
         )
 
-    ingredient = db_manager.get_ingredient_by_id(ingredient_id, session)
+    ingredient = await db_manager.get_ingredient_by_id(ingredient_id, session)
     if ingredient is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Ingredient {ingredient_id} not exist",
         )
 
-    new_sweet_ingredient = db_manager.add_ingredient_to_sweet(sweet_id, ingredient_id, session)
+    new_sweet_ingredient = await db_manager.add_ingredient_to_sweet(sweet_id, ingredient_id, session)
     return new_sweet_ingredient
 
 
 @user_sweets.delete("/sweet_ingredient", response_model=SweetIngredientResponse, status_code=201)
-def remove_ingredient_from_sweet(sweet_id: int, ingredient_id: int,
-                                 session: Session = Depends(get_session),
+async def remove_ingredient_from_sweet(sweet_id: int, ingredient_id: int,
+                                 session: AsyncSession = Depends(get_session),
                                  current_user: User = Depends(get_current_user)):
     """
     **Removes a sweet from a category**
@@ -231,55 +348,359 @@ def remove_ingredient_from_sweet(sweet_id: int, ingredient_id: int,
     Args:
      - sweet_id (int): ID of the sweet.
      - ingredient_id (int): ID of the ingredient.
-     - session (Session): SQLAlchemy database session.
+     - session (AsyncSession): SQLAlchemy database session.
      - current_user (User): Current authenticated user.
 
     Returns: Removed SweetIngredient object.
     """
-    sweet = db_manager.get_sweet_by_id(sweet_id, session)
+    sweet = await db_manager.get_sweet_by_id(sweet_id, session)
+    if sweet is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Sweet {sweet_id} not exist",
+        )
     if sweet.user_id != current_user[0].id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You don't have access to manage this sweet",
         )
 
-    ingredient = db_manager.get_ingredient_by_id(ingredient_id, session)
+    ingredient = await db_manager.get_ingredient_by_id(ingredient_id, session)
     if ingredient is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Ingredient {ingredient_id} not exist",
         )
 
-    deleted_sweet_ingredient = db_manager.remove_ingredient_of_sweet(sweet_id, ingredient_id, session)
+    deleted_sweet_ingredient = await db_manager.remove_ingredient_of_sweet(sweet_id, ingredient_id, session)
+    if deleted_sweet_ingredient is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Sweet {sweet_id} has no ingredient {ingredient_id}",
+        )
     return deleted_sweet_ingredient
 
 
-@sweets.get("/sweets")
-def get_sweets(page: int = 1, session: Session = Depends(get_session)):
+async def check_sweets_access(sweet_ids: List[int], session: AsyncSession, current_user):
+    """
+    Checks in one query that sweets exist and belong to the current user.
+
+    Raises: HTTPException: If a sweet does not exist or belongs to another user.
+    """
+    owners = await db_manager.get_sweets_owners(sweet_ids, session)
+    missing = sorted(set(sweet_ids) - owners.keys())
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Sweets {missing} not exist",
+        )
+    if any(user_id != current_user[0].id for user_id in owners.values()):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have access to manage this sweet",
+        )
+
+
+async def check_exist(model, ids: List[int], session: AsyncSession):
+    """
+    Checks in one query that categories or ingredients exist.
+
+    Raises: HTTPException: If some of them do not exist.
+    """
+    missing = sorted(set(ids) - await db_manager.get_existing_ids(model, ids, session))
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"{model.__name__} {missing} not exist",
+        )
+
+
+@user_sweets.post("/sweet_categories", response_model=List[SweetCategoryResponse], status_code=201)
+async def add_sweets_to_categories(links: List[SweetCategoryCreate],
+                                   session: AsyncSession = Depends(get_session),
+                                   current_user: User = Depends(get_current_user)):
+    """
+    **Adds sweets to categories in one request**
+
+    Args:
+     - links (List[SweetCategoryCreate]): Pairs of sweet and category IDs.
+     - current_user (User): Current authenticated user.
+
+    Returns: List of created SweetCategory objects, already existing links are skipped.
+    """
+    await check_sweets_access([link.sweet_id for link in links], session, current_user)
+    await check_exist(Category, [link.category_id for link in links], session)
+
+    new_links = await db_manager.add_categories_of_sweets(
+        [(link.sweet_id, link.category_id) for link in links], session)
+    return [{"sweet_id": sweet_id, "category_id": category_id} for sweet_id, category_id in new_links]
+
+
+@user_sweets.put("/sweets/{sweet_id}/categories", response_model=SweetLinksDiff)
+async def set_sweet_categories(sweet_id: int,
+                               category_ids: List[int],
+                               session: AsyncSession = Depends(get_session),
+                               current_user: User = Depends(get_current_user)):
+    """
+    **Replaces categories of a sweet**
+
+    Args:
+     - sweet_id (int): ID of the sweet.
+     - category_ids (List[int]): IDs of all categories the sweet must belong to.
+     - current_user (User): Current authenticated user.
+
+    Returns: IDs of added and removed categories.
+    """
+    await check_sweets_access([sweet_id], session, current_user)
+    await check_exist(Category, category_ids, session)
+
+    added, removed = await db_manager.set_categories_of_sweet(sweet_id, category_ids, session)
+    return {"sweet_id": sweet_id, "added": added, "removed": removed}
+
+
+@user_sweets.post("/sweet_ingredients", response_model=List[SweetIngredientResponse], status_code=201)
+async def add_ingredients_to_sweets(links: List[SweetIngredientCreate],
+                                    session: AsyncSession = Depends(get_session),
+                                    current_user: User = Depends(get_current_user)):
+    """
+    **Adds ingredients to sweets in one request**
+
+    Args:
+     - links (List[SweetIngredientCreate]): Pairs of sweet and ingredient IDs.
+     - current_user (User): Current authenticated user.
+
+    Returns: List of created SweetIngredient objects, already existing links are skipped.
+    """
+    await check_sweets_access([link.sweet_id for link in links], session, current_user)
+    await check_exist(Ingredient, [link.ingredient_id for link in links], session)
+
+    new_links = await db_manager.add_ingredients_to_sweets(
+        [(link.sweet_id, link.ingredient_id) for link in links], session)
+    return [{"sweet_id": sweet_id, "ingredient_id": ingredient_id} for sweet_id, ingredient_id in new_links]
+
+
+@user_sweets.put("/sweets/{sweet_id}/ingredients", response_model=SweetLinksDiff)
+async def set_sweet_ingredients(sweet_id: int,
+                                ingredient_ids: List[int],
+                                session: AsyncSession = Depends(get_session),
+                                current_user: User = Depends(get_current_user)):
+    """
+    **Replaces ingredients of a sweet**
+
+    Args:
+     - sweet_id (int): ID of the sweet.
+     - ingredient_ids (List[int]): IDs of all ingredients the sweet must have.
+     - current_user (User): Current authenticated user.
+
+    Returns: IDs of added and removed ingredients.
+    """
+    await check_sweets_access([sweet_id], session, current_user)
+    await check_exist(Ingredient, ingredient_ids, session)
+
+    added, removed = await db_manager.set_ingredients_of_sweet(sweet_id, ingredient_ids, session)
+    return {"sweet_id": sweet_id, "added": added, "removed": removed}
+
+
+@sweets.get("/sweets", response_model=SweetsPage)
+async def get_sweets(page: int = Query(1, ge=1),
+                     cursor: Optional[str] = None,
+                     per_page: int = Query(settings.SWEETS_PER_PAGE, ge=1, le=settings.SWEETS_MAX_PER_PAGE),
+                     order_by: Literal["id", "price", "created_at"] = "id",
+                     count: Literal["exact", "cached", "estimated"] = "cached",
+                     session: AsyncSession = Depends(get_read_session)):
     """
     **Retrieves a list of sweets with pagination**
 
+    Pages are addressed either by number (`page`) or, for deep pages, by the opaque
+    `next_cursor` of the previous response (`cursor`), which keeps every page equally fast.
+
+    Args:
+     - page (int): Page number, ignored when cursor is given.
+     - cursor (str, optional): Cursor returned as `next_cursor` by the previous page.
+     - per_page (int, optional): Number of sweets per page.
+     - order_by (str, optional): Sort key: "id", "price" or "created_at". Defaults to "id".
+     - count (str, optional): How to compute total count: "cached", "estimated" or "exact" (scans
+       the whole table). Defaults to "cached", counted once per worker and kept up to date on changes.
+
+    Returns: Dictionary containing total count, list of SweetResponse objects and cursor of the next page.
+
+    Raises: HTTPException: If the cursor is malformed.
+    """
+    total_count = await db_manager.get_deserts_count(session, mode=count)
+    if cursor is None and page > 1:
+        deserts = await db_manager.get_deserts(page, session, per_page=per_page, order_by=order_by)
+        next_cursor = None
+        if len(deserts) == per_page:
+            next_cursor = db_manager.get_sweets_cursor(deserts[-1], order_by)
+    else:
+        try:
+            deserts, next_cursor = await db_manager.get_deserts_after(cursor, session,
+                                                                      per_page=per_page, order_by=order_by)
+        except ValueError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(exc),
+            )
+    return {"total_count": total_count, "results": deserts, "next_cursor": next_cursor}
+
+
+@sweets.get("/catalog", response_model=CatalogPage)
+async def query_catalog(min_price: Optional[int] = None,
+                        max_price: Optional[int] = None,
+                        in_stock: Optional[bool] = None,
+                        user_id: Optional[int] = None,
+                        category: List[int] = Query([]),
+                        ingredient: List[int] = Query([]),
+                        exclude_ingredient: List[int] = Query([]),
+                        q: Optional[str] = Query(None, max_length=settings.CATALOG_MAX_QUERY_LENGTH),
+                        order_by: db_manager.SweetsOrder = "id",
+                        cursor: Optional[str] = None,
+                        per_page: int = Query(settings.SWEETS_PER_PAGE, ge=1, le=settings.SWEETS_MAX_PER_PAGE),
+                        session: AsyncSession = Depends(get_read_session)):
+    """
+    **Queries the catalog with combined filters and keyset pagination**
+
+    Filters are combined with AND, list parameters are repeated: `?category=1&category=2`.
+
     Args:
-     - page (int): Page number.
+     - min_price, max_price (int, optional): Price range, bounds included.
+     - in_stock (bool, optional): Availability of sweets.
+     - user_id (int, optional): ID of the owner of sweets.
+     - category (list, optional): IDs of categories, sweets in any of them.
+     - ingredient (list, optional): IDs of ingredients, sweets having all of them.
+     - exclude_ingredient (list, optional): IDs of ingredients, sweets having none of them.
+     - q (str, optional): Text query over titles, descriptions, categories and ingredients.
+     - order_by (str, optional): Sort key: "id", "price" or "created_at", "-" prefix sorts descending.
+     - cursor (str, optional): Cursor returned as `next_cursor` by the previous page.
+     - per_page (int, optional): Number of sweets per page.
+
+    Returns: Dictionary containing list of SweetResponse objects and cursor of the next page.
+
+    Raises: HTTPException: If a filter has too many IDs or the cursor is malformed.
+    """
+    for name, ids in (("category", category), ("ingredient", ingredient),
+                      ("exclude_ingredient", exclude_ingredient)):
+        if len(ids) > settings.CATALOG_MAX_FILTER_IDS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"At most {settings.CATALOG_MAX_FILTER_IDS} values of {name} are allowed",
+            )
+    filters = CatalogFilter(min_price=min_price, max_price=max_price, in_stock=in_stock, user_id=user_id,
+                            category_ids=category, ingredient_ids=ingredient,
+                            exclude_ingredient_ids=exclude_ingredient, query=q)
+    try:
+        deserts, next_cursor = await db_manager.get_catalog_page(filters, cursor, session,
+                                                                 per_page=per_page, order_by=order_by)
+    except ValueError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(exc),
+        )
+    return {"results": deserts, "next_cursor": next_cursor}
+
 
-    Returns: Dictionary containing total count and list of SweetResponse objects.
+@sweets.get("/facets", response_model=FacetsResponse)
+async def get_facets(min_price: Optional[int] = None,
+                     max_price: Optional[int] = None,
+                     in_stock: Optional[bool] = None,
+                     session: AsyncSession = Depends(get_read_session)):
     """
-    total_count = db_manager.get_deserts_count(session)
-    deserts = db_manager.get_deserts(page, session)
-    return {"total_count": total_count, "results": deserts}
+    **Counts sweets in every category and ingredient**
+
+    Counts are computed with one grouped query and cached until the catalog changes.
+
+    Args:
+     - min_price, max_price (int, optional): Price range of counted sweets, bounds included.
+     - in_stock (bool, optional): Availability of counted sweets.
+
+    Returns: Dictionary containing taxonomy version and lists of categories and ingredients
+    with counts of their sweets, largest first.
+    """
+    filters = CatalogFilter(min_price=min_price, max_price=max_price, in_stock=in_stock)
+    return await db_manager.get_facets(filters, session)
+
+
+@sweets.get("/price_stats", response_model=PriceStats)
+async def get_price_stats(min_price: Optional[int] = None,
+                          max_price: Optional[int] = None,
+                          buckets: int = Query(10, ge=1, le=settings.PRICE_STATS_MAX_BUCKETS),
+                          session: AsyncSession = Depends(get_read_session)):
+    """
+    **Retrieves statistics of prices of sweets**
+
+    Served from an in-memory sorted array of prices, so counts for price sliders
+    don't require fetching sweets.
+
+    Args:
+     - min_price, max_price (int, optional): Price range, bounds included.
+     - buckets (int, optional): Maximum number of histogram buckets. Defaults to 10.
+
+    Returns: Dictionary containing count, min, max and median prices of sweets in the range
+    and their counts in buckets of equal width.
+    """
+    return await db_manager.get_price_stats(min_price, max_price, session, buckets=buckets)
+
+
+@sweets.get("/match_by_ingredients", response_model=List[SweetMatch])
+async def match_by_ingredients(ingredient: List[int] = Query([]),
+                               exclude_ingredient: List[int] = Query([]),
+                               mode: db_manager.MatchMode = "subset",
+                               page: int = Query(1, ge=1),
+                               per_page: int = Query(settings.SWEETS_PER_PAGE, ge=1,
+                                                     le=settings.SWEETS_MAX_PER_PAGE),
+                               session: AsyncSession = Depends(get_read_session)):
+    """
+    **Finds sweets which can be made with the given ingredients**
+
+    List parameters are repeated: `?ingredient=1&ingredient=2&exclude_ingredient=3`.
+
+    Args:
+     - ingredient (list, optional): IDs of available ingredients.
+     - exclude_ingredient (list, optional): IDs of ingredients sweets must not have, e.g. allergens.
+     - mode (str, optional): "subset" for sweets made only of available ingredients,
+       "overlap" for sweets having any of them. Defaults to "subset".
+     - page (int, optional): Page number. Defaults to 1.
+     - per_page (int, optional): Number of sweets per page.
+
+    Returns: List of sweets with counts of matched and missing ingredients, most matched
+    and least missing first.
+
+    Raises: HTTPException: If too many ingredients are given.
+    """
+    if len(ingredient) + len(exclude_ingredient) > settings.MATCH_MAX_INGREDIENTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.MATCH_MAX_INGREDIENTS} ingredients are allowed",
+        )
+    return await db_manager.match_ingredients(ingredient, exclude_ingredient, session,
+                                              mode=mode, page=page, per_page=per_page)
+
+
+@sweets.get("/sweets/export")
+async def export_sweets(fmt: bulk.BulkFormat = Query("ndjson", alias="format")):
+    """
+    **Exports the whole catalog as NDJSON or CSV**
+
+    Args:
+     - format (str, optional): "ndjson" or "csv". Defaults to "ndjson".
+
+    Returns: Streamed file with one sweet per line.
+    """
+    media_type = "application/x-ndjson" if fmt == "ndjson" else "text/csv"
+    return StreamingResponse(bulk.export_sweets(fmt), media_type=media_type)
 
 
 @sweets.get("/sweets/{sweet_id}", response_model=SweetResponse)
-def get_sweet(sweet_id: int, session: Session = Depends(get_session)):
+async def get_sweet(sweet_id: int, response: Response, session: AsyncSession = Depends(get_read_session)):
     """
     **Retrieves a sweet by ID**
 
     Args:
      - sweet_id (int): ID of the sweet.
 
-    Returns: Sweet object.
+    Returns: Sweet object, its ETag is the `If-Match` value of updates.
     """
-    sweet = db_manager.get_sweet_by_id(sweet_id, session)
+    sweet = await db_manager.get_sweet_card(sweet_id, session)
 
     if sweet is None:
         raise HTTPException(
@@ -287,28 +708,61 @@ def get_sweet(sweet_id: int, session: Session = Depends(get_session)):
             detail=f"Sweet {sweet_id} not exist",
         )
 
+    response.headers["ETag"] = sweet_etag(sweet.version)
     return sweet
 
 
-@sweets.get("/search")
-def search_sweets(query: Optional[str] = None,
-                  session: Session = Depends(get_session),):
+@sweets.get("/sweets/{sweet_id}/similar", response_model=List[SimilarSweet])
+async def get_similar_sweets(sweet_id: int,
+                             limit: int = Query(settings.SWEETS_PER_PAGE, ge=1, le=settings.SWEETS_MAX_PER_PAGE),
+                             session: AsyncSession = Depends(get_read_session)):
+    """
+    **Retrieves sweets similar to a sweet**
+
+    Sweets are ranked by shared ingredients and categories (Jaccard similarity) and by closeness of prices.
+
+    Args:
+     - sweet_id (int): ID of the sweet.
+     - limit (int, optional): Number of sweets to return.
+
+    Returns: List of sweets with their similarity from 0 to 1, most similar first.
+
+    Raises: HTTPException: If the sweet does not exist.
+    """
+    similar = await db_manager.get_similar_sweets(sweet_id, session, limit=limit)
+    if similar is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Sweet {sweet_id} not exist",
+        )
+    return similar
+
+
+@sweets.get("/search", response_model=List[SweetResponse])
+async def search_sweets(query: Optional[str] = None,
+                        page: int = Query(1, ge=1),
+                        per_page: int = Query(settings.SWEETS_PER_PAGE, ge=1, le=settings.SWEETS_MAX_PER_PAGE),
+                        session: AsyncSession = Depends(get_read_session),):
     """
     **Searches for sweets based on a search query**
 
     Args:
      - query (str, optional): Search query string. Defaults to None.
+     - page (int, optional): Page number. Defaults to 1.
+     - per_page (int, optional): Number of sweets per page.
 
-    Returns: List of Sweet objects matching the search query.
+    Returns: List of Sweet objects matching the search query, most relevant first.
     """
-    search_result = db_manager.search_sweets(query, session=session)
+    if not query:
+        return []
+    search_result = await db_manager.search_sweets(query, session=session, page=page, per_page=per_page)
     return search_result
 
 
-@sweets.get("/filter_by_price")
-def filter_sweets(min_price: Optional[int] = 0,
+@sweets.get("/filter_by_price", response_model=List[SweetResponse])
+async def filter_sweets(min_price: Optional[int] = 0,
                   max_price: Optional[int] = 0,
-                  session: Session = Depends(get_session)):
+                  session: AsyncSession = Depends(get_read_session)):
     """
     **Filters sweets based on price range**
 
@@ -318,21 +772,21 @@ def filter_sweets(min_price: Optional[int] = 0,
 
     Returns: List of Sweet objects within the specified price range.
     """
-    filter_result = db_manager.filter_sweets(min_price, max_price, session=session)
+    filter_result = await db_manager.filter_sweets(min_price, max_price, session=session)
     return filter_result
 
 
 @admin_only.post("/categories", response_model=CategoryResponse, status_code=201)
-def create_category(category_schema: CategoryCreate,
-                    session: Session = Depends(get_session),):
+async def create_category(category_schema: CategoryCreate,
+                    session: AsyncSession = Depends(get_session),):
 
-    new_category = db_manager.create_category(category_schema, session)
+    new_category = await db_manager.create_category(category_schema, session)
     return new_category
 
 
 @admin_only.post("/ingredients", response_model=IngredientResponse, status_code=201)
-def create_ingredient(ingredient_schema: IngredientCreate,
-                      session: Session = Depends(get_session),):
+async def create_ingredient(ingredient_schema: IngredientCreate,
+                      session: AsyncSession = Depends(get_session),):
 
-    new_ingredient = db_manager.create_ingredient(ingredient_schema, session)
+    new_ingredient = await db_manager.create_ingredient(ingredient_schema, session)
     return new_ingredient
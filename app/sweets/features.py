@@ -0,0 +1,417 @@
+"""
+In-memory index of sweets for ingredient matching, similar sweets and price statistics.
+
+`SweetFeatures` keeps ingredients and categories of every sweet as rows of
+packed bits of NumPy matrices, one bit per ingredient or category, and
+prices as an array and as a sorted array. "What can be made with these
+ingredients", "sweets similar to this one" and "how many sweets cost
+100-500" are answered with a few vectorized operations or binary searches
+over the whole catalog instead of GROUP BY queries.
+
+The index lives in the memory of a single worker. `db_manager` builds it
+on first use, applies every committed change of sweets and their links
+made in this worker, and rebuilds it every `SWEET_INDEX_TTL` seconds to
+pick up changes of other workers.
+"""
+import time
+from itertools import chain
+from typing import Dict, Iterable, List, Literal, Optional, Tuple
+
+import numpy as np
+
+from app.core.app_config import settings
+from app.sweets.models import SweetCategory, SweetIngredient
+
+# Ranking keys pack (overlap, missing, ID) into one int64, counts are clamped to 10 bits
+_COUNT_LIMIT = (1 << 10) - 1
+_ID_LIMIT = (1 << 32) - 1
+
+MatchMode = Literal["subset", "overlap"]
+
+# Weights of similarity components: Jaccard similarity of ingredients and of categories,
+# and closeness of prices (ratio of the lower price to the higher one)
+SIMILARITY_WEIGHTS = {"SweetIngredient": 0.5, "SweetCategory": 0.3, "price": 0.2}
+
+
+def _bit(column) -> np.uint64:
+    return np.left_shift(np.uint64(1), np.asarray(column, dtype=np.uint64) & np.uint64(63))
+
+
+class LinkBitsets:
+    """
+    Linked IDs (e.g. ingredients) of rows as packed bits, one column per linked ID.
+
+    Bits are stored word-major, `bits[word, row]`, so a query touches only
+    the contiguous words of the columns it asks about.
+    """
+
+    def __init__(self, rows: int = 0):
+        # Linked ID -> column
+        self.columns: Dict[int, int] = {}
+        self.bits = np.zeros((1, rows), dtype=np.uint64)
+        self.counts = np.zeros(rows, dtype=np.int32)
+
+    @classmethod
+    def build(cls, rows: int, row_indexes: np.ndarray, linked_ids: np.ndarray) -> "LinkBitsets":
+        """Builds bitsets of unique (row, linked ID) pairs"""
+        bitsets = cls(rows)
+        if len(linked_ids):
+            ids, columns = np.unique(linked_ids, return_inverse=True)
+            bitsets.columns = {int(linked_id): column for column, linked_id in enumerate(ids)}
+            bitsets.bits = np.zeros((max(1, -(-len(ids) // 64)), rows), dtype=np.uint64)
+            np.bitwise_or.at(bitsets.bits, (columns >> 6, row_indexes), _bit(columns))
+            bitsets.counts = np.bincount(row_indexes, minlength=rows).astype(np.int32)
+        return bitsets
+
+    def resize(self, rows: int):
+        grown = np.zeros((len(self.bits), rows), dtype=np.uint64)
+        grown[:, :self.bits.shape[1]] = self.bits
+        self.bits = grown
+        self.counts = np.concatenate([self.counts, np.zeros(rows - len(self.counts), dtype=np.int32)])
+
+    def mask(self, linked_ids: Iterable[int]) -> np.ndarray:
+        """Bits of the linked IDs, unknown IDs are ignored"""
+        mask = np.zeros(len(self.bits), dtype=np.uint64)
+        for linked_id in linked_ids:
+            column = self.columns.get(linked_id)
+            if column is not None:
+                mask[column >> 6] |= _bit(column)
+        return mask
+
+    def add(self, row: int, linked_id: int):
+        column = self.columns.get(linked_id)
+        if column is None:
+            column = self.columns[linked_id] = len(self.columns)
+            if column >> 6 >= len(self.bits):
+                self.bits = np.vstack([self.bits, np.zeros((1, self.bits.shape[1]), dtype=np.uint64)])
+        word, bit = column >> 6, _bit(column)
+        if not self.bits[word, row] & bit:
+            self.bits[word, row] |= bit
+            self.counts[row] += 1
+
+    def remove(self, row: int, linked_id: int):
+        column = self.columns.get(linked_id)
+        if column is None:
+            return
+        word, bit = column >> 6, _bit(column)
+        if self.bits[word, row] & bit:
+            self.bits[word, row] &= ~bit
+            self.counts[row] -= 1
+
+    def clear(self, row: int):
+        self.bits[:, row] = 0
+        self.counts[row] = 0
+
+    def overlap(self, mask: np.ndarray, rows: int) -> np.ndarray:
+        """Number of set bits of the mask in each of the first rows"""
+        overlap = np.zeros(rows, dtype=np.int32)
+        for word in np.flatnonzero(mask):
+            overlap += np.bitwise_count(self.bits[word, :rows] & mask[word])
+        return overlap
+
+    def row_mask(self, row: int) -> np.ndarray:
+        return self.bits[:, row].copy()
+
+    def jaccard(self, row: int, rows: int) -> np.ndarray:
+        """Jaccard similarity of the set of a row with each of the first rows, 0 for two empty sets"""
+        overlap = self.overlap(self.row_mask(row), rows)
+        # The union is empty only with an empty overlap
+        union = np.maximum(self.counts[:rows] + (self.counts[row] - overlap), 1)
+        return np.true_divide(overlap, union, dtype=np.float32)
+
+    def intersects(self, mask: np.ndarray, rows: int) -> np.ndarray:
+        """Whether each of the first rows has any bit of the mask"""
+        intersects = np.zeros(rows, dtype=bool)
+        for word in np.flatnonzero(mask):
+            intersects |= (self.bits[word, :rows] & mask[word]) != 0
+        return intersects
+
+
+class SortedPrices:
+    """Prices of sweets kept sorted, counted in ranges by binary search"""
+
+    def __init__(self, prices: Optional[np.ndarray] = None):
+        self.values = np.sort(prices) if prices is not None else np.zeros(0, dtype=np.int64)
+
+    def update(self, removed: Iterable[int] = (), added: Iterable[int] = ()):
+        """Replaces prices of changed sweets, one copy of the array per call"""
+        removed = np.sort(np.fromiter(removed, dtype=np.int64))
+        if len(removed):
+            # Equal prices remove consecutive equal values
+            positions = (np.searchsorted(self.values, removed)
+                         + np.arange(len(removed)) - np.searchsorted(removed, removed))
+            valid = positions < len(self.values)
+            valid[valid] = self.values[positions[valid]] == removed[valid]
+            self.values = np.delete(self.values, positions[valid])
+        added = np.sort(np.fromiter(added, dtype=np.int64))
+        if len(added):
+            self.values = np.insert(self.values, np.searchsorted(self.values, added), added)
+
+    def _range(self, min_price: Optional[int], max_price: Optional[int]) -> Tuple[int, int]:
+        start = 0 if min_price is None else int(np.searchsorted(self.values, min_price, side="left"))
+        end = len(self.values) if max_price is None else int(np.searchsorted(self.values, max_price, side="right"))
+        return start, max(start, end)
+
+    def count(self, min_price: Optional[int] = None, max_price: Optional[int] = None) -> int:
+        start, end = self._range(min_price, max_price)
+        return end - start
+
+    def stats(self, min_price: Optional[int] = None, max_price: Optional[int] = None, buckets: int = 10) -> dict:
+        """
+        Statistics of prices within a range, bounds included.
+
+        Returns: Dictionary containing count, min, max and median prices, None when no
+        prices are in the range, and counts of buckets of equal width between min and max.
+        """
+        start, end = self._range(min_price, max_price)
+        count = end - start
+        if not count:
+            return {"count": 0, "min": None, "max": None, "median": None, "buckets": []}
+        values = self.values[start:end]
+        low, high = int(values[0]), int(values[-1])
+        middle = (count - 1) // 2
+        median = float(values[middle]) if count % 2 else (int(values[middle]) + int(values[middle + 1])) / 2
+        width = -(-(high - low + 1) // buckets)
+        # Lower bounds of buckets and the end of the last one
+        edges = low + width * np.arange(-(-(high - low + 1) // width) + 1, dtype=np.int64)
+        counts = np.diff(np.searchsorted(values, edges, side="left"))
+        return {
+            "count": count,
+            "min": low,
+            "max": high,
+            "median": median,
+            "buckets": [{"min_price": int(edge), "max_price": int(min(edge + width - 1, high)), "count": int(bucket)}
+                        for edge, bucket in zip(edges, counts)],
+        }
+
+
+class SweetFeatures:
+    """Rows of sweets with bitsets of their links, see the module docstring"""
+
+    def __init__(self, ttl: float, link_models=()):
+        self.ttl = ttl
+        # Link models (e.g. SweetIngredient) indexed as bitsets, by name
+        self.link_models = tuple(link_models)
+        self.link_names = [link_model.__name__ for link_model in self.link_models]
+        # Sweet ID -> row, rows of deleted sweets are only reused by the next build
+        self._rows: Dict[int, int] = {}
+        self._ids = np.zeros(0, dtype=np.int64)
+        # Prices as stored, they are also looked up in `sorted_prices` on removal
+        self._prices = np.zeros(0, dtype=np.int64)
+        self.sorted_prices = SortedPrices()
+        self._size = 0
+        # Rows of deleted sweets since the last build
+        self._discarded = 0
+        self.links: Dict[str, LinkBitsets] = {name: LinkBitsets() for name in self.link_names}
+        self._built_at: Optional[float] = None
+        # Changes made while a build reads the database, replayed over its result
+        self._journal: Optional[list] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._built_at is not None and time.monotonic() - self._built_at < self.ttl
+
+    def begin_build(self):
+        """Starts recording changes, call before reading rows for `build`"""
+        self._journal = []
+
+    def build(self, sweets: Iterable[Tuple[int, int]], links: Dict[str, Iterable[Tuple[int, int]]]):
+        """
+        Replaces the index with sweets and their links read from the database.
+
+        Args:
+         - sweets (list): (ID, price) pairs of all sweets.
+         - links (dict): Name of link model -> (sweet ID, linked ID) pairs.
+        """
+        sweets = np.fromiter(chain.from_iterable(sweets), dtype=np.int64).reshape(-1, 2)
+        ids, first = np.unique(sweets[:, 0], return_index=True)
+        prices = sweets[first, 1]
+        built = {}
+        for name in self.link_names:
+            pairs = np.fromiter(chain.from_iterable(links.get(name, ())), dtype=np.int64).reshape(-1, 2)
+            # Links of sweets created after IDs were read wait for the journal
+            pairs = pairs[np.isin(pairs[:, 0], ids)]
+            built[name] = LinkBitsets.build(len(ids), np.searchsorted(ids, pairs[:, 0]), pairs[:, 1])
+
+        journal, self._journal = self._journal or [], None
+        self._ids = ids
+        self._prices = prices
+        self.sorted_prices = SortedPrices(prices)
+        self._size = len(ids)
+        self._discarded = 0
+        self._rows = {int(sweet_id): row for row, sweet_id in enumerate(ids)}
+        self.links = built
+        self._built_at = time.monotonic()
+        for method, args in journal:
+            method(*args)
+
+    def cancel_build(self):
+        self._journal = None
+
+    def reset(self):
+        # Rebuilt from the database on the next use
+        self._built_at = None
+
+    def _record(self, method, *args) -> bool:
+        if self._journal is not None:
+            self._journal.append((method, args))
+        return self._built_at is not None
+
+    def _row(self, sweet_id: int) -> int:
+        row = self._rows.get(sweet_id)
+        if row is None:
+            if self._size == len(self._ids):
+                capacity = max(16, 2 * len(self._ids))
+                self._ids = np.concatenate([self._ids, np.zeros(capacity - len(self._ids), dtype=np.int64)])
+                self._prices = np.concatenate([self._prices, np.zeros(capacity - len(self._prices),
+                                                                      dtype=np.int64)])
+                for bitsets in self.links.values():
+                    bitsets.resize(capacity)
+            row = self._rows[sweet_id] = self._size
+            self._ids[row] = sweet_id
+            self._size += 1
+        return row
+
+    def add_sweets(self, sweets: Iterable[Tuple[int, int]]):
+        """Adds sweets as (ID, price) pairs or updates prices of known ones"""
+        sweets = list(dict(sweets).items())
+        if self._record(self.add_sweets, sweets):
+            removed = [self._prices[self._rows[sweet_id]] for sweet_id, _ in sweets if sweet_id in self._rows]
+            for sweet_id, price in sweets:
+                # The row may grow the arrays
+                row = self._row(sweet_id)
+                self._prices[row] = price
+            self.sorted_prices.update(removed, (price for _, price in sweets))
+
+    def discard_sweets(self, sweet_ids: Iterable[int]):
+        sweet_ids = list(sweet_ids)
+        if self._record(self.discard_sweets, sweet_ids):
+            removed = []
+            for sweet_id in sweet_ids:
+                row = self._rows.pop(sweet_id, None)
+                if row is not None:
+                    self._ids[row] = 0
+                    self._discarded += 1
+                    removed.append(self._prices[row])
+                    for bitsets in self.links.values():
+                        bitsets.clear(row)
+            self.sorted_prices.update(removed)
+
+    def add_links(self, link_model, links: Iterable[Tuple[int, int]]):
+        links = list(links)
+        if self._record(self.add_links, link_model, links) and link_model.__name__ in self.links:
+            bitsets = self.links[link_model.__name__]
+            for sweet_id, linked_id in links:
+                # Sweets unknown to the index are added with their prices by `add_sweets`
+                row = self._rows.get(sweet_id)
+                if row is not None:
+                    bitsets.add(row, linked_id)
+
+    def remove_links(self, link_model, links: Iterable[Tuple[int, int]]):
+        links = list(links)
+        if self._record(self.remove_links, link_model, links) and link_model.__name__ in self.links:
+            bitsets = self.links[link_model.__name__]
+            for sweet_id, linked_id in links:
+                row = self._rows.get(sweet_id)
+                if row is not None:
+                    bitsets.remove(row, linked_id)
+
+    def set_links(self, link_model, sweet_id: int, linked_ids: Iterable[int]):
+        linked_ids = list(linked_ids)
+        if self._record(self.set_links, link_model, sweet_id, linked_ids) and link_model.__name__ in self.links:
+            bitsets = self.links[link_model.__name__]
+            row = self._rows.get(sweet_id)
+            if row is None:
+                return
+            bitsets.clear(row)
+            for linked_id in linked_ids:
+                bitsets.add(row, linked_id)
+
+    def match_links(self, link_model, linked_ids: Iterable[int], exclude_ids: Iterable[int] = (),
+                    mode: MatchMode = "subset", offset: int = 0, limit: int = 10) -> List[Tuple[int, int, int]]:
+        """
+        Ranks sweets by overlap of their links (e.g. ingredients) with the given set.
+
+        Args:
+         - link_model: Link model of the compared links, e.g. SweetIngredient.
+         - linked_ids (list): IDs of available ingredients.
+         - exclude_ids (list): IDs of ingredients sweets must not have, e.g. allergens.
+         - mode (str): "subset" for sweets having only available ingredients,
+           "overlap" for sweets having any of them.
+         - offset (int): Number of ranked sweets to skip.
+         - limit (int): Number of sweets to return.
+
+        Returns: List of (sweet ID, matched, missing) tuples, most matched and least missing first.
+        """
+        bitsets = self.links[link_model.__name__]
+        size = self._size
+        counts = bitsets.counts[:size]
+        # Unknown IDs are linked to no sweet and change nothing
+        matched = bitsets.overlap(bitsets.mask(linked_ids), size)
+        missing = counts - matched
+
+        selected = (self._ids[:size] > 0) & (counts > 0)
+        selected &= (missing == 0) if mode == "subset" else (matched > 0)
+        selected &= ~bitsets.intersects(bitsets.mask(exclude_ids), size)
+
+        rows = np.flatnonzero(selected)
+        if not len(rows):
+            return []
+        keys = ((np.minimum(matched[rows], _COUNT_LIMIT).astype(np.int64) << 42)
+                | ((_COUNT_LIMIT - np.minimum(missing[rows], _COUNT_LIMIT)).astype(np.int64) << 32)
+                | (_ID_LIMIT - self._ids[rows]))
+        end = offset + limit
+        if end < len(keys):
+            top = np.argpartition(-keys, end - 1)[:end]
+        else:
+            top = np.arange(len(keys))
+        top = top[np.argsort(-keys[top])][offset:end]
+        return [(int(self._ids[row]), int(matched[row]), int(missing[row])) for row in rows[top]]
+
+    def similar(self, sweet_id: int, limit: int = 10) -> Optional[List[Tuple[int, float]]]:
+        """
+        Ranks other sweets by similarity to a sweet, see `SIMILARITY_WEIGHTS`.
+
+        Args:
+         - sweet_id (int): ID of the sweet.
+         - limit (int): Number of sweets to return.
+
+        Returns: List of (sweet ID, similarity from 0 to 1) tuples, most similar first,
+        or None if the sweet is not in the index.
+        """
+        row = self._rows.get(sweet_id)
+        if row is None:
+            return None
+        size = self._size
+        prices = self._prices[:size]
+        price = self._prices[row]
+        if price > 0:
+            scores = (np.minimum(prices, price) / np.maximum(prices, price)).astype(np.float32)
+        else:
+            scores = (prices == 0).astype(np.float32)
+        scores *= SIMILARITY_WEIGHTS["price"]
+        for name, bitsets in self.links.items():
+            scores += SIMILARITY_WEIGHTS[name] * bitsets.jaccard(row, size)
+
+        # Scores are never negative, the sweet itself and deleted sweets drop to the end
+        scores[row] = -1
+        if self._discarded:
+            scores[self._ids[:size] == 0] = -1
+        limit = min(limit, size - 1 - self._discarded)
+        if limit <= 0:
+            return []
+        # Partial sort: every sweet scoring at least the limit-th score, ties included
+        threshold = -np.partition(-scores, limit - 1)[limit - 1]
+        candidates = np.flatnonzero(scores >= threshold)
+        top = candidates[np.lexsort((self._ids[candidates], -scores[candidates]))][:limit]
+        return [(int(self._ids[row]), float(scores[row])) for row in top]
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "sweets": len(self._rows),
+            **{name: len(bitsets.columns) for name, bitsets in self.links.items()},
+        }
+
+
+sweet_features = SweetFeatures(ttl=settings.SWEET_INDEX_TTL, link_models=(SweetIngredient, SweetCategory))
@@ -1,5 +1,8 @@
 from datetime import datetime
 from typing import Optional, List
+
+from sqlalchemy import Column, DDL, Index, JSON, Text, event
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
 from sqlmodel import SQLModel, Field, Relationship
 
 
@@ -9,7 +12,7 @@ class SweetCategory(SQLModel, table=True):
         default=None, foreign_key="sweet.id", primary_key=True
     )
     category_id: Optional[int] = Field(
-        default=None, foreign_key="category.id", primary_key=True
+        default=None, foreign_key="category.id", primary_key=True, index=True
     )
 
 
@@ -19,7 +22,7 @@ class SweetIngredient(SQLModel, table=True):
         default=None, foreign_key="sweet.id", primary_key=True
     )
     ingredient_id: Optional[int] = Field(
-        default=None, foreign_key="ingredient.id", primary_key=True
+        default=None, foreign_key="ingredient.id", primary_key=True, index=True
     )
 
 
@@ -44,12 +47,14 @@ class Sweet(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     title: str = Field(index=True)
     description: str = Field()
-    price: int = Field(index=True)
+    price: int = Field()
     in_stock: bool = Field(default=True)
-    created_at: datetime = Field(default=datetime.utcnow(), nullable=False)
-    edited_at: datetime = Field(default=datetime.utcnow(), nullable=False)
+    created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+    edited_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+    # Grows with every update, compared by conditional updates (`If-Match`)
+    version: int = Field(default=1, nullable=False)
 
-    user_id: Optional[int] = Field(default=None, foreign_key="user.id")
+    user_id: Optional[int] = Field(default=None, foreign_key="user.id", index=True)
     categories: List[Category] = Relationship(back_populates="sweets",
                                               link_model=SweetCategory)
     ingredients: List[Ingredient] = Relationship(back_populates="sweets",
@@ -57,5 +62,74 @@ class Sweet(SQLModel, table=True):
 
     class Config:
         orm_mode = True
+        # Let FastAPI build response models from attributes, including relationships
+        read_with_orm_mode = True
+
+    # Keyset pagination and filters read these in index order, `id` breaks ties
+    __table_args__ = (
+        Index("ix_sweet_price_id", "price", "id"),
+        Index("ix_sweet_created_at_id", "created_at", "id"),
+        Index("ix_sweet_in_stock_price_id", "in_stock", "price", "id"),
+    )
+
+
+class SweetCard(SQLModel, table=True):
+    """ Denormalized sweet with its categories and ingredients, maintained by db_manager on every change """
+    id: Optional[int] = Field(
+        default=None, foreign_key="sweet.id", primary_key=True
+    )
+    user_id: Optional[int] = Field(default=None, index=True)
+    title: str
+    description: str
+    price: int
+    in_stock: bool = Field(default=True)
+    created_at: datetime = Field(nullable=False)
+    edited_at: datetime = Field(nullable=False)
+    version: int = Field(default=1, nullable=False)
+    # Lists of {"id": ..., "title": ...}
+    categories: List[dict] = Field(default=[], sa_column=Column(JSON().with_variant(JSONB(), "postgresql"),
+                                                                nullable=False))
+    ingredients: List[dict] = Field(default=[], sa_column=Column(JSON().with_variant(JSONB(), "postgresql"),
+                                                                 nullable=False))
+
+    class Config:
+        orm_mode = True
+
+    # Same read paths as indexes of `Sweet`
+    __table_args__ = (
+        Index("ix_sweetcard_price_id", "price", "id"),
+        Index("ix_sweetcard_created_at_id", "created_at", "id"),
+        Index("ix_sweetcard_in_stock_price_id", "in_stock", "price", "id"),
+    )
+
+
+class SweetSearch(SQLModel, table=True):
+    """ Search document of a sweet, maintained by db_manager on every change """
+    sweet_id: Optional[int] = Field(
+        default=None, foreign_key="sweet.id", primary_key=True
+    )
+    title: str = Field(default="")
+    description: str = Field(default="")
+    tags: str = Field(default="")
+    # Weighted title/description/tags vector on PostgreSQL, unused on other databases
+    search_vector: Optional[str] = Field(
+        default=None, sa_column=Column(TSVECTOR().with_variant(Text(), "sqlite"))
+    )
+
+    __table_args__ = (
+        Index("ix_sweetsearch_search_vector", "search_vector", postgresql_using="gin"),
+    )
 
 
+# Trigram index serves substring (ILIKE) matches of misspelled or partial words
+event.listen(
+    SweetSearch.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+event.listen(
+    SweetSearch.__table__,
+    "after_create",
+    DDL("CREATE INDEX IF NOT EXISTS ix_sweetsearch_title_trgm "
+        "ON sweetsearch USING gin (title gin_trgm_ops)").execute_if(dialect="postgresql"),
+)
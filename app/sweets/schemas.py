@@ -1,7 +1,7 @@
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, validator
 
 from app.sweets.models import Category, Ingredient
 
@@ -13,6 +13,21 @@ class SweetCreate(BaseModel):
     price: int = 123
 
 
+class SweetUpdate(BaseModel):
+    """Validation scheme to partially update sweet, omitted fields keep their values"""
+    title: Optional[str] = None
+    description: Optional[str] = None
+    price: Optional[int] = None
+    in_stock: Optional[bool] = None
+
+    @validator("*", pre=True)
+    def not_null(cls, value):
+        """ Omitting a field keeps its value, null can't be stored """
+        if value is None:
+            raise ValueError("may not be null")
+        return value
+
+
 class SweetResponse(BaseModel):
     """Validation scheme to response sweet"""
     id: int
@@ -20,10 +35,41 @@ class SweetResponse(BaseModel):
     title: str
     description: str
     price: int
+    in_stock: bool
     created_at: datetime
+    edited_at: datetime
+    version: int
     categories: List[Category] | None
     ingredients: List[Ingredient] | None
 
+    class Config:
+        orm_mode = True
+
+
+class SweetsPage(BaseModel):
+    """Validation scheme to response page of sweets"""
+    total_count: int
+    results: List[SweetResponse]
+    next_cursor: Optional[str]
+
+
+class CatalogFilter(BaseModel):
+    """Validation scheme of catalog query filters"""
+    min_price: Optional[int] = None
+    max_price: Optional[int] = None
+    in_stock: Optional[bool] = None
+    user_id: Optional[int] = None
+    category_ids: List[int] = []
+    ingredient_ids: List[int] = []
+    exclude_ingredient_ids: List[int] = []
+    query: Optional[str] = None
+
+
+class CatalogPage(BaseModel):
+    """Validation scheme to response page of catalog query"""
+    results: List[SweetResponse]
+    next_cursor: Optional[str]
+
 
 class CategoryCreate(BaseModel):
     """Validation scheme to create category"""
@@ -49,6 +95,13 @@ class SweetCategoryResponse(BaseModel):
     category_id: int
 
 
+class SweetLinksDiff(BaseModel):
+    """Validation scheme to response changes of categories or ingredients of sweet"""
+    sweet_id: int
+    added: List[int]
+    removed: List[int]
+
+
 class IngredientCreate(BaseModel):
     """Validation scheme to create ingredient"""
     title: str = "Название ингредиента"
@@ -70,3 +123,76 @@ class SweetIngredientResponse(BaseModel):
     """Validation scheme to response to ingredient of sweet"""
     sweet_id: int
     ingredient_id: int
+
+
+class FacetResponse(BaseModel):
+    """Validation scheme to response category or ingredient with count of its sweets"""
+    id: int
+    title: str
+    count: int
+
+
+class FacetsResponse(BaseModel):
+    """Validation scheme to response sweet counts of categories and ingredients"""
+    version: int
+    categories: List[FacetResponse]
+    ingredients: List[FacetResponse]
+
+
+class SweetMatch(BaseModel):
+    """Validation scheme to response sweet matching available ingredients"""
+    sweet: SweetResponse
+    matched: int
+    missing: int
+
+
+class SimilarSweet(BaseModel):
+    """Validation scheme to response sweet similar to another one"""
+    sweet: SweetResponse
+    similarity: float
+
+
+class PriceBucket(BaseModel):
+    """Validation scheme to response count of sweets in a price range"""
+    min_price: int
+    max_price: int
+    count: int
+
+
+class PriceStats(BaseModel):
+    """Validation scheme to response statistics of prices of sweets"""
+    count: int
+    min: Optional[int]
+    max: Optional[int]
+    median: Optional[float]
+    buckets: List[PriceBucket]
+
+
+class SweetImport(BaseModel):
+    """Validation scheme of a sweet in bulk import"""
+    title: str = Field(min_length=1)
+    description: str = ""
+    price: int = Field(ge=0)
+    in_stock: bool = True
+    categories: List[str] = []
+    ingredients: List[str] = []
+
+    @validator("categories", "ingredients", pre=True)
+    def split_titles(cls, value):
+        """ CSV cells hold titles separated by semicolons """
+        if isinstance(value, str):
+            return [title.strip() for title in value.split(";") if title.strip()]
+        return value
+
+
+class SweetImportError(BaseModel):
+    """Validation scheme to response rejected row of bulk import"""
+    line: int
+    error: str
+
+
+class SweetImportResult(BaseModel):
+    """Validation scheme to response result of bulk import"""
+    imported: int
+    rejected: int
+    errors: List[SweetImportError]
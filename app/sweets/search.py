@@ -0,0 +1,355 @@
+"""
+Full text search over sweets.
+
+Every sweet has a `SweetSearch` document with its title, description and
+titles of its categories and ingredients (tags). Documents are written by
+`index_sweets`/`unindex_sweets`, which `db_manager` calls in the same
+transaction as the change of a sweet or its links.
+
+On PostgreSQL the document carries a weighted `tsvector` (title A,
+description B, tags C) served by a GIN index, plus a trigram index on the
+title for partial words; results are ranked by `ts_rank_cd`. Other
+databases (SQLite in tests) are served by `InvertedIndex`, an in-process
+index loaded from the documents on first use. Its changes wait in the
+session until the documents are committed and are dropped on rollback.
+"""
+import bisect
+import math
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, event, func, or_, literal_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.app_config import settings
+from app.sweets.models import Sweet, SweetCard, SweetSearch, SweetCategory, Category, SweetIngredient, Ingredient
+
+# Relative weights of document fields, same as default weights of ts_rank_cd for A, B, C
+FIELD_WEIGHTS = {"title": 1.0, "description": 0.4, "tags": 0.2}
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits a text into lowercase word tokens.
+
+    Returns: List of tokens.
+    """
+    return TOKEN_RE.findall(text.lower())
+
+
+class InvertedIndex:
+    """In-process inverted index of sweet documents"""
+
+    def __init__(self):
+        self.loaded = False
+        # token -> {sweet_id: weighted term frequency}
+        self.postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        # sweet_id -> tokens of its document
+        self.documents: Dict[int, set] = {}
+        # Sorted vocabulary for prefix lookups
+        self.vocabulary: List[str] = []
+
+    def add(self, sweet_id: int, fields: Dict[str, str]):
+        self.remove(sweet_id)
+        weights = defaultdict(float)
+        for field, text in fields.items():
+            for token in tokenize(text):
+                weights[token] += FIELD_WEIGHTS[field]
+        for token, weight in weights.items():
+            if token not in self.postings:
+                bisect.insort(self.vocabulary, token)
+            self.postings[token][sweet_id] = weight
+        self.documents[sweet_id] = set(weights)
+
+    def remove(self, sweet_id: int):
+        for token in self.documents.pop(sweet_id, ()):
+            postings = self.postings[token]
+            postings.pop(sweet_id, None)
+            if not postings:
+                del self.postings[token]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, token)]
+
+    def clear(self):
+        self.__init__()
+
+    def _expand(self, token: str) -> Iterable[str]:
+        # Query tokens match index tokens they are a prefix of
+        start = bisect.bisect_left(self.vocabulary, token)
+        for word in self.vocabulary[start:]:
+            if not word.startswith(token):
+                break
+            yield word
+
+    def search(self, query: str) -> List[Tuple[int, float]]:
+        """
+        Finds documents containing every token of the query (as a word prefix).
+
+        Returns: List of (sweet_id, score) sorted by descending score.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        scores: Optional[Dict[int, float]] = None
+        total = len(self.documents)
+        for token in tokens:
+            matches = defaultdict(float)
+            for word in self._expand(token):
+                postings = self.postings[word]
+                idf = math.log(1 + total / len(postings))
+                for sweet_id, weight in postings.items():
+                    matches[sweet_id] = max(matches[sweet_id], weight * idf)
+            if scores is None:
+                scores = dict(matches)
+            else:
+                scores = {sweet_id: score + matches[sweet_id]
+                          for sweet_id, score in scores.items() if sweet_id in matches}
+            if not scores:
+                return []
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+inverted_index = InvertedIndex()
+
+
+def _is_postgres(session: AsyncSession) -> bool:
+    return session.bind.dialect.name == "postgresql"
+
+
+def _ts_config():
+    # SEARCH_LANGUAGE is validated as a bare identifier by Settings
+    return literal_column(f"'{settings.SEARCH_LANGUAGE}'::regconfig")
+
+
+def _search_vector(row: dict):
+    config = _ts_config()
+    vectors = [
+        func.setweight(func.to_tsvector(config, row[field]), weight)
+        for field, weight in (("title", "A"), ("description", "B"), ("tags", "C"))
+    ]
+    return vectors[0].op("||")(vectors[1]).op("||")(vectors[2])
+
+
+# Session info key of documents changed in the transaction, sweet ID -> fields or None if removed
+PENDING_DOCUMENTS = "search_pending_documents"
+
+
+def _pending_documents(session: AsyncSession) -> Dict[int, Optional[dict]]:
+    return session.info.setdefault(PENDING_DOCUMENTS, {})
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending_documents(session):
+    pending = session.info.pop(PENDING_DOCUMENTS, None)
+    if not pending:
+        return
+    for sweet_id, fields in pending.items():
+        if fields is None:
+            inverted_index.remove(sweet_id)
+        elif inverted_index.loaded:
+            inverted_index.add(sweet_id, fields)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_documents(session):
+    session.info.pop(PENDING_DOCUMENTS, None)
+
+
+async def index_sweets(sweet_ids: Iterable[int], session: AsyncSession):
+    """
+    Builds search documents of sweets, the caller commits the session.
+
+    Args:
+     - sweet_ids (list): IDs of the sweets to index.
+     - session (AsyncSession): SQLAlchemy database session.
+    """
+    sweet_ids = sorted(set(sweet_ids))
+    if not sweet_ids:
+        return
+
+    results = await session.exec(
+        select(Sweet.id, Sweet.title, Sweet.description).where(Sweet.id.in_(sweet_ids))
+    )
+    rows = {sweet_id: {"sweet_id": sweet_id, "title": title, "description": description, "tags": []}
+            for sweet_id, title, description in results.all()}
+    if not rows:
+        return
+
+    for link, model, key in ((SweetCategory, Category, SweetCategory.category_id),
+                             (SweetIngredient, Ingredient, SweetIngredient.ingredient_id)):
+        results = await session.exec(
+            select(link.sweet_id, model.title)
+            .join(model, model.id == key)
+            .where(link.sweet_id.in_(list(rows)))
+        )
+        for sweet_id, title in results.all():
+            rows[sweet_id]["tags"].append(title)
+    for row in rows.values():
+        row["tags"] = " ".join(row["tags"])
+
+    if _is_postgres(session):
+        statement = pg_insert(SweetSearch).values(
+            [{**row, "search_vector": _search_vector(row)} for row in rows.values()]
+        )
+    else:
+        statement = sqlite_insert(SweetSearch).values(list(rows.values()))
+    statement = statement.on_conflict_do_update(
+        index_elements=[SweetSearch.sweet_id],
+        set_={column: statement.excluded[column]
+              for column in ("title", "description", "tags", "search_vector")},
+    )
+    await session.execute(statement)
+
+    pending = _pending_documents(session)
+    for sweet_id, row in rows.items():
+        pending[sweet_id] = {field: row[field] for field in FIELD_WEIGHTS}
+
+
+async def unindex_sweets(sweet_ids: Iterable[int], session: AsyncSession):
+    """
+    Removes search documents of sweets, must run before the sweets are deleted.
+
+    Args:
+     - sweet_ids (list): IDs of the sweets.
+     - session (AsyncSession): SQLAlchemy database session.
+    """
+    sweet_ids = list(sweet_ids)
+    await session.execute(delete(SweetSearch).where(SweetSearch.sweet_id.in_(sweet_ids)))
+    pending = _pending_documents(session)
+    for sweet_id in sweet_ids:
+        pending[sweet_id] = None
+
+
+async def index_missing_sweets(session: AsyncSession, batch_size: int = 1000):
+    """
+    Indexes sweets without a search document, e.g. created through the admin panel.
+
+    Args:
+     - session (AsyncSession): SQLAlchemy database session.
+     - batch_size (int): Number of sweets indexed per statement.
+
+    Returns: Number of indexed sweets.
+    """
+    indexed = 0
+    last_id = 0
+    while True:
+        results = await session.exec(
+            select(Sweet.id)
+            .outerjoin(SweetSearch, SweetSearch.sweet_id == Sweet.id)
+            .where(SweetSearch.sweet_id.is_(None), Sweet.id > last_id)
+            .order_by(Sweet.id)
+            .limit(batch_size)
+        )
+        sweet_ids = results.all()
+        if not sweet_ids:
+            break
+        await index_sweets(sweet_ids, session)
+        await session.commit()
+        indexed += len(sweet_ids)
+        last_id = sweet_ids[-1]
+    return indexed
+
+
+async def _load_inverted_index(session: AsyncSession):
+    inverted_index.clear()
+    results = await session.exec(
+        select(SweetSearch.sweet_id, SweetSearch.title, SweetSearch.description, SweetSearch.tags)
+    )
+    for sweet_id, title, description, tags in results.all():
+        inverted_index.add(sweet_id, {"title": title, "description": description, "tags": tags})
+    inverted_index.loaded = True
+
+
+def _like_pattern(search_query: str) -> str:
+    # Wildcards typed by the user match themselves
+    escaped = search_query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _match_postgres(search_query: str):
+    tsquery = func.websearch_to_tsquery(_ts_config(), search_query)
+    return or_(SweetSearch.search_vector.op("@@")(tsquery),
+               SweetSearch.title.ilike(_like_pattern(search_query), escape="\\"))
+
+
+async def _search_postgres(search_query: str, session: AsyncSession, offset: int, limit: int):
+    tsquery = func.websearch_to_tsquery(_ts_config(), search_query)
+    rank = func.ts_rank_cd(SweetSearch.search_vector, tsquery)
+    similarity = func.word_similarity(search_query, SweetSearch.title)
+    query = (select(SweetSearch.sweet_id)
+             .where(_match_postgres(search_query))
+             .order_by(rank.desc(), similarity.desc(), SweetSearch.sweet_id)
+             .offset(offset)
+             .limit(limit))
+    results = await session.exec(query)
+    return results.all()
+
+
+async def search_sweet_ids(search_query: str, session: AsyncSession, offset: int = 0, limit: int = 10):
+    """
+    Finds IDs of sweets matching a search query.
+
+    Args:
+     - search_query (str): Search query string.
+     - session (AsyncSession): SQLAlchemy database session.
+     - offset (int): Number of best matches to skip.
+     - limit (int): Maximum number of returned IDs.
+
+    Returns: List of sweet IDs ordered by relevance.
+    """
+    if not tokenize(search_query):
+        return []
+    if _is_postgres(session):
+        return await _search_postgres(search_query, session, offset, limit)
+
+    if not inverted_index.loaded:
+        await _load_inverted_index(session)
+    return [sweet_id for sweet_id, _ in inverted_index.search(search_query)[offset:offset + limit]]
+
+
+async def search_condition(search_query: str, session: AsyncSession):
+    """
+    Builds a condition on `SweetCard` matching a search query, to combine with other filters.
+
+    On PostgreSQL the condition is a subquery over search documents; other
+    databases get IDs matched by the in-process index.
+
+    Args:
+     - search_query (str): Search query string.
+     - session (AsyncSession): SQLAlchemy database session.
+
+    Returns: SQL expression.
+    """
+    if _is_postgres(session):
+        return SweetCard.id.in_(select(SweetSearch.sweet_id).where(_match_postgres(search_query)))
+
+    if not inverted_index.loaded:
+        await _load_inverted_index(session)
+    return SweetCard.id.in_([sweet_id for sweet_id, _ in inverted_index.search(search_query)])
+
+
+async def search_sweets(search_query: str, session: AsyncSession, offset: int = 0, limit: int = 10):
+    """
+    Finds sweets matching a search query.
+
+    Args:
+     - search_query (str): Search query string.
+     - session (AsyncSession): SQLAlchemy database session.
+     - offset (int): Number of best matches to skip.
+     - limit (int): Maximum number of returned sweets.
+
+    Returns: List of SweetCard objects ordered by relevance.
+    """
+    sweet_ids = await search_sweet_ids(search_query, session, offset, limit)
+    if not sweet_ids:
+        return []
+    results = await session.exec(select(SweetCard).where(SweetCard.id.in_(sweet_ids)))
+    sweets = {sweet.id: sweet for sweet in results.all()}
+    return [sweets[sweet_id] for sweet_id in sweet_ids if sweet_id in sweets]
@@ -1,7 +1,9 @@
 from sqladmin import ModelView
 
+from app.users.cache import token_cache
+from app.users.signed_tokens import revocation_list
 from app.users.models import User, Token
-from app.users.security import get_random_string, hash_password
+from app.users.security import make_password_async
 
 
 class UserAdmin(ModelView, model=User):
@@ -11,14 +13,30 @@ class UserAdmin(ModelView, model=User):
                    User.hashed_password]
 
     async def insert_model(self, request, data):
-        salt = get_random_string()
-        hashed_password = hash_password(data["hashed_password"], salt)
-        data["hashed_password"] = f"{salt}${hashed_password}"
+        data["hashed_password"] = await make_password_async(data["hashed_password"])
         return await super().insert_model(request, data)
 
+    async def after_model_change(self, data, model, is_created):
+        # Deactivated or edited users must not be served from the cache
+        if not is_created:
+            token_cache.invalidate_user(model.id)
+            revocation_list.revoke_user(model.id)
+
+    async def after_model_delete(self, model):
+        token_cache.invalidate_user(model.id)
+        revocation_list.revoke_user(model.id)
+
 
 class TokenAdmin(ModelView, model=Token):
     column_list = [Token.token,
                    Token.user_id,
                    Token.token_type,
                    Token.expires]
+
+    async def after_model_change(self, data, model, is_created):
+        token_cache.invalidate_token(str(model.token))
+        token_cache.invalidate_user(model.user_id)
+
+    async def after_model_delete(self, model):
+        token_cache.invalidate_token(str(model.token))
+        token_cache.invalidate_user(model.user_id)
@@ -0,0 +1,94 @@
+"""
+In-process cache of authenticated users.
+
+Maps bearer tokens to the user row loaded by `db_manager.get_user_by_token`,
+so authenticated requests don't hit the database on every call. An entry
+lives until the earliest of the cache TTL and `Token.expires`, the cache
+is bounded by evicting least recently used tokens, and entries are
+dropped explicitly when a token is revoked or its user is changed.
+"""
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+
+from app.core.app_config import settings
+
+
+class TokenCache:
+    """LRU cache of token -> user with per-entry expiration"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        # token -> (user row, monotonic deadline)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._tokens_of_user: Dict[int, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token: str) -> Optional[Any]:
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        user, deadline = entry
+        if deadline <= time.monotonic():
+            self._pop(token)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return user
+
+    def set(self, token: str, user: Any, expires: datetime):
+        if self.max_size <= 0:
+            return
+        # Token.expires is a naive local time, see db_manager.create_user_token
+        lifetime = min(self.ttl, (expires - datetime.now()).total_seconds())
+        if lifetime <= 0:
+            return
+        self._pop(token)
+        self._entries[token] = (user, time.monotonic() + lifetime)
+        self._tokens_of_user.setdefault(user[0].id, set()).add(token)
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries))
+            self._pop(oldest)
+            self.evictions += 1
+
+    def invalidate_token(self, token: str):
+        self._pop(token)
+
+    def invalidate_user(self, user_id: int):
+        for token in list(self._tokens_of_user.get(user_id, ())):
+            self._pop(token)
+
+    def clear(self):
+        self._entries.clear()
+        self._tokens_of_user.clear()
+
+    def _pop(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        user_id = entry[0][0].id
+        tokens = self._tokens_of_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_of_user[user_id]
+
+    def stats(self) -> dict:
+        requests = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / requests if requests else 0.0,
+        }
+
+
+token_cache = TokenCache(max_size=settings.TOKEN_CACHE_SIZE, ttl=settings.TOKEN_CACHE_TTL)
@@ -1,31 +1,35 @@
+import uuid
 from datetime import datetime, timedelta
+from typing import AsyncIterator, List, Optional
 
-from sqlalchemy import select
-from sqlmodel import Session
+from sqlalchemy import delete, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.users.models import UserCreate, User, Token
-from app.users.security import get_random_string, hash_password
+from app.core.app_config import settings
+from app.core.db_config import read_session
+from app.core.pagination import encode_cursor, decode_cursor
+from app.users.cache import token_cache
+from app.users.models import UserCreate, User, Token, UserBase
+from app.users.security import make_password_async
 
 
-def create_user(user: UserCreate, session: Session):
+async def create_user(user: UserCreate, session: AsyncSession):
     """
     Creates a new user.
 
     Returns: Dictionary containing the user details and token information.
     """
-    salt = get_random_string()
-    hashed_password = hash_password(user.password, salt)
     new_user = User(
         name=user.name,
         email=user.email,
-        hashed_password=f"{salt}${hashed_password}",
+        hashed_password=await make_password_async(user.password),
     )
 
     session.add(new_user)
-    session.commit()
-    session.refresh(new_user)
+    await session.commit()
+    await session.refresh(new_user)
 
-    token = create_user_token(new_user.id, session)
+    token = await create_user_token(new_user.id, session)
 
     token_dict = {
         "token": token.token,
@@ -43,7 +47,7 @@ def create_user(user: UserCreate, session: Session):
     return user_dict
 
 
-def create_user_token(user_id: int, session: Session):
+async def create_user_token(user_id: int, session: AsyncSession):
     """
     Creates a new token for a user.
 
@@ -51,52 +55,200 @@ def create_user_token(user_id: int, session: Session):
     """
     new_user_token = Token(
         user_id=user_id,
-        expires=datetime.now() + timedelta(weeks=2)
+        expires=datetime.now() + timedelta(days=settings.TOKEN_LIFETIME_DAYS)
     )
     session.add(new_user_token)
-    session.commit()
-    session.refresh(new_user_token)
+    await session.commit()
+    await session.refresh(new_user_token)
 
     return new_user_token
 
 
-def get_user_by_token(token: str, session: Session):
+async def get_or_create_user_token(user_id: int, session: AsyncSession):
+    """
+    Retrieves a token of a user for a login.
+
+    The token expiring last is reused while it has at least
+    `settings.TOKEN_REUSE_MIN_DAYS` left, so repeated logins don't add rows;
+    otherwise a new token is created.
+
+    Returns: Token object.
+    """
+    query = (select(Token)
+             .where(Token.user_id == user_id)
+             .where(Token.expires > datetime.now() + timedelta(days=settings.TOKEN_REUSE_MIN_DAYS))
+             .order_by(Token.expires.desc())
+             .limit(1))
+    result = await session.execute(query)
+    token = result.scalars().first()
+    if token is not None:
+        return token
+    return await create_user_token(user_id, session)
+
+
+async def revoke_token(token: str, session: AsyncSession) -> bool:
+    """
+    Deletes a token and drops it from the token cache.
+
+    Returns: True if the token existed.
+    """
+    try:
+        token = str(uuid.UUID(token))
+    except ValueError:
+        return False
+
+    result = await session.execute(delete(Token).where(Token.token == token))
+    await session.commit()
+    token_cache.invalidate_token(token)
+    return result.rowcount > 0
+
+
+async def revoke_user_tokens(user_id: int, session: AsyncSession) -> int:
+    """
+    Deletes all tokens of a user and drops them from the token cache.
+
+    Returns: Number of deleted tokens.
+    """
+    result = await session.execute(delete(Token).where(Token.user_id == user_id))
+    await session.commit()
+    token_cache.invalidate_user(user_id)
+    return result.rowcount
+
+
+async def delete_expired_tokens(session: AsyncSession, batch_size: int = 1000) -> int:
+    """
+    Deletes one batch of expired tokens in its own short transaction.
+
+    On PostgreSQL rows locked by other transactions are skipped, so
+    concurrent sweepers and logins don't wait on each other.
+
+    Returns: Number of deleted tokens.
+    """
+    expired = (select(Token.id)
+               .where(Token.expires <= datetime.now())
+               .limit(batch_size)
+               .with_for_update(skip_locked=True))
+    result = await session.execute(delete(Token).where(Token.id.in_(expired.scalar_subquery()))
+                                   .execution_options(synchronize_session=False))
+    await session.commit()
+    return result.rowcount
+
+
+async def get_user_by_token(token: str, session: AsyncSession):
     """
     Retrieves a user by token.
 
+    Users are served from the in-process token cache, on a miss the token
+    and its user are loaded with one joined query.
+
     Returns: User object or None if not found.
     """
-    query = select(Token).where(Token.token == token).where(Token.expires > datetime.now())
-    results = session.exec(query)
-    t_token = results.one_or_none()
-    token = t_token[0]
-
-    query = select(User).where(User.id == token.user_id)
-    results = session.exec(query)
-    user = results.one_or_none()
+    try:
+        token = str(uuid.UUID(token))
+    except ValueError:
+        return None
+
+    user = token_cache.get(token)
+    if user is not None:
+        return user
+
+    query = (select(User, Token.expires)
+             .join(Token, Token.user_id == User.id)
+             .where(Token.token == token)
+             .where(Token.expires > datetime.now()))
+    results = await session.exec(query)
+    user = results.first()
+    if user is not None:
+        token_cache.set(token, user, expires=user.expires)
 
     return user
 
 
-def get_user_by_id(user_id: int, session: Session):
+async def get_user_by_id(user_id: int, session: AsyncSession):
     """
     Retrieves a user by ID.
 
     Returns: User object or None if not found.
     """
     query = select(User).where(User.id == user_id)
-    result = session.exec(query)
+    result = await session.exec(query)
     scalar_obj = result.one_or_none()
     return scalar_obj
 
 
-def get_user_by_email(email: str, session: Session):
+async def get_user_by_email(email: str, session: AsyncSession):
     """
     Retrieves a user by email.
 
     Returns: User object or None if not found.
     """
     query = select(User).where(User.email == email)
-    result = session.exec(query)
+    result = await session.exec(query)
     user = result.one_or_none()
     return user
+
+
+async def rehash_user_password(user: User, password: str, session: AsyncSession):
+    """
+    Stores a password hash of a user made with current hashing settings.
+
+    Returns: Updated User object.
+    """
+    user.hashed_password = await make_password_async(password)
+    session.add(user)
+    await session.commit()
+    return user
+
+
+# Public columns of users, listings never load password hashes
+USER_COLUMNS = (User.id, User.email, User.name)
+
+
+async def get_users_after(cursor: Optional[str], session: AsyncSession, per_page: int = 50):
+    """
+    Retrieves a page of users ordered by ID with keyset pagination.
+
+    Args:
+     - cursor (str, optional): Cursor of the previous page, None for the first page.
+     - session (AsyncSession): SQLAlchemy database session.
+     - per_page (int): Number of users per page.
+
+    Returns: Tuple of list of UserBase objects and cursor of the next page (None on the last page).
+
+    Raises: ValueError: If the cursor is malformed.
+    """
+    query = select(*USER_COLUMNS).order_by(User.id).limit(per_page + 1)
+    if cursor is not None:
+        last_id = decode_cursor(cursor).get("id")
+        if not isinstance(last_id, int):
+            raise ValueError("Malformed cursor")
+        query = query.where(User.id > last_id)
+
+    results = await session.execute(query)
+    users = [UserBase(id=row.id, email=row.email, name=row.name) for row in results]
+
+    next_cursor = None
+    if len(users) > per_page:
+        users = users[:per_page]
+        next_cursor = encode_cursor({"id": users[-1].id})
+    return users, next_cursor
+
+
+async def stream_users(batch_size: int = 1000) -> AsyncIterator[List[dict]]:
+    """
+    Streams public columns of all users ordered by ID.
+
+    Rows are fetched from a server-side cursor in batches, so memory doesn't
+    grow with the number of users. Uses its own read-only session, as the
+    response outlives the request handler.
+
+    Args:
+     - batch_size (int): Rows fetched from the cursor at a time.
+
+    Returns: Async iterator over lists of user dictionaries.
+    """
+    query = select(*USER_COLUMNS).order_by(User.id).execution_options(yield_per=batch_size)
+    async with read_session() as session:
+        results = await session.stream(query)
+        async for rows in results.mappings().partitions(batch_size):
+            yield [dict(row) for row in rows]
@@ -1,16 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
+import json
+from typing import Optional, Union
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.core.db_config import get_session
+from app.core.app_config import settings
+from app.core import dependencies
+from app.core.db_config import get_session, get_read_session
 from app.core.dependencies import get_current_user
-from app.users import models, security as security_utils, db_manager
-from app.users.models import User, UserBase, UserCreate
+from app.users import models, security as security_utils, db_manager, signed_tokens
+from app.users.cache import token_cache
+from app.users.models import UserCreate, UsersPage
 
 auth_router = APIRouter()
 
 @auth_router.post("/sign_up")
-def create_user(user: UserCreate, session: Session = Depends(get_session)):
+async def create_user(user: UserCreate, session: AsyncSession = Depends(get_session)):
     """
     **Sign-up a user with email and password.**
 
@@ -18,38 +25,83 @@ def create_user(user: UserCreate, session: Session = Depends(get_session)):
 
     Raises: HTTPException: If the email already registered.
     """
-    db_user = db_manager.get_user_by_email(user.email, session)
+    db_user = await db_manager.get_user_by_email(user.email, session)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    new_user = db_manager.create_user(user, session)
+    new_user = await db_manager.create_user(user, session)
     return new_user
 
-@auth_router.post("/auth", response_model=models.TokenBase)
-def authenticate_user(form_data: OAuth2PasswordRequestForm = Depends(), session: Session = Depends(get_session)):
+@auth_router.post("/auth", response_model=Union[models.TokenBase, models.SignedTokenBase])
+async def authenticate_user(form_data: OAuth2PasswordRequestForm = Depends(), session: AsyncSession = Depends(get_session)):
     """
     **Authenticates a user with email and password.**
 
+    Issues a database token, or a stateless signed one when `AUTH_TOKEN_MODE` is "signed".
+
     Returns: Dictionary containing access token, expiration time, and token type.
 
     Raises: HTTPException: If the email or password is incorrect.
     """
-    user = db_manager.get_user_by_email(email=form_data.username, session=session)
+    user = await db_manager.get_user_by_email(email=form_data.username, session=session)
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
 
-    if not security_utils.validate_password(
+    if not await security_utils.validate_password_async(
             password=form_data.password, hashed_password=user[0].hashed_password
     ):
         raise HTTPException(status_code=400, detail="Incorrect email or password")
-    token = db_manager.create_user_token(user_id=user[0].id, session=session)
+    if security_utils.needs_rehash(user[0].hashed_password):
+        await db_manager.rehash_user_password(user[0], form_data.password, session)
+    if settings.AUTH_TOKEN_MODE == "signed":
+        access_token, expires = signed_tokens.issue_token(user[0])
+        return {"access_token": access_token, "expires": expires, "token_type": "bearer"}
+    token = await db_manager.get_or_create_user_token(user_id=user[0].id, session=session)
     uuid_to_str = str(token.token)
     token_dict = {"access_token": uuid_to_str, "expires": token.expires, "token_type": token.token_type}
     return token_dict
 
 
+@auth_router.post("/logout")
+async def logout(everywhere: bool = False,
+                 token: str = Depends(dependencies.oauth2_scheme),
+                 current_user: models.User = Depends(dependencies.get_current_user),
+                 session: AsyncSession = Depends(get_session)):
+    """
+    **Revokes the token of the request, or all tokens of the current user.**
+
+    Logins reuse a valid token, so revoking it also ends other sessions that logged in with it.
+
+    Args:
+     - everywhere (bool, optional): Revoke all tokens of the user, logging out every session.
+
+    Returns: Dictionary containing the number of revoked tokens.
+    """
+    if everywhere:
+        signed_tokens.revocation_list.revoke_user(current_user[0].id)
+        revoked = await db_manager.revoke_user_tokens(current_user[0].id, session)
+    elif signed_tokens.is_signed_token(token):
+        revoked = int(signed_tokens.revoke_token(token))
+    else:
+        revoked = int(await db_manager.revoke_token(token, session))
+    return {"revoked": revoked}
+
+
+@auth_router.get("/auth/cache")
+async def get_token_cache_stats(current_user=Depends(dependencies.get_current_admin)):
+    """
+    **Retrieves statistics of the authentication cache**
+
+    Only users listed in `ADMIN_EMAILS` have access.
+
+    Returns: Dictionary containing size, hits, misses and evictions of the token cache
+    and sizes of the revocation list of signed tokens.
+    """
+    return {**token_cache.stats(), "revoked_signed": signed_tokens.revocation_list.stats()}
+
+
 @auth_router.get("/users/me")
-def get_current_user(current_user: models.User = Depends(get_current_user)):
+async def get_current_user(current_user: models.User = Depends(get_current_user)):
     """
     **Retrieves the current user.**
 
@@ -58,8 +110,25 @@ def get_current_user(current_user: models.User = Depends(get_current_user)):
     return current_user
 
 
+async def _users_ndjson():
+    async for users in db_manager.stream_users(batch_size=settings.BULK_CHUNK_SIZE):
+        yield "".join(json.dumps(user, ensure_ascii=False) + "\n" for user in users)
+
+
+@auth_router.get("/users/export")
+async def export_users(current_user=Depends(dependencies.get_current_admin)):
+    """
+    **Exports all users as NDJSON**
+
+    Only users listed in `ADMIN_EMAILS` have access.
+
+    Returns: Streamed file with ID, email and name of one user per line.
+    """
+    return StreamingResponse(_users_ndjson(), media_type="application/x-ndjson")
+
+
 @auth_router.get("/users/{user_id}")
-def get_user(user_id: int, session: Session = Depends(get_session)):
+async def get_user(user_id: int, session: AsyncSession = Depends(get_read_session)):
     """
     **Retrieves a user by ID.**
 
@@ -67,19 +136,31 @@ def get_user(user_id: int, session: Session = Depends(get_session)):
 
     Raises: HTTPException: If the user does not exist.
     """
-    user = db_manager.get_user_by_id(user_id, session)
+    user = await db_manager.get_user_by_id(user_id, session)
     if not user:
         raise HTTPException(status_code=404, detail=f"User {user_id} does not exist")
     return user
 
 
-@auth_router.get("/users", response_model=list[UserBase])
-def get_users(session: Session = Depends(get_session)):
+@auth_router.get("/users", response_model=UsersPage)
+async def get_users(cursor: Optional[str] = None,
+                    per_page: int = Query(settings.USERS_PER_PAGE, ge=1, le=settings.USERS_MAX_PER_PAGE),
+                    session: AsyncSession = Depends(get_read_session)):
     """
-    **Retrieves a list of users.**
+    **Retrieves a page of users ordered by ID.**
+
+    Pass `next_cursor` of the previous response as `cursor` to get the next page.
+
+    Args:
+     - cursor (str, optional): Cursor returned as `next_cursor` by the previous page.
+     - per_page (int, optional): Number of users per page.
+
+    Returns: Dictionary containing list of users and cursor of the next page.
 
-    Returns: List of User objects or empty list.
+    Raises: HTTPException: If the cursor is malformed.
     """
-    result = session.execute(select(User))
-    users = result.scalars().all()
-    return [UserBase(id=user.id, name=user.name, email=user.email) for user in users]
+    try:
+        users, next_cursor = await db_manager.get_users_after(cursor, session, per_page=per_page)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {"results": users, "next_cursor": next_cursor}
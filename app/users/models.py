@@ -1,7 +1,8 @@
 import uuid
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from pydantic import UUID4, validator
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field
 
 
@@ -13,12 +14,27 @@ class TokenBase(SQLModel):
     token_type: Optional[str] = "bearer"
 
 
+class SignedTokenBase(SQLModel):
+    """ Return response data of a signed token """
+    access_token: str
+    expires: datetime
+    token_type: str = "bearer"
+
+
 class Token(TokenBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
 
     class Config:
         orm_mode = True
 
+    __table_args__ = (
+        Index("ix_token_token", "token", unique=True),
+        # Reusable tokens of a user on login
+        Index("ix_token_user_id_expires", "user_id", "expires"),
+        # Expired tokens for the sweeper
+        Index("ix_token_expires", "expires"),
+    )
+
     @validator("token")
     def hexlify_token(cls, value):
         """ Convert UUID to pure hex string """
@@ -35,6 +51,12 @@ class UserBase(SQLModel):
         orm_mode = True
 
 
+class UsersPage(SQLModel):
+    """ Return a page of users """
+    results: List[UserBase]
+    next_cursor: Optional[str]
+
+
 class UserCreate(SQLModel):
     """ Validate request data """
     email: str = "root@root.com"
@@ -45,7 +67,7 @@ class UserCreate(SQLModel):
 class User(SQLModel, table=True):
     """ Return detailed response data with token """
     id: int = Field(default=None, primary_key=True)
-    email: str
+    email: str = Field(index=True, unique=True)
     name: str
     hashed_password: str = Field(nullable=False)
     is_active: bool = Field(default=True)
@@ -1,6 +1,27 @@
+import asyncio
 import hashlib
+import hmac
 import random
 import string
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core.app_config import settings
+
+HASH_ALGORITHM = "pbkdf2_sha256"
+
+# Cost of hashes in the legacy "salt$hash" format
+LEGACY_ITERATIONS = 100_000
+
+# PBKDF2 of hashlib releases the GIL, so hashing threads run in parallel
+# without blocking the event loop
+_hasher_pool = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS,
+                                  thread_name_prefix="password-hasher")
+# Running plus queued hashes, callers wait for a slot instead of piling up
+_hasher_slots = asyncio.Semaphore(settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE)
+
+
+class HasherOverloaded(Exception):
+    """Raised when too many password hashes are pending"""
 
 
 def get_random_string(length=12):
@@ -12,33 +33,108 @@ def get_random_string(length=12):
     return "".join(random.choice(string.ascii_letters) for _ in range(length))
 
 
-def hash_password(password: str, salt: str = None):
+def hash_password(password: str, salt: str = None, iterations: int = LEGACY_ITERATIONS):
     """
         Hashes a password using PBKDF2 algorithm.
 
         Args:
             password (str): Password to hash.
             salt (str): Salt to use for hashing. If None, a random salt is generated.
+            iterations (int): Number of PBKDF2 rounds.
 
         Returns:
             str: Hashed password string.
         """
     if salt is None:
         salt = get_random_string()
-    enc = hashlib.pbkdf2_hmac("sha256", password.encode(), salt.encode(), 100_000)
+    enc = hashlib.pbkdf2_hmac("sha256", password.encode(), salt.encode(), iterations)
     return enc.hex()
 
 
+def make_password(password: str, iterations: int = None):
+    """
+        Hashes a password into the versioned format `algorithm$iterations$salt$hash`.
+
+        Args:
+            password (str): Password to hash.
+            iterations (int): Number of PBKDF2 rounds. Defaults to `settings.PASSWORD_HASH_ITERATIONS`.
+
+        Returns:
+            str: Encoded password hash to store.
+        """
+    iterations = iterations or settings.PASSWORD_HASH_ITERATIONS
+    salt = get_random_string()
+    return f"{HASH_ALGORITHM}${iterations}${salt}${hash_password(password, salt, iterations)}"
+
+
+def _split_hash(hashed_password: str):
+    parts = hashed_password.split("$")
+    if len(parts) == 2:
+        salt, hashed = parts
+        return LEGACY_ITERATIONS, salt, hashed
+    algorithm, iterations, salt, hashed = parts
+    if algorithm != HASH_ALGORITHM:
+        raise ValueError(f"Unknown password hash algorithm {algorithm}")
+    return int(iterations), salt, hashed
+
+
 def validate_password(password: str, hashed_password: str):
     """
         Validates a password against a hashed password.
 
         Args:
             password (str): Password to validate.
-            hashed_password (str): Hashed password string.
+            hashed_password (str): Hashed password string, versioned or legacy `salt$hash`.
 
         Returns:
             bool: True if password matches the hashed password, False otherwise.
         """
-    salt, hashed = hashed_password.split("$")
-    return hash_password(password, salt) == hashed
+    iterations, salt, hashed = _split_hash(hashed_password)
+    return hmac.compare_digest(hash_password(password, salt, iterations), hashed)
+
+
+def needs_rehash(hashed_password: str):
+    """
+        Checks whether a hashed password uses outdated format or cost.
+
+        Args:
+            hashed_password (str): Hashed password string.
+
+        Returns:
+            bool: True if the password should be hashed again with current settings.
+        """
+    if not hashed_password.startswith(f"{HASH_ALGORITHM}$"):
+        return True
+    iterations, _, _ = _split_hash(hashed_password)
+    return iterations != settings.PASSWORD_HASH_ITERATIONS
+
+
+async def _run_in_hasher(func, *args):
+    try:
+        await asyncio.wait_for(_hasher_slots.acquire(), timeout=settings.PASSWORD_HASH_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HasherOverloaded("Too many password hashes are pending")
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hasher_pool, func, *args)
+    finally:
+        _hasher_slots.release()
+
+
+async def make_password_async(password: str):
+    """
+        Hashes a password on the hashing pool, see `make_password`.
+
+        Raises:
+            HasherOverloaded: If the pool queue stays full for PASSWORD_HASH_TIMEOUT seconds.
+        """
+    return await _run_in_hasher(make_password, password)
+
+
+async def validate_password_async(password: str, hashed_password: str):
+    """
+        Validates a password on the hashing pool, see `validate_password`.
+
+        Raises:
+            HasherOverloaded: If the pool queue stays full for PASSWORD_HASH_TIMEOUT seconds.
+        """
+    return await _run_in_hasher(validate_password, password, hashed_password)
@@ -0,0 +1,155 @@
+"""
+Stateless signed access tokens.
+
+With `AUTH_TOKEN_MODE = "signed"` logins issue HS256 JSON Web Tokens signed
+with `SECRET_KEY`. A token carries ID, email and name of the user and lives
+`SIGNED_TOKEN_LIFETIME` seconds; it is verified in-process, without a
+database round trip.
+
+Revoked tokens are remembered in memory until they expire. The list is not
+shared between processes, which is why signed tokens are short-lived:
+a token revoked in one worker stays valid in others until it expires.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.engine.result import result_tuple
+
+from app.core.app_config import settings
+from app.users.models import User
+
+HEADER = {"alg": "HS256", "typ": "JWT"}
+
+# Rows of the same shape as rows of `db_manager.get_user_by_token`
+_user_row = result_tuple(["User", "expires"])
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _b64decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+
+def _sign(message: bytes) -> str:
+    return _b64encode(hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).digest())
+
+
+class RevocationList:
+    """In-memory revoked tokens and users, kept until their tokens expire"""
+
+    def __init__(self, lifetime: float):
+        self.lifetime = lifetime
+        # token ID -> expiration timestamp
+        self._tokens: Dict[str, float] = {}
+        # user ID -> timestamp, tokens issued before it are revoked
+        self._users: Dict[int, float] = {}
+
+    def revoke_token(self, jti: str, expires: float):
+        self._prune()
+        self._tokens[jti] = expires
+
+    def revoke_user(self, user_id: int):
+        self._prune()
+        self._users[user_id] = time.time()
+
+    def is_revoked(self, claims: dict) -> bool:
+        if claims["jti"] in self._tokens:
+            return True
+        revoked_at = self._users.get(claims["sub"])
+        return revoked_at is not None and claims["iat"] <= revoked_at
+
+    def _prune(self):
+        now = time.time()
+        self._tokens = {jti: expires for jti, expires in self._tokens.items() if expires > now}
+        self._users = {user_id: revoked_at for user_id, revoked_at in self._users.items()
+                       if revoked_at + self.lifetime > now}
+
+    def clear(self):
+        self._tokens.clear()
+        self._users.clear()
+
+    def stats(self) -> dict:
+        return {"tokens": len(self._tokens), "users": len(self._users)}
+
+
+revocation_list = RevocationList(lifetime=settings.SIGNED_TOKEN_LIFETIME)
+
+
+def issue_token(user: User) -> Tuple[str, datetime]:
+    """
+    Issues a signed access token of a user.
+
+    Returns: Tuple of the token and its expiration time.
+    """
+    issued_at = time.time()
+    expires = issued_at + settings.SIGNED_TOKEN_LIFETIME
+    claims = {
+        "sub": user.id,
+        "email": user.email,
+        "name": user.name,
+        "iat": issued_at,
+        "exp": expires,
+        "jti": uuid.uuid4().hex,
+    }
+    message = ".".join(_b64encode(json.dumps(part, separators=(",", ":")).encode()) for part in (HEADER, claims))
+    # Naive local time, as `Token.expires`
+    return f"{message}.{_sign(message.encode())}", datetime.fromtimestamp(expires)
+
+
+def is_signed_token(token: str) -> bool:
+    return token.count(".") == 2
+
+
+def decode_token(token: str) -> Optional[dict]:
+    """
+    Verifies signature and expiration of a signed token.
+
+    Returns: Claims of the token or None if the token is invalid, expired or revoked.
+    """
+    try:
+        message, signature = token.rsplit(".", 1)
+        if not hmac.compare_digest(signature, _sign(message.encode())):
+            return None
+        header, payload = message.split(".")
+        if json.loads(_b64decode(header)) != HEADER:
+            return None
+        claims = json.loads(_b64decode(payload))
+        if claims["exp"] <= time.time() or revocation_list.is_revoked(claims):
+            return None
+    except (ValueError, TypeError, KeyError):
+        return None
+    return claims
+
+
+def get_user_by_token(token: str):
+    """
+    Builds the user of a signed token from its claims.
+
+    Returns: Row of a detached User object and the token expiration, or None if the token is not valid.
+    """
+    claims = decode_token(token)
+    if claims is None:
+        return None
+    user = User(id=claims["sub"], email=claims["email"], name=claims["name"], hashed_password="", is_active=True)
+    return _user_row((user, datetime.fromtimestamp(claims["exp"])))
+
+
+def revoke_token(token: str) -> bool:
+    """
+    Revokes a signed token until it expires.
+
+    Returns: True if the token was valid.
+    """
+    claims = decode_token(token)
+    if claims is None:
+        return False
+    revocation_list.revoke_token(claims["jti"], claims["exp"])
+    return True
@@ -0,0 +1,70 @@
+"""
+Background deletion of expired tokens.
+
+Tokens are never deleted on expiration, `TokenSweeper` removes them every
+`TOKEN_SWEEP_INTERVAL` seconds in batches of `TOKEN_SWEEP_BATCH` rows, one
+short transaction per batch, so the token table doesn't grow with history
+and no long lock is held. Running it in several processes is safe.
+"""
+import asyncio
+import logging
+from typing import Optional
+
+from app.core.app_config import settings
+from app.core.db_config import async_session
+from app.users import db_manager
+
+logger = logging.getLogger(__name__)
+
+
+class TokenSweeper:
+    """Periodic task deleting expired tokens"""
+
+    def __init__(self, interval: float, batch_size: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    async def sweep(self) -> int:
+        """
+        Deletes all expired tokens batch by batch.
+
+        Returns: Number of deleted tokens.
+        """
+        deleted = 0
+        while True:
+            async with async_session() as session:
+                count = await db_manager.delete_expired_tokens(session, self.batch_size)
+            deleted += count
+            if count < self.batch_size:
+                return deleted
+            # Let requests run between batches
+            await asyncio.sleep(0)
+
+    async def _run(self):
+        while True:
+            try:
+                deleted = await self.sweep()
+            except Exception:
+                logger.exception("Sweeping expired tokens failed")
+            else:
+                if deleted:
+                    logger.info("Deleted %d expired tokens", deleted)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+token_sweeper = TokenSweeper(interval=settings.TOKEN_SWEEP_INTERVAL, batch_size=settings.TOKEN_SWEEP_BATCH)
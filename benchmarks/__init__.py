@@ -0,0 +1,20 @@
+"""
+Benchmarks of the API.
+
+Seed a database with a synthetic catalog, then drive the routers of
+`app.main` in process with concurrent workers and save latency percentiles,
+throughput and SQL statements per request of every scenario as JSON:
+
+    python -m benchmarks seed --users 100 --sweets 50000 --reset
+    python -m benchmarks run --concurrency 8 --requests 500
+    python -m benchmarks compare benchmarks/results/old.json benchmarks/results/new.json
+    python -m benchmarks tokens
+    python -m benchmarks matching
+
+The database is taken from the application settings (`.env`), or from
+`--database-url` (e.g. `sqlite+aiosqlite:///benchmark.db`, which needs the
+aiosqlite driver). Seeding with `--expired-tokens-per-user` adds historic
+tokens, to check that authentication doesn't slow down as they pile up.
+Scenarios with a statement budget fail the run when a request issues more
+SQL statements than allowed.
+"""
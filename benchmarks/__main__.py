@@ -0,0 +1,144 @@
+"""
+Command line of the benchmarks, see `benchmarks/__init__.py`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+
+
+def _configure(args):
+    # Settings are read when app modules are imported, so the database URL
+    # is set before the first import
+    if args.database_url:
+        os.environ["DEFAULT_SQLALCHEMY_DATABASE_URI"] = args.database_url
+    os.environ.setdefault("DB_ECHO", "false")
+    # Runs must not delete the historic tokens they measure
+    os.environ.setdefault("TOKEN_SWEEP_INTERVAL", "0")
+
+
+def seed(args) -> int:
+    from app.core.db_config import engine
+    from benchmarks.seed import seed_catalog
+
+    async def main():
+        try:
+            return await seed_catalog(users=args.users, sweets=args.sweets, categories=args.categories,
+                                      ingredients=args.ingredients,
+                                      expired_tokens_per_user=args.expired_tokens_per_user,
+                                      reset=args.reset, seed=args.seed)
+        finally:
+            await engine.dispose()
+
+    try:
+        created = asyncio.run(main())
+    except RuntimeError as error:
+        print(error, file=sys.stderr)
+        return 1
+    print(json.dumps(created))
+    return 0
+
+
+def run(args) -> int:
+    from benchmarks.runner import run_benchmarks, save_results
+
+    results = asyncio.run(run_benchmarks(
+        names=args.scenario, writes=args.writes, requests=args.requests, concurrency=args.concurrency,
+        warmup=args.warmup, seed=args.seed, use_response_cache=args.response_cache,
+    ))
+    path = save_results(results, Path(args.output) if args.output else None)
+    print(f"Results saved to {path}")
+    over_budget = [result.name for result in results.scenarios if result.over_budget]
+    if over_budget:
+        print(f"SQL statement budget exceeded: {', '.join(over_budget)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def compare(args) -> int:
+    from benchmarks.runner import BenchmarkRun, compare_results
+
+    baseline = BenchmarkRun.parse_file(args.baseline)
+    current = BenchmarkRun.parse_file(args.current)
+    regressions = compare_results(baseline, current, threshold=args.threshold)
+    if regressions:
+        print(f"p95 latency regressed more than {args.threshold:.0%}: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def tokens(args) -> int:
+    from benchmarks.tokens import benchmark_token_lookups
+
+    results = asyncio.run(benchmark_token_lookups(iterations=args.iterations))
+    for method, summary in results.items():
+        print(f"{method:<10} mean {summary['mean_us']:>8.1f} us  p50 {summary['p50_us']:>8.1f} us  "
+              f"p95 {summary['p95_us']:>8.1f} us")
+    return 0
+
+
+def matching(args) -> int:
+    from benchmarks.matching import benchmark_ingredient_matching
+
+    try:
+        results = asyncio.run(benchmark_ingredient_matching(iterations=args.iterations, seed=args.seed))
+    except RuntimeError as error:
+        print(error, file=sys.stderr)
+        return 1
+    for method, summary in results.items():
+        print(f"{method:<10} mean {summary['mean_us']:>10.1f} us  p50 {summary['p50_us']:>10.1f} us  "
+              f"p95 {summary['p95_us']:>10.1f} us")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmarks of the API")
+    parser.add_argument("--database-url", help="SQLAlchemy URL of the database, the settings by default")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="Fill the database with a synthetic catalog")
+    seed_parser.add_argument("--users", type=int, default=100)
+    seed_parser.add_argument("--sweets", type=int, default=10_000)
+    seed_parser.add_argument("--categories", type=int, default=30)
+    seed_parser.add_argument("--ingredients", type=int, default=100)
+    seed_parser.add_argument("--expired-tokens-per-user", type=int, default=0,
+                             help="Historic expired tokens, to check that auth doesn't slow down with them")
+    seed_parser.add_argument("--reset", action="store_true", help="Drop and recreate all tables first")
+    seed_parser.add_argument("--seed", type=int, default=42)
+    seed_parser.set_defaults(handler=seed)
+
+    run_parser = commands.add_parser("run", help="Run scenarios and save results")
+    run_parser.add_argument("--scenario", action="append", help="Scenario to run, may be repeated")
+    run_parser.add_argument("--writes", action="store_true", help="Also run scenarios changing the catalog")
+    run_parser.add_argument("--requests", type=int, default=200, help="Measured requests per scenario")
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--warmup", type=int, default=10)
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--response-cache", action="store_true", help="Serve reads from the response cache")
+    run_parser.add_argument("--output", help="Results file, benchmarks/results/<time>-<commit>.json by default")
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands.add_parser("compare", help="Compare two results files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="Allowed p95 growth, 0.1 is 10%%")
+    compare_parser.set_defaults(handler=compare)
+
+    tokens_parser = commands.add_parser("tokens", help="Compare costs of authenticating a token")
+    tokens_parser.add_argument("--iterations", type=int, default=1000)
+    tokens_parser.set_defaults(handler=tokens)
+
+    matching_parser = commands.add_parser("matching", help="Compare ingredient matching with and without the index")
+    matching_parser.add_argument("--iterations", type=int, default=200)
+    matching_parser.add_argument("--seed", type=int, default=42)
+    matching_parser.set_defaults(handler=matching)
+
+    args = parser.parse_args(argv)
+    _configure(args)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
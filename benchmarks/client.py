@@ -0,0 +1,96 @@
+"""
+Minimal in-process ASGI client.
+
+Requests go straight to the application callable, without sockets, so
+benchmarks measure the application and not the HTTP stack. SQL statements
+of each request are counted through `RequestStats` of `app.core.metrics`.
+"""
+import asyncio
+import json
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from app.core.metrics import RequestStats, current_request_stats
+
+
+class Response:
+    """Response of the in-process client"""
+
+    def __init__(self, status_code: int, headers: List[Tuple[bytes, bytes]], body: bytes, statements: int):
+        self.status_code = status_code
+        self.headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in headers}
+        self.body = body
+        self.statements = statements
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class ASGIClient:
+    """Sends HTTP requests to an ASGI application in the same event loop"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def request(self, method: str, path: str, params: Optional[dict] = None,
+                      headers: Optional[Dict[str, str]] = None, body: bytes = b"") -> Response:
+        raw_headers = [(b"host", b"benchmark")]
+        raw_headers += [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                        for name, value in (headers or {}).items()]
+        if body:
+            raw_headers.append((b"content-length", str(len(body)).encode()))
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "query_string": urlencode(params or {}, doseq=True).encode(),
+            "headers": raw_headers,
+            "client": ("127.0.0.1", 50000),
+            "server": ("benchmark", 80),
+        }
+
+        request_sent = False
+        response_done = asyncio.Event()
+        start = {}
+        chunks = []
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            # Streaming responses listen for a disconnect, it comes after the response
+            await response_done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    response_done.set()
+
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        try:
+            await self.app(scope, receive, send)
+        except Exception:
+            # A server answers unhandled errors with 500 and keeps serving,
+            # e.g. "database is locked" of concurrent SQLite writers
+            start.setdefault("status", 500)
+        finally:
+            current_request_stats.reset(token)
+            response_done.set()
+        return Response(start.get("status", 500), start.get("headers", []), b"".join(chunks), stats.statements)
+
+    async def get(self, path: str, **kwargs) -> Response:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> Response:
+        return await self.request("POST", path, **kwargs)
@@ -0,0 +1,75 @@
+"""
+Cost of ingredient matching: the in-memory bitset index of
+`app.sweets.features` vs. the naive GROUP BY over the link table.
+"""
+import random
+import time
+from typing import List
+
+from sqlalchemy import case, func
+from sqlmodel import select
+
+from app.core.db_config import async_session, engine
+from app.sweets import db_manager
+from app.sweets.features import sweet_features
+from app.sweets.models import Ingredient, SweetIngredient
+from benchmarks.tokens import _summary
+
+LIMIT = 20
+
+
+def _group_by_query(ingredient_ids: List[int], exclude_ids: List[int], mode: str):
+    matched = func.sum(case((SweetIngredient.ingredient_id.in_(ingredient_ids), 1), else_=0))
+    excluded = func.sum(case((SweetIngredient.ingredient_id.in_(exclude_ids), 1), else_=0))
+    missing = func.count() - matched
+    return (select(SweetIngredient.sweet_id, matched, missing)
+            .group_by(SweetIngredient.sweet_id)
+            .having(excluded == 0)
+            .having(missing == 0 if mode == "subset" else matched > 0)
+            .order_by(matched.desc(), missing, SweetIngredient.sweet_id)
+            .limit(LIMIT))
+
+
+async def benchmark_ingredient_matching(iterations: int = 200, seed: int = 42) -> dict:
+    """
+    Matches random pantries of ingredients with both methods and checks that they agree.
+
+    Returns: Dictionary of method -> mean, p50 and p95 microseconds per query.
+
+    Raises: RuntimeError: If the database has no ingredients or the methods disagree.
+    """
+    rng = random.Random(seed)
+    try:
+        async with async_session() as session:
+            results = await session.exec(select(Ingredient.id))
+            ingredient_ids = results.all()
+            if not ingredient_ids:
+                raise RuntimeError("Seed the database first: python -m benchmarks seed")
+            queries = [(rng.sample(ingredient_ids, min(len(ingredient_ids), rng.randint(5, 30))),
+                        rng.sample(ingredient_ids, rng.randint(0, 2)),
+                        rng.choice(["subset", "overlap"])) for _ in range(iterations)]
+
+            started = time.perf_counter()
+            await db_manager.load_sweet_features(session)
+            build = time.perf_counter() - started
+
+            index_samples, sql_samples = [], []
+            for have, exclude, mode in queries:
+                started = time.perf_counter()
+                indexed = sweet_features.match_links(SweetIngredient, have, exclude, mode=mode, limit=LIMIT)
+                index_samples.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                results = await session.execute(_group_by_query(have, exclude, mode))
+                grouped = [tuple(row) for row in results.all()]
+                sql_samples.append(time.perf_counter() - started)
+
+                if indexed != grouped:
+                    raise RuntimeError(f"Methods disagree on {have}, {exclude}, {mode}")
+            return {
+                "index": _summary(index_samples),
+                "group_by": _summary(sql_samples),
+                "build": {"mean_us": build * 1e6, "p50_us": build * 1e6, "p95_us": build * 1e6},
+            }
+    finally:
+        await engine.dispose()
@@ -0,0 +1,243 @@
+"""
+Running of benchmark scenarios and comparison of saved results.
+"""
+import asyncio
+import math
+import platform
+import random
+import subprocess
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+from app.core.db_config import engine
+from app.core.http_cache import response_cache
+from app.main import app
+from benchmarks.client import ASGIClient
+from benchmarks.scenarios import SCENARIOS, BenchmarkContext, Scenario, load_context
+from benchmarks.seed import catalog_size
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+class ScenarioResult(BaseModel):
+    """Measurements of one scenario"""
+    name: str
+    requests: int
+    errors: int
+    statuses: Dict[str, int]
+    duration: float
+    throughput: float
+    # Milliseconds: p50, p95, p99, mean, max
+    latency: Dict[str, float]
+    # Per request: mean, max
+    statements: Dict[str, float]
+    max_statements: Optional[int]
+    over_budget: int
+    rows_per_second: Optional[float]
+
+
+class BenchmarkRun(BaseModel):
+    """Saved results of a benchmark run"""
+    meta: dict
+    scenarios: List[ScenarioResult]
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    Nearest-rank percentile of sorted values.
+
+    Returns: Value at the percentile, 0 for an empty list.
+    """
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True, cwd=Path(__file__).parent).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True, check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+
+async def run_scenario(client: ASGIClient, scenario: Scenario, ctx: BenchmarkContext,
+                       requests: int, concurrency: int, warmup: int, seed: int) -> ScenarioResult:
+    """
+    Sends requests of a scenario from concurrent workers.
+
+    Requests are generated up front from a generator seeded with the scenario
+    name, so every run sends the same requests.
+
+    Returns: ScenarioResult.
+    """
+    rng = random.Random(f"{seed}:{scenario.name}")
+    planned = [scenario.build(rng, ctx) for _ in range(warmup + requests)]
+
+    async def send(request: dict):
+        return await client.request(request.get("method", "GET"), request["path"],
+                                    params=request.get("params"), headers=request.get("headers"),
+                                    body=request.get("body", b""))
+
+    for request in planned[:warmup]:
+        await send(request)
+
+    queue = iter(planned[warmup:])
+    latencies: List[float] = []
+    statements: List[int] = []
+    statuses: Dict[str, int] = {}
+
+    async def worker():
+        for request in queue:
+            started = time.perf_counter()
+            response = await send(request)
+            latencies.append(time.perf_counter() - started)
+            statements.append(response.statements)
+            status = str(response.status_code)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - started
+
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+    over_budget = 0
+    if scenario.max_statements is not None:
+        over_budget = sum(1 for count in statements if count > scenario.max_statements)
+    return ScenarioResult(
+        name=scenario.name,
+        requests=len(latencies),
+        errors=errors,
+        statuses=statuses,
+        duration=duration,
+        throughput=len(latencies) / duration if duration else 0.0,
+        latency={
+            "p50": percentile(latencies, 0.50) * 1000,
+            "p95": percentile(latencies, 0.95) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+            "mean": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+            "max": latencies[-1] * 1000 if latencies else 0.0,
+        },
+        statements={
+            "mean": sum(statements) / len(statements) if statements else 0.0,
+            "max": max(statements, default=0),
+        },
+        max_statements=scenario.max_statements,
+        over_budget=over_budget,
+        rows_per_second=(scenario.rows_per_request * len(latencies) / duration
+                         if scenario.rows_per_request and duration else None),
+    )
+
+
+async def run_benchmarks(names: Optional[List[str]] = None, writes: bool = False, requests: int = 200,
+                         concurrency: int = 8, warmup: int = 10, seed: int = 42,
+                         use_response_cache: bool = False) -> BenchmarkRun:
+    """
+    Runs scenarios against the application on the configured database.
+
+    Args:
+     - names (list): Names of scenarios to run, all read scenarios by default.
+     - writes (bool): Also run scenarios changing the catalog.
+     - requests (int): Measured requests per scenario.
+     - concurrency (int): Concurrent workers.
+     - warmup (int): Requests per scenario sent before measuring.
+     - seed (int): Seed of generated request parameters.
+     - use_response_cache (bool): Serve public reads from the HTTP response cache.
+
+    Returns: BenchmarkRun.
+    """
+    scenarios = [scenario for scenario in SCENARIOS
+                 if (scenario.name in names if names else writes or not scenario.writes)]
+    response_cache.enabled = use_response_cache
+
+    await app.router.startup()
+    try:
+        ctx = await load_context()
+        client = ASGIClient(app)
+        results = []
+        for scenario in scenarios:
+            result = await run_scenario(client, scenario, ctx, requests, concurrency, warmup, seed)
+            results.append(result)
+            print(format_result(result), flush=True)
+        meta = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "database": engine.dialect.name,
+            "catalog": await catalog_size(),
+            "requests": requests,
+            "concurrency": concurrency,
+            "warmup": warmup,
+            "seed": seed,
+            "response_cache": use_response_cache,
+        }
+    finally:
+        await app.router.shutdown()
+        await engine.dispose()
+    return BenchmarkRun(meta=meta, scenarios=results)
+
+
+def format_result(result: ScenarioResult) -> str:
+    latency = result.latency
+    line = (f"{result.name:<24} {result.throughput:>9.1f} req/s  p50 {latency['p50']:>8.2f} ms  "
+            f"p95 {latency['p95']:>8.2f} ms  p99 {latency['p99']:>8.2f} ms  "
+            f"sql {result.statements['mean']:>5.1f}/{result.statements['max']:<3.0f}")
+    if result.rows_per_second is not None:
+        line += f"  {result.rows_per_second:.0f} rows/s"
+    if result.errors:
+        line += f"  errors {result.errors} {result.statuses}"
+    if result.over_budget:
+        line += f"  OVER BUDGET ({result.max_statements}) x{result.over_budget}"
+    return line
+
+
+def save_results(run: BenchmarkRun, path: Optional[Path] = None) -> Path:
+    """
+    Writes results as JSON, by default to `benchmarks/results/<time>-<commit>.json`.
+
+    Returns: Path of the file.
+    """
+    if path is None:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        path = RESULTS_DIR / f"{stamp}-{run.meta.get('git_commit') or 'unknown'}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(run.json(indent=2))
+    return path
+
+
+def compare_results(baseline: BenchmarkRun, current: BenchmarkRun, threshold: float = 0.1) -> List[str]:
+    """
+    Compares latency and throughput of scenarios present in both runs.
+
+    Args:
+     - baseline (BenchmarkRun): Earlier results.
+     - current (BenchmarkRun): New results.
+     - threshold (float): Allowed relative growth of p95 latency.
+
+    Returns: Names of scenarios whose p95 latency grew more than the threshold.
+    """
+    previous = {result.name: result for result in baseline.scenarios}
+    regressions = []
+    for result in current.scenarios:
+        old = previous.get(result.name)
+        if old is None:
+            continue
+        changes = []
+        for key in ("p50", "p95", "p99"):
+            change = (result.latency[key] / old.latency[key] - 1) if old.latency[key] else 0.0
+            changes.append(f"{key} {old.latency[key]:.2f} -> {result.latency[key]:.2f} ms ({change:+.0%})")
+        throughput = (result.throughput / old.throughput - 1) if old.throughput else 0.0
+        regressed = old.latency["p95"] and result.latency["p95"] > old.latency["p95"] * (1 + threshold)
+        print(f"{result.name:<24} {'  '.join(changes)}  throughput {throughput:+.0%}"
+              + ("  REGRESSION" if regressed else ""))
+        if regressed:
+            regressions.append(result.name)
+    return regressions
@@ -0,0 +1,185 @@
+"""
+Benchmark scenarios: requests to one endpoint with randomized parameters.
+
+`max_statements` is the SQL statement budget of a request of the scenario,
+a regression guard against N+1 queries. Budgets count a token cache miss
+and a cold search index, so warm requests usually stay below them.
+"""
+import json
+import random
+from datetime import datetime
+from typing import Callable, List, Optional
+from urllib.parse import urlencode
+
+from sqlalchemy import func
+from sqlmodel import select
+
+from app.core.db_config import async_session
+from app.sweets import db_manager
+from app.sweets.models import Sweet, Ingredient
+from app.users.models import User, Token
+from benchmarks.seed import PASSWORD, SWEET_WORDS, FLAVOUR_WORDS
+
+PER_PAGE = 20
+
+
+class BenchmarkContext:
+    """Facts about the seeded database that scenarios build requests from"""
+
+    def __init__(self, users: List[tuple], sweets_count: int, max_sweet_id: int, max_price: int,
+                 deep_cursor: Optional[str], ingredient_ids: List[int]):
+        # (email, token) of users with a valid token
+        self.users = users
+        self.sweets_count = sweets_count
+        self.max_sweet_id = max_sweet_id
+        self.max_price = max_price
+        self.deep_cursor = deep_cursor
+        self.ingredient_ids = ingredient_ids
+
+    @property
+    def pages(self) -> int:
+        return max(1, -(-self.sweets_count // PER_PAGE))
+
+
+async def load_context(max_users: int = 1000) -> BenchmarkContext:
+    """
+    Reads users, tokens and catalog bounds from the database.
+
+    Returns: BenchmarkContext.
+
+    Raises: RuntimeError: If the database has no users with tokens or no sweets.
+    """
+    async with async_session() as session:
+        results = await session.exec(
+            select(User.email, Token.token).join(Token, Token.user_id == User.id)
+            .where(Token.expires > datetime.now()).order_by(User.id).limit(max_users)
+        )
+        users = [(email, str(token)) for email, token in results.all()]
+        sweets_count, max_sweet_id, max_price = (await session.exec(
+            select(func.count(), func.max(Sweet.id), func.max(Sweet.price)).select_from(Sweet)
+        )).one()
+        if not users or not sweets_count:
+            raise RuntimeError("Seed the database first: python -m benchmarks seed")
+
+        # Cursor of the page before the last one, the deepest page a client can reach
+        results = await session.exec(
+            select(Sweet).order_by(Sweet.id).offset(max(0, sweets_count - PER_PAGE - 1)).limit(1)
+        )
+        sweet = results.first()
+        deep_cursor = db_manager.get_sweets_cursor(sweet, "id") if sweet else None
+
+        results = await session.exec(select(Ingredient.id).order_by(Ingredient.id))
+        ingredient_ids = results.all()
+    return BenchmarkContext(users, sweets_count, max_sweet_id, max_price, deep_cursor, ingredient_ids)
+
+
+class Scenario:
+    """Named request generator with an optional SQL statement budget"""
+
+    def __init__(self, name: str, build: Callable[[random.Random, BenchmarkContext], dict],
+                 max_statements: Optional[int] = None, writes: bool = False, rows_per_request: int = 0):
+        self.name = name
+        self.build = build
+        self.max_statements = max_statements
+        # Scenarios changing the catalog only run on request
+        self.writes = writes
+        # Rows sent per request, for rows/sec of bulk scenarios
+        self.rows_per_request = rows_per_request
+
+
+def _auth_headers(rng: random.Random, ctx: BenchmarkContext) -> dict:
+    _, token = rng.choice(ctx.users)
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _price_range(rng: random.Random, ctx: BenchmarkContext, width: int) -> dict:
+    low = rng.randint(0, ctx.max_price)
+    return {"min_price": low, "max_price": low + width}
+
+
+def _search_query(rng: random.Random) -> str:
+    words = [rng.choice(SWEET_WORDS), rng.choice(FLAVOUR_WORDS)]
+    return " ".join(words[:rng.randint(1, 2)])
+
+
+def _import_body(rng: random.Random, rows: int) -> bytes:
+    lines = [json.dumps({
+        "title": f"{rng.choice(SWEET_WORDS).capitalize()} {rng.choice(FLAVOUR_WORDS)}",
+        "description": "импорт",
+        "price": rng.randint(50, 5000),
+        "categories": ["Импорт"],
+        "ingredients": rng.sample(["мука", "сахар", "яйца", "масло", "шоколад"], 3),
+    }, ensure_ascii=False) for _ in range(rows)]
+    return "\n".join(lines).encode()
+
+
+IMPORT_ROWS = 500
+
+SCENARIOS = [
+    Scenario("sweets_first_page", lambda rng, ctx: {
+        "path": "/api/sweets", "params": {"per_page": PER_PAGE},
+    }, max_statements=2),
+    Scenario("sweets_random_page", lambda rng, ctx: {
+        "path": "/api/sweets", "params": {"page": rng.randint(1, min(ctx.pages, 100)), "per_page": PER_PAGE},
+    }, max_statements=2),
+    Scenario("sweets_deep_offset", lambda rng, ctx: {
+        "path": "/api/sweets", "params": {"page": max(1, ctx.pages - rng.randint(0, 10)), "per_page": PER_PAGE},
+    }, max_statements=2),
+    Scenario("sweets_deep_cursor", lambda rng, ctx: {
+        "path": "/api/sweets", "params": {"cursor": ctx.deep_cursor, "per_page": PER_PAGE},
+    }, max_statements=2),
+    Scenario("sweets_count_exact", lambda rng, ctx: {
+        "path": "/api/sweets", "params": {"per_page": PER_PAGE, "count": "exact"},
+    }, max_statements=2),
+    Scenario("sweets_count_estimated", lambda rng, ctx: {
+        "path": "/api/sweets", "params": {"per_page": PER_PAGE, "count": "estimated"},
+    }, max_statements=2),
+    Scenario("sweet_detail", lambda rng, ctx: {
+        "path": f"/api/sweets/{rng.randint(1, ctx.max_sweet_id)}",
+    }, max_statements=1),
+    Scenario("similar_sweets", lambda rng, ctx: {
+        "path": f"/api/sweets/{rng.randint(1, ctx.max_sweet_id)}/similar", "params": {"limit": 10},
+    }, max_statements=1),
+    Scenario("search", lambda rng, ctx: {
+        "path": "/api/search", "params": {"query": _search_query(rng), "per_page": 10},
+    }, max_statements=2),
+    Scenario("filter_by_price", lambda rng, ctx: {
+        "path": "/api/filter_by_price", "params": _price_range(rng, ctx, width=10),
+    }, max_statements=1),
+    Scenario("price_stats", lambda rng, ctx: {
+        "path": "/api/price_stats", "params": {**_price_range(rng, ctx, width=500), "buckets": 20},
+    }, max_statements=0),
+    Scenario("catalog", lambda rng, ctx: {
+        "path": "/api/catalog",
+        "params": {**_price_range(rng, ctx, width=500), "in_stock": "true",
+                   "order_by": rng.choice(["price", "-created_at"]), "per_page": PER_PAGE},
+    }, max_statements=1),
+    Scenario("facets", lambda rng, ctx: {
+        "path": "/api/facets", "params": {**_price_range(rng, ctx, width=500), "in_stock": "true"},
+    }, max_statements=1),
+    Scenario("match_by_ingredients", lambda rng, ctx: {
+        "path": "/api/match_by_ingredients",
+        "params": {"ingredient": rng.sample(ctx.ingredient_ids, min(len(ctx.ingredient_ids), 20)),
+                   "mode": rng.choice(["subset", "overlap"]), "per_page": PER_PAGE},
+    }, max_statements=1),
+    Scenario("my_sweets", lambda rng, ctx: {
+        "path": "/api/profile/my_sweets", "headers": _auth_headers(rng, ctx),
+    }, max_statements=2),
+    Scenario("users_page", lambda rng, ctx: {
+        "path": "/api/users", "params": {"per_page": 100},
+    }, max_statements=1),
+    Scenario("auth", lambda rng, ctx: {
+        "method": "POST", "path": "/api/auth",
+        "headers": {"Content-Type": "application/x-www-form-urlencoded"},
+        "body": urlencode({"username": rng.choice(ctx.users)[0], "password": PASSWORD}).encode(),
+    }, max_statements=2),
+    Scenario("create_sweet", lambda rng, ctx: {
+        "method": "POST", "path": "/api/profile/sweets",
+        "headers": {**_auth_headers(rng, ctx), "Content-Type": "application/json"},
+        "body": json.dumps({"title": "Эклер", "description": "бенчмарк", "price": rng.randint(50, 5000)}).encode(),
+    }, writes=True),
+    Scenario("import_ndjson", lambda rng, ctx: {
+        "method": "POST", "path": "/api/profile/sweets/import", "params": {"format": "ndjson"},
+        "headers": _auth_headers(rng, ctx), "body": _import_body(rng, IMPORT_ROWS),
+    }, writes=True, rows_per_request=IMPORT_ROWS),
+]
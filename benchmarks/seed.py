@@ -0,0 +1,175 @@
+"""
+Synthetic catalog for benchmarks.
+
+Rows are generated from a seeded random generator, so the same arguments
+always produce the same catalog, and written with multi-row INSERTs.
+"""
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Iterable, List
+
+from sqlalchemy import func, insert, text
+from sqlmodel import SQLModel, select
+
+from app.core.db_config import engine, async_session
+from app.sweets import cards, search
+from app.sweets.models import Sweet, Category, SweetCategory, Ingredient, SweetIngredient
+from app.users.models import User, Token
+from app.users.security import make_password
+
+# Password of every seeded user
+PASSWORD = "benchmark"
+
+# Rows per INSERT statement
+BATCH_SIZE = 2000
+
+SWEET_WORDS = [
+    "эклер", "торт", "пирожное", "макарон", "чизкейк", "тарт", "брауни", "маффин", "безе", "профитроли",
+    "наполеон", "медовик", "штрудель", "панакота", "тирамису", "суфле", "зефир", "пастила", "вафли", "круассан",
+]
+FLAVOUR_WORDS = [
+    "шоколадный", "ванильный", "клубничный", "малиновый", "фисташковый", "карамельный", "лимонный",
+    "кокосовый", "миндальный", "ореховый", "кофейный", "медовый", "вишнёвый", "банановый", "мятный",
+]
+DESCRIPTION_WORDS = [
+    "нежный", "воздушный", "хрустящий", "крем", "бисквит", "глазурь", "ягоды", "сливки", "песочное",
+    "тесто", "начинка", "домашний", "авторский", "сезонный", "праздничный", "классический", "лёгкий",
+]
+CATEGORY_WORDS = ["Торты", "Пирожные", "Печенье", "Десерты в банке", "Выпечка", "Конфеты", "Мороженое",
+                  "Безглютеновые", "Веганские", "Детские", "Свадебные", "Праздничные"]
+INGREDIENT_WORDS = ["мука", "сахар", "яйца", "масло", "молоко", "сливки", "шоколад", "какао", "ваниль",
+                    "клубника", "малина", "фисташки", "миндаль", "фундук", "мёд", "лимон", "кокос",
+                    "сыр маскарпоне", "творог", "желатин", "агар", "карамель", "кофе", "банан", "мята"]
+
+
+def _titles(words: List[str], count: int) -> List[str]:
+    # Numbered after the word list is exhausted, titles stay unique
+    return [words[i % len(words)] + (f" {i // len(words) + 1}" if i >= len(words) else "")
+            for i in range(count)]
+
+
+async def _insert(model, rows: Iterable[dict], conn):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            await conn.execute(insert(model), batch)
+            batch = []
+    if batch:
+        await conn.execute(insert(model), batch)
+
+
+async def _sync_sequences(conn):
+    # IDs were given explicitly, PostgreSQL sequences must continue after them
+    if conn.dialect.name != "postgresql":
+        return
+    for model in (User, Token, Sweet, Category, Ingredient):
+        table = model.__tablename__
+        await conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM \"{table}\"), 0) + 1, false)"
+        ))
+
+
+async def seed_catalog(users: int = 100, sweets: int = 10_000, categories: int = 30, ingredients: int = 100,
+                       categories_per_sweet: int = 3, ingredients_per_sweet: int = 8,
+                       expired_tokens_per_user: int = 0, reset: bool = False, seed: int = 42) -> dict:
+    """
+    Fills the database with a synthetic catalog.
+
+    Args:
+     - users (int): Number of users, each with a token.
+     - sweets (int): Number of sweets, spread over users.
+     - categories (int), ingredients (int): Number of categories and ingredients.
+     - categories_per_sweet (int), ingredients_per_sweet (int): Maximum links of a sweet.
+     - expired_tokens_per_user (int): Historic expired tokens of every user.
+     - reset (bool): Drop and recreate all tables first.
+     - seed (int): Seed of the random generator.
+
+    Returns: Dictionary with numbers of created rows.
+
+    Raises: RuntimeError: If the database already has sweets and reset is not set.
+    """
+    rng = random.Random(seed)
+    async with engine.begin() as conn:
+        if reset:
+            await conn.run_sync(SQLModel.metadata.drop_all)
+        await conn.run_sync(SQLModel.metadata.create_all)
+        existing = (await conn.execute(select(func.count()).select_from(Sweet))).scalar_one()
+        if existing:
+            raise RuntimeError(f"Database already has {existing} sweets, use reset to seed it again")
+
+        hashed_password = make_password(PASSWORD)
+        now = datetime.utcnow()
+        await _insert(User, ({
+            "id": user_id,
+            "email": f"user{user_id}@benchmark.local",
+            "name": f"Кондитер {user_id}",
+            "hashed_password": hashed_password,
+            "is_active": True,
+        } for user_id in range(1, users + 1)), conn)
+
+        def token_rows():
+            token_id = 0
+            for user_id in range(1, users + 1):
+                lifetimes = [timedelta(weeks=2)] + [-timedelta(seconds=rng.randrange(365 * 24 * 3600))
+                                                    for _ in range(expired_tokens_per_user)]
+                for lifetime in lifetimes:
+                    token_id += 1
+                    yield {
+                        "id": token_id,
+                        "user_id": user_id,
+                        "token": uuid.UUID(int=rng.getrandbits(128), version=4),
+                        "expires": now + lifetime,
+                        "token_type": "bearer",
+                    }
+
+        await _insert(Token, token_rows(), conn)
+        await _insert(Category, ({"id": category_id, "title": title}
+                                 for category_id, title in enumerate(_titles(CATEGORY_WORDS, categories), 1)), conn)
+        await _insert(Ingredient, ({"id": ingredient_id, "title": title}
+                                   for ingredient_id, title in enumerate(_titles(INGREDIENT_WORDS, ingredients), 1)),
+                      conn)
+
+        def sweet_rows():
+            for sweet_id in range(1, sweets + 1):
+                created_at = now - timedelta(seconds=rng.randrange(2 * 365 * 24 * 3600))
+                yield {
+                    "id": sweet_id,
+                    "title": f"{rng.choice(SWEET_WORDS).capitalize()} {rng.choice(FLAVOUR_WORDS)} №{sweet_id}",
+                    "description": " ".join(rng.choices(DESCRIPTION_WORDS, k=rng.randint(5, 15))),
+                    "price": rng.randint(50, 5000),
+                    "in_stock": rng.random() < 0.9,
+                    "created_at": created_at,
+                    "edited_at": created_at,
+                    "user_id": rng.randint(1, users),
+                }
+
+        def link_rows(key: str, total: int, per_sweet: int):
+            for sweet_id in range(1, sweets + 1):
+                for linked_id in rng.sample(range(1, total + 1), rng.randint(0, min(per_sweet, total))):
+                    yield {"sweet_id": sweet_id, key: linked_id}
+
+        await _insert(Sweet, sweet_rows(), conn)
+        await _insert(SweetCategory, link_rows("category_id", categories, categories_per_sweet), conn)
+        await _insert(SweetIngredient, link_rows("ingredient_id", ingredients, ingredients_per_sweet), conn)
+        await _sync_sequences(conn)
+
+    async with async_session() as session:
+        await search.index_missing_sweets(session)
+        await cards.refresh_missing_cards(session)
+
+    return {"users": users, "tokens": users * (1 + expired_tokens_per_user), "sweets": sweets,
+            "categories": categories, "ingredients": ingredients}
+
+
+async def catalog_size() -> dict:
+    """
+    Returns: Dictionary with numbers of rows of the seeded tables.
+    """
+    async with engine.connect() as conn:
+        return {
+            model.__tablename__: (await conn.execute(select(func.count()).select_from(model))).scalar_one()
+            for model in (User, Token, Sweet, Category, Ingredient, SweetCategory, SweetIngredient)
+        }
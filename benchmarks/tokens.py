@@ -0,0 +1,69 @@
+"""
+Cost of authenticating a bearer token: in-process verification of a
+signed token vs. the database lookup, with and without the token cache.
+"""
+import time
+from typing import Callable, List
+
+from app.core.db_config import async_session, engine
+from app.users import db_manager, signed_tokens
+from app.users.cache import token_cache
+from benchmarks.runner import percentile
+from benchmarks.scenarios import load_context
+
+
+def _summary(samples: List[float]) -> dict:
+    samples.sort()
+    return {
+        "mean_us": sum(samples) / len(samples) * 1e6,
+        "p50_us": percentile(samples, 0.50) * 1e6,
+        "p95_us": percentile(samples, 0.95) * 1e6,
+    }
+
+
+async def _measure(lookup: Callable, tokens: List[str], iterations: int) -> dict:
+    samples = []
+    for i in range(iterations):
+        token = tokens[i % len(tokens)]
+        started = time.perf_counter()
+        user = await lookup(token)
+        samples.append(time.perf_counter() - started)
+        if user is None:
+            raise RuntimeError("Token lookup failed")
+    return _summary(samples)
+
+
+async def benchmark_token_lookups(iterations: int = 1000) -> dict:
+    """
+    Authenticates seeded tokens with every method.
+
+    Returns: Dictionary of method -> mean, p50 and p95 microseconds per lookup.
+    """
+    try:
+        ctx = await load_context()
+        tokens = [token for _, token in ctx.users]
+        async with async_session() as session:
+            users = [(await db_manager.get_user_by_token(token, session))[0] for token in tokens]
+            signed = [signed_tokens.issue_token(user)[0] for user in users]
+
+            async def signed_lookup(token):
+                return signed_tokens.get_user_by_token(token)
+
+            async def database_lookup(token):
+                token_cache.clear()
+                return await db_manager.get_user_by_token(token, session)
+
+            async def cached_lookup(token):
+                return await db_manager.get_user_by_token(token, session)
+
+            results = {
+                "signed": await _measure(signed_lookup, signed, iterations),
+                "database": await _measure(database_lookup, tokens, iterations),
+            }
+            # Warm the cache with every token first
+            await _measure(cached_lookup, tokens, len(tokens))
+            results["cached"] = await _measure(cached_lookup, tokens, iterations)
+            return results
+    finally:
+        token_cache.clear()
+        await engine.dispose()
@@ -0,0 +1,150 @@
+"""
+Fixtures of the test suite.
+
+Tests run against `TEST_SQLALCHEMY_DATABASE_URI` when it is set (PostgreSQL
+is needed for the query plan tests), otherwise against a temporary SQLite
+file. Every test starts with empty tables and empty in-process caches.
+
+Settings are read when app modules are imported, so the environment is set
+before the first import.
+"""
+import os
+import tempfile
+from typing import List, Optional, Tuple
+
+_TEST_DIR = tempfile.mkdtemp(prefix="eclair-poirot-tests-")
+
+os.environ["DEFAULT_SQLALCHEMY_DATABASE_URI"] = (os.environ.get("TEST_SQLALCHEMY_DATABASE_URI")
+                                                 or f"sqlite+aiosqlite:///{_TEST_DIR}/test.db")
+for _name, _value in {
+    "SECRET_KEY": "test-secret-key-test-secret-key-test",
+    "DEFAULT_DB_HOST": "localhost",
+    "DEFAULT_DB_USER": "postgres",
+    "DEFAULT_DB_PASS": "postgres",
+    "DEFAULT_DB_PORT": "5432",
+    "DEFAULT_DB_NAME": "test",
+    "ENVIRONMENT": "PYTEST",
+    "DB_ECHO": "false",
+    "TOKEN_SWEEP_INTERVAL": "0",
+    "PASSWORD_HASH_ITERATIONS": "1000",
+    "ADMIN_EMAILS": '["admin@example.com"]',
+}.items():
+    os.environ.setdefault(_name, _value)
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlmodel import SQLModel
+
+from app.core.db_config import engine
+from app.core.http_cache import response_cache
+from app.main import app
+from app.sweets.cache import sweets_counter, taxonomy_cache
+from app.sweets.features import sweet_features
+from app.sweets.search import inverted_index
+from app.users.cache import token_cache
+from app.users.signed_tokens import revocation_list
+
+PASSWORD = "password"
+
+
+class QueryCounter:
+    """Context manager collecting SQL statements executed by the engine"""
+
+    def __init__(self, limit: Optional[int] = None, bind=engine):
+        self.limit = limit
+        self.bind = bind.sync_engine if hasattr(bind, "sync_engine") else bind
+        # (statement, parameters) in order of execution
+        self.executions: List[Tuple[str, tuple]] = []
+
+    @property
+    def statements(self) -> List[str]:
+        return [statement for statement, _ in self.executions]
+
+    @property
+    def count(self) -> int:
+        return len(self.executions)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.executions.append((statement, parameters))
+
+    def __enter__(self):
+        self.executions = []
+        event.listen(self.bind, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event.remove(self.bind, "before_cursor_execute", self._on_execute)
+        if exc_type is None and self.limit is not None and self.count > self.limit:
+            statements = "\n".join(self.statements)
+            raise AssertionError(
+                f"Expected at most {self.limit} SQL statements, got {self.count}:\n{statements}"
+            )
+        return False
+
+
+async def _reset_database():
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.drop_all)
+    await response_cache.backend.clear()
+    await response_cache.invalidate()
+    for cache in (token_cache, inverted_index, revocation_list):
+        cache.clear()
+    for cache in (sweets_counter, taxonomy_cache, sweet_features):
+        cache.reset()
+
+
+@pytest.fixture
+def client():
+    """Client of the app on empty tables, the startup creates them"""
+    with TestClient(app) as test_client:
+        test_client.portal.call(_reset_database)
+        # Startup again: tables and caches are rebuilt as on a fresh deploy
+        for handler in app.router.on_startup:
+            test_client.portal.call(handler)
+        yield test_client
+        test_client.portal.call(engine.dispose)
+
+
+def sign_up(client, email: str = "user@example.com", name: str = "user") -> dict:
+    """
+    Registers a user and logs in.
+
+    Returns: Authorization headers of the user.
+    """
+    response = client.post("/api/sign_up", json={"email": email, "name": name, "password": PASSWORD})
+    assert response.status_code in (200, 201), response.text
+    response = client.post("/api/auth", data={"username": email, "password": PASSWORD})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+def auth_headers(client):
+    return sign_up(client)
+
+
+@pytest.fixture
+def catalog(client, auth_headers):
+    """
+    Sweets with categories and ingredients, owned by the user of `auth_headers`.
+
+    Returns: Dictionary containing IDs of sweets, categories and ingredients.
+    """
+    category_ids = [client.post("/api/categories", json={"title": title}).json()["id"]
+                    for title in ("Торты", "Эклеры", "Печенье")]
+    ingredient_ids = [client.post("/api/ingredients", json={"title": title}).json()["id"]
+                      for title in ("мука", "сахар", "шоколад", "сливки")]
+    sweet_ids = []
+    for number in range(6):
+        response = client.post("/api/profile/sweets", headers=auth_headers, json={
+            "title": f"Эклер {number}", "description": "заварное тесто", "price": 100 + 10 * number,
+        })
+        assert response.status_code == 201, response.text
+        sweet_ids.append(response.json()["id"])
+    for number, sweet_id in enumerate(sweet_ids):
+        client.put(f"/api/profile/sweets/{sweet_id}/categories", headers=auth_headers,
+                   json=category_ids[:1 + number % 3]).raise_for_status()
+        client.put(f"/api/profile/sweets/{sweet_id}/ingredients", headers=auth_headers,
+                   json=ingredient_ids[:1 + number % 4]).raise_for_status()
+    return {"sweets": sweet_ids, "categories": category_ids, "ingredients": ingredient_ids}
@@ -0,0 +1,57 @@
+"""
+Access tokens of logins, database rows and stateless signed tokens.
+"""
+import pytest
+
+from app.core.app_config import settings
+from tests.conftest import QueryCounter, sign_up
+
+
+@pytest.fixture
+def signed_tokens(monkeypatch):
+    monkeypatch.setattr(settings, "AUTH_TOKEN_MODE", "signed")
+
+
+def _token(headers: dict) -> str:
+    return headers["Authorization"].removeprefix("Bearer ")
+
+
+def test_database_token_logout(client):
+    headers = sign_up(client)
+    assert client.get("/api/users/me", headers=headers).status_code == 200
+    assert client.post("/api/logout", headers=headers).json() == {"revoked": 1}
+    assert client.get("/api/users/me", headers=headers).status_code == 401
+
+
+def test_signed_token_is_verified_without_database(client, signed_tokens):
+    headers = sign_up(client)
+    assert _token(headers).count(".") == 2
+
+    with QueryCounter(limit=0):
+        response = client.get("/api/users/me", headers=headers)
+    assert response.status_code == 200, response.text
+
+
+def test_signed_token_rejected_when_tampered_or_expired(client, signed_tokens, monkeypatch):
+    token = _token(sign_up(client))
+    message, signature = token.rsplit(".", 1)
+    tampered = f"{message}.{signature[::-1]}"
+    assert client.get("/api/users/me", headers={"Authorization": f"Bearer {tampered}"}).status_code == 401
+
+    monkeypatch.setattr(settings, "SIGNED_TOKEN_LIFETIME", -1)
+    response = client.post("/api/auth", data={"username": "user@example.com", "password": "password"})
+    expired = response.json()["access_token"]
+    assert client.get("/api/users/me", headers={"Authorization": f"Bearer {expired}"}).status_code == 401
+
+
+def test_signed_token_logout(client, signed_tokens):
+    headers = sign_up(client)
+    other_headers = sign_up(client, email="other@example.com", name="other")
+
+    assert client.post("/api/logout", headers=headers).json() == {"revoked": 1}
+    assert client.get("/api/users/me", headers=headers).status_code == 401
+    assert client.get("/api/users/me", headers=other_headers).status_code == 200
+
+    # Logout everywhere revokes tokens issued before it
+    assert client.post("/api/logout", params={"everywhere": True}, headers=other_headers).status_code == 200
+    assert client.get("/api/users/me", headers=other_headers).status_code == 401
@@ -0,0 +1,91 @@
+"""
+Streamed imports of sweets.
+"""
+import json
+from datetime import datetime
+
+from app.core.app_config import settings
+from app.core.db_config import async_session
+from app.sweets import db_manager
+from app.sweets.models import Sweet
+from tests.conftest import QueryCounter
+
+# Bind parameters per statement allowed by asyncpg
+MAX_BIND_PARAMETERS = 32767
+
+
+def _ndjson(rows) -> bytes:
+    return "\n".join(json.dumps(row, ensure_ascii=False) for row in rows).encode()
+
+
+def test_ndjson_import_reports_rejected_lines(client, auth_headers):
+    body = "\n".join([
+        json.dumps({"title": "Эклер", "price": 100, "categories": ["Эклеры"], "ingredients": ["мука"]}),
+        "",
+        "{not json",
+        json.dumps({"title": "", "price": -1}),
+        json.dumps({"title": "Торт", "price": 200}),
+    ]).encode()
+
+    response = client.post("/api/profile/sweets/import", content=body, headers=auth_headers)
+    result = response.json()
+    assert (result["imported"], result["rejected"]) == (2, 2)
+    assert [error["line"] for error in result["errors"]] == [3, 4]
+    assert "title" in result["errors"][1]["error"] and "price" in result["errors"][1]["error"]
+
+    sweets = client.get("/api/profile/my_sweets", headers=auth_headers).json()
+    assert sorted(sweet["title"] for sweet in sweets) == ["Торт", "Эклер"]
+
+
+def test_csv_import_reports_rejected_records(client, auth_headers):
+    body = "\n".join([
+        "title,description,price,categories,ingredients",
+        'Эклер,"заварное тесто,',
+        'с кремом",100,Эклеры,мука; сливки',
+        "Торт,бисквит,дорого,Торты,мука",
+        "Печенье,песочное,50",
+        'Пирожное,"без конца,70,,',
+    ]).encode()
+
+    response = client.post("/api/profile/sweets/import", params={"format": "csv"}, content=body,
+                           headers=auth_headers)
+    result = response.json()
+    assert (result["imported"], result["rejected"]) == (1, 3)
+    assert [error["line"] for error in result["errors"]] == [4, 5, 6]
+
+    sweet = client.get("/api/profile/my_sweets", headers=auth_headers).json()[0]
+    assert sweet["description"] == "заварное тесто,\nс кремом"
+    assert sorted(ingredient["title"] for ingredient in sweet["ingredients"]) == ["мука", "сливки"]
+
+
+def test_import_of_large_chunk(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(settings, "BULK_CHUNK_SIZE", 5000)
+    rows = [{"title": f"Эклер {number}", "description": "заварное тесто", "price": 100 + number,
+             "categories": ["Эклеры"], "ingredients": ["мука", "сливки"]} for number in range(5000)]
+
+    with QueryCounter() as counter:
+        response = client.post("/api/profile/sweets/import", content=_ndjson(rows), headers=auth_headers)
+    assert response.status_code == 200, response.text
+    assert response.json() == {"imported": 5000, "rejected": 0, "errors": []}
+    assert max(len(parameters) for _, parameters in counter.executions) <= MAX_BIND_PARAMETERS
+
+
+def test_multi_row_inserts_stay_below_bind_parameters_limit(client, auth_headers):
+    # Rows of sweets as imported on PostgreSQL, 8 columns with the reserved ID
+    now = datetime.utcnow()
+    user_id = client.post("/api/profile/sweets", headers=auth_headers, json={
+        "title": "Эклер", "description": "заварное тесто", "price": 100,
+    }).json()["user_id"]
+    rows = [{"id": sweet_id, "title": f"Эклер {sweet_id}", "description": "заварное тесто", "price": 100,
+             "in_stock": True, "created_at": now, "edited_at": now, "user_id": user_id}
+            for sweet_id in range(2, 5002)]
+
+    async def insert_rows():
+        async with async_session() as session:
+            await db_manager._insert_rows(Sweet, rows, session)
+            await session.commit()
+
+    with QueryCounter() as counter:
+        client.portal.call(insert_rows)
+    assert counter.count > 1
+    assert max(len(parameters) for _, parameters in counter.executions) <= MAX_BIND_PARAMETERS
@@ -0,0 +1,32 @@
+"""
+Keyset pagination of sweets with opaque cursors.
+"""
+import pytest
+
+from app.core.pagination import encode_cursor
+
+
+@pytest.mark.parametrize("order_by", ["id", "price", "created_at"])
+def test_cursor_pages_cover_the_catalog(client, catalog, order_by):
+    seen, cursor = [], None
+    while True:
+        params = {"per_page": 4, "order_by": order_by, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/api/sweets", params=params).json()
+        seen += [sweet["id"] for sweet in page["results"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert sorted(seen) == sorted(catalog["sweets"])
+    assert len(seen) == len(set(seen))
+
+
+@pytest.mark.parametrize("path", ["/api/sweets", "/api/catalog"])
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    encode_cursor(["id", 1]),
+    encode_cursor({"id": "1; DROP TABLE sweet"}),
+    encode_cursor({"price": 100, "id": 1}),
+], ids=["malformed", "not-an-object", "wrong-type", "other-sort-key"])
+def test_invalid_cursor_is_bad_request(client, catalog, path, cursor):
+    response = client.get(path, params={"cursor": cursor})
+    assert response.status_code == 400, response.text
@@ -0,0 +1,48 @@
+"""
+SQL statement budgets of read endpoints, a guard against N+1 queries.
+
+Budgets count a token cache miss and a cold search index. The seeded sweets
+all have categories and ingredients, so loading links per sweet exceeds them.
+"""
+import pytest
+
+from app.users.cache import token_cache
+from tests.conftest import QueryCounter
+
+# (path, authenticated, statement budget)
+BUDGETS = [
+    ("/api/sweets", False, 2),
+    ("/api/sweets/{sweet_id}", False, 1),
+    ("/api/profile/my_sweets", True, 2),
+    ("/api/search?query=эклер", False, 2),
+]
+
+
+@pytest.mark.parametrize("path, authenticated, budget", BUDGETS, ids=[path for path, _, _ in BUDGETS])
+def test_statement_budget(client, auth_headers, catalog, path, authenticated, budget):
+    token_cache.clear()
+    with QueryCounter(limit=budget):
+        response = client.get(path.format(sweet_id=catalog["sweets"][0]),
+                              headers=auth_headers if authenticated else {})
+    assert response.status_code == 200, response.text
+    assert response.json()
+
+
+def test_cached_listing_skips_database(client, catalog):
+    client.get("/api/sweets").raise_for_status()
+    with QueryCounter(limit=0):
+        response = client.get("/api/sweets")
+    assert response.headers["x-cache"] == "HIT"
+
+
+@pytest.mark.parametrize("count, statements", [(None, 1), ("cached", 1), ("exact", 2)])
+def test_listing_count_modes(client, auth_headers, catalog, count, statements):
+    # The first listing loads the cached total, a new sweet keeps it up to date
+    client.get("/api/sweets").raise_for_status()
+    client.post("/api/profile/sweets", headers=auth_headers, json={
+        "title": "Эклер", "description": "заварное тесто", "price": 100,
+    }).raise_for_status()
+
+    with QueryCounter(limit=statements):
+        response = client.get("/api/sweets", params={"count": count} if count else {})
+    assert response.json()["total_count"] == len(catalog["sweets"]) + 1
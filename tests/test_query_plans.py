@@ -0,0 +1,115 @@
+"""
+Query plans of catalog reads, PostgreSQL only.
+
+Each case runs one read path of `db_manager` and `EXPLAIN`s every SELECT it
+issued with `enable_seqscan` off, so a sequential scan only remains when no
+index can serve the query, whatever the size of the seeded data. Run with
+`TEST_SQLALCHEMY_DATABASE_URI` pointing to a PostgreSQL database.
+"""
+import re
+from typing import get_args
+
+import pytest
+from sqlmodel import select
+
+from app.core.db_config import async_session, engine
+from app.core.pagination import encode_cursor
+from app.sweets import db_manager as sweets_db
+from app.sweets.models import Sweet
+from app.sweets.schemas import CatalogFilter
+from app.users import db_manager as users_db
+from app.users.cache import token_cache
+from app.users.models import User, Token
+from tests.conftest import QueryCounter
+
+pytestmark = pytest.mark.skipif(engine.dialect.name != "postgresql",
+                                reason="Query plans are checked on PostgreSQL")
+
+# Tables expected to grow with the catalog and its users
+LARGE_TABLES = {"sweet", "sweetcard", "sweetcategory", "sweetingredient", "sweetsearch", "token", "user"}
+
+SEQ_SCAN = re.compile(r'Seq Scan on "?(\w+)"?')
+
+
+def _catalog_cases():
+    cases = []
+    for order_by in get_args(sweets_db.SweetsOrder):
+        cases += [
+            (f"sweets-page-{order_by}",
+             lambda ctx, session, order_by=order_by: sweets_db.get_deserts(1, session, order_by=order_by)),
+            (f"sweets-after-{order_by}",
+             lambda ctx, session, order_by=order_by: sweets_db.get_deserts_after(
+                 sweets_db.get_sweets_cursor(ctx["sweet"], order_by), session, order_by=order_by)),
+            (f"catalog-{order_by}",
+             lambda ctx, session, order_by=order_by: sweets_db.get_catalog_page(
+                 CatalogFilter(in_stock=True, min_price=ctx["sweet"].price, max_price=ctx["sweet"].price + 100),
+                 sweets_db.get_sweets_cursor(ctx["sweet"], order_by), session, order_by=order_by)),
+        ]
+    return cases
+
+
+CASES = [
+    *_catalog_cases(),
+    ("catalog-categories", lambda ctx, session: sweets_db.get_catalog_page(
+        CatalogFilter(category_ids=ctx["categories"][:2]), None, session)),
+    ("catalog-ingredients", lambda ctx, session: sweets_db.get_catalog_page(
+        CatalogFilter(ingredient_ids=ctx["ingredients"][:2], exclude_ingredient_ids=ctx["ingredients"][3:]),
+        None, session)),
+    ("catalog-owner", lambda ctx, session: sweets_db.get_catalog_page(
+        CatalogFilter(user_id=ctx["user"].id), None, session)),
+    ("catalog-query", lambda ctx, session: sweets_db.get_catalog_page(
+        CatalogFilter(query="эклер"), None, session)),
+    ("filter-by-price", lambda ctx, session: sweets_db.filter_sweets(
+        ctx["sweet"].price, ctx["sweet"].price, session)),
+    ("facets", lambda ctx, session: sweets_db.get_facets(CatalogFilter(), session)),
+    ("facets-filtered", lambda ctx, session: sweets_db.get_facets(
+        CatalogFilter(in_stock=True, min_price=ctx["sweet"].price, category_ids=ctx["categories"][:1]), session)),
+    ("search", lambda ctx, session: sweets_db.search_sweets("эклер", session)),
+    ("sweet-card", lambda ctx, session: sweets_db.get_sweet_card(ctx["sweet"].id, session)),
+    ("sweet-by-id", lambda ctx, session: sweets_db.get_sweet_by_id(ctx["sweet"].id, session)),
+    # Endpoints pass the row of `get_current_user`
+    ("my-sweets", lambda ctx, session: sweets_db.get_my_sweets(session, (ctx["user"],))),
+    ("user-by-token", lambda ctx, session: users_db.get_user_by_token(str(ctx["token"].token), session)),
+    ("user-by-email", lambda ctx, session: users_db.get_user_by_email(ctx["user"].email, session)),
+    # Tokens of the seeded user are reused, the login path reads only
+    ("login-token", lambda ctx, session: users_db.get_or_create_user_token(ctx["user"].id, session)),
+    ("users-after", lambda ctx, session: users_db.get_users_after(encode_cursor({"id": 0}), session)),
+]
+
+
+async def _explain(statement: str, parameters) -> list:
+    async with engine.connect() as conn:
+        await conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        results = await conn.exec_driver_sql("EXPLAIN " + statement, parameters)
+        plan = [row[0] for row in results.all()]
+        await conn.rollback()
+    return plan
+
+
+async def _seq_scans(read_path, catalog) -> list:
+    async with async_session() as session:
+        ctx = {
+            **catalog,
+            "sweet": (await session.exec(select(Sweet).where(Sweet.id == catalog["sweets"][-1]))).one(),
+            "user": (await session.exec(select(User))).first(),
+            "token": (await session.exec(select(Token))).first(),
+        }
+        token_cache.clear()
+        with QueryCounter() as counter:
+            await read_path(ctx, session)
+
+    failures = []
+    for statement, parameters in counter.executions:
+        if not statement.lstrip().upper().startswith("SELECT"):
+            continue
+        plan = await _explain(statement, parameters)
+        tables = {match.group(1) for match in map(SEQ_SCAN.search, plan) if match}
+        if tables & LARGE_TABLES:
+            failures.append(f"{statement}\n  " + "\n  ".join(plan))
+    return failures
+
+
+@pytest.mark.parametrize("read_path", [read_path for _, read_path in CASES], ids=[name for name, _ in CASES])
+def test_no_sequential_scans(client, catalog, read_path):
+    failures = client.portal.call(_seq_scans, read_path, catalog)
+    assert not failures, "Sequential scans:\n\n" + "\n\n".join(failures)
@@ -0,0 +1,47 @@
+"""
+Cached responses of public reads and their invalidation by changes.
+"""
+import pytest
+
+
+def _cached_titles(client, path: str) -> list:
+    client.get(path).raise_for_status()
+    response = client.get(path)
+    assert response.headers["x-cache"] == "HIT"
+    return [sweet["title"] for sweet in response.json()["results"]]
+
+
+@pytest.mark.parametrize("change", ["create", "update", "delete"])
+def test_changes_invalidate_cached_listing(client, auth_headers, catalog, change):
+    sweet_id = catalog["sweets"][0]
+    titles = _cached_titles(client, "/api/sweets")
+
+    if change == "create":
+        response = client.post("/api/profile/sweets", headers=auth_headers, json={
+            "title": "Новый эклер", "description": "заварное тесто", "price": 100,
+        })
+    elif change == "update":
+        response = client.patch(f"/api/profile/sweets/{sweet_id}", json={"title": "Новый эклер"},
+                                headers=auth_headers)
+    else:
+        response = client.delete(f"/api/profile/sweets/{sweet_id}", headers=auth_headers)
+    response.raise_for_status()
+
+    response = client.get("/api/sweets")
+    assert response.headers["x-cache"] == "MISS"
+    new_titles = [sweet["title"] for sweet in response.json()["results"]]
+    assert new_titles != titles
+    assert ("Новый эклер" in new_titles) == (change != "delete")
+
+
+def test_private_reads_are_not_cached(client, auth_headers, catalog):
+    for _ in range(2):
+        response = client.get("/api/profile/my_sweets", headers=auth_headers)
+        assert "x-cache" not in response.headers
+
+
+def test_not_modified(client, catalog):
+    response = client.get("/api/sweets")
+    etag = response.headers["etag"]
+    response = client.get("/api/sweets", headers={"If-None-Match": etag})
+    assert response.status_code == 304
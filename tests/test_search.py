@@ -0,0 +1,44 @@
+"""
+Full-text search of sweets. On SQLite it is served by the in-memory inverted
+index, which follows committed transactions only.
+"""
+from sqlalchemy import update
+
+from app.core.db_config import async_session
+from app.sweets import search
+from app.sweets.models import Sweet
+
+
+def _found(client, query: str) -> list:
+    return [sweet["id"] for sweet in client.get("/api/search", params={"query": query}).json()]
+
+
+def test_search_follows_committed_changes(client, auth_headers, catalog):
+    sweet_id = catalog["sweets"][0]
+    assert sweet_id in _found(client, "эклер")
+
+    response = client.patch(f"/api/profile/sweets/{sweet_id}", json={"title": "Профитроль"}, headers=auth_headers)
+    response.raise_for_status()
+    assert _found(client, "профитроль") == [sweet_id]
+
+    client.delete(f"/api/profile/sweets/{sweet_id}", headers=auth_headers).raise_for_status()
+    assert _found(client, "профитроль") == []
+
+
+def test_search_ignores_rolled_back_changes(client, catalog):
+    sweet_id = catalog["sweets"][0]
+    assert sweet_id in _found(client, "эклер")
+
+    async def rename_and_roll_back():
+        async with async_session() as session:
+            await session.execute(update(Sweet).where(Sweet.id == sweet_id).values(title="Профитроль"))
+            await search.index_sweets([sweet_id], session)
+            await session.rollback()
+            # Documents of the rolled back transaction are not applied by a later commit
+            await session.commit()
+
+        async with async_session() as session:
+            assert await search.search_sweet_ids("профитроль", session) == []
+            assert sweet_id in await search.search_sweet_ids("эклер", session)
+
+    client.portal.call(rename_and_roll_back)
@@ -0,0 +1,48 @@
+"""
+Links of sweets to categories and ingredients.
+"""
+import pytest
+
+# (path, parameter of the linked entity, key of the catalog)
+LINKS = [
+    ("/api/profile/sweet_category", "category_id", "categories"),
+    ("/api/profile/sweet_ingredient", "ingredient_id", "ingredients"),
+]
+
+
+@pytest.mark.parametrize("path, parameter, key", LINKS, ids=["category", "ingredient"])
+def test_remove_link(client, auth_headers, catalog, path, parameter, key):
+    # The first sweet is linked to the first category and ingredient only
+    sweet_id, linked_id, unlinked_id = catalog["sweets"][0], catalog[key][0], catalog[key][-1]
+
+    response = client.delete(path, params={"sweet_id": sweet_id, parameter: linked_id}, headers=auth_headers)
+    assert response.status_code == 201, response.text
+    assert response.json() == {"sweet_id": sweet_id, parameter: linked_id}
+    sweet = client.get(f"/api/sweets/{sweet_id}").json()
+    assert sweet[key] == []
+
+    for params in ({"sweet_id": sweet_id, parameter: linked_id},
+                   {"sweet_id": sweet_id, parameter: unlinked_id},
+                   {"sweet_id": 999999, parameter: linked_id},
+                   {"sweet_id": sweet_id, parameter: 999999}):
+        response = client.delete(path, params=params, headers=auth_headers)
+        assert response.status_code == 404, (params, response.text)
+
+
+@pytest.mark.parametrize("key", ["categories", "ingredients"])
+def test_unchanged_links_keep_cached_pages(client, auth_headers, catalog, key):
+    sweet_id = catalog["sweets"][0]
+    client.get("/api/sweets").raise_for_status()
+
+    # The first sweet is already linked to the first category and ingredient
+    response = client.put(f"/api/profile/sweets/{sweet_id}/{key}", json=catalog[key][:1], headers=auth_headers)
+    assert response.json() == {"sweet_id": sweet_id, "added": [], "removed": []}
+    path = "/api/profile/sweet_categories" if key == "categories" else "/api/profile/sweet_ingredients"
+    parameter = "category_id" if key == "categories" else "ingredient_id"
+    response = client.post(path, json=[{"sweet_id": sweet_id, parameter: catalog[key][0]}], headers=auth_headers)
+    assert response.json() == []
+    assert client.get("/api/sweets").headers["x-cache"] == "HIT"
+
+    response = client.put(f"/api/profile/sweets/{sweet_id}/{key}", json=catalog[key][:2], headers=auth_headers)
+    assert response.json() == {"sweet_id": sweet_id, "added": catalog[key][1:2], "removed": []}
+    assert client.get("/api/sweets").headers["x-cache"] == "MISS"
@@ -0,0 +1,88 @@
+"""
+Updates of sweets with optimistic concurrency (`If-Match`).
+"""
+import pytest
+
+from app.core.http_cache import response_cache
+
+
+@pytest.fixture(params=[True, False], ids=["response-cache", "no-response-cache"])
+def response_cache_enabled(request):
+    enabled = response_cache.enabled
+    response_cache.enabled = request.param
+    yield request.param
+    response_cache.enabled = enabled
+
+
+def test_update_with_etag_of_get(client, auth_headers, catalog, response_cache_enabled):
+    sweet_id = catalog["sweets"][0]
+    etag = client.get(f"/api/sweets/{sweet_id}").headers["etag"]
+
+    response = client.patch(f"/api/profile/sweets/{sweet_id}", json={"price": 999},
+                            headers={**auth_headers, "If-Match": etag})
+    assert response.status_code == 200, response.text
+    assert response.json()["price"] == 999
+    assert response.headers["etag"] != etag
+
+    # The stale ETag loses to the update made with it
+    response = client.put(f"/api/profile/sweets/{sweet_id}",
+                          json={"title": "Эклер", "description": "старый", "price": 1},
+                          headers={**auth_headers, "If-Match": etag})
+    assert response.status_code == 412
+
+    response = client.get(f"/api/sweets/{sweet_id}")
+    assert response.json()["price"] == 999
+    assert response.headers["etag"] == client.get(f"/api/sweets/{sweet_id}").headers["etag"]
+
+
+def test_get_answers_not_modified_to_current_etag(client, catalog):
+    sweet_id = catalog["sweets"][0]
+    etag = client.get(f"/api/sweets/{sweet_id}").headers["etag"]
+    response = client.get(f"/api/sweets/{sweet_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+
+def test_update_of_missing_or_foreign_sweet(client, auth_headers, catalog):
+    from tests.conftest import sign_up
+
+    response = client.patch("/api/profile/sweets/999999", json={"price": 1}, headers=auth_headers)
+    assert response.status_code == 404
+
+    other_headers = sign_up(client, email="other@example.com", name="other")
+    response = client.patch(f"/api/profile/sweets/{catalog['sweets'][0]}", json={"price": 1},
+                            headers=other_headers)
+    assert response.status_code == 403
+
+
+def test_patch_rejects_null_and_empty_changes(client, auth_headers, catalog):
+    sweet_id = catalog["sweets"][0]
+    assert client.patch(f"/api/profile/sweets/{sweet_id}", json={"title": None},
+                        headers=auth_headers).status_code == 422
+    assert client.patch(f"/api/profile/sweets/{sweet_id}", json={}, headers=auth_headers).status_code == 400
+
+
+def test_admin_edit_changes_etag(client, auth_headers, catalog):
+    from app.main import admin
+    from app.sweets.admin import SweetAdmin
+
+    sweet_id = catalog["sweets"][0]
+    etag = client.get(f"/api/sweets/{sweet_id}").headers["etag"]
+
+    view = next(view for view in admin.views if isinstance(view, SweetAdmin))
+    client.portal.call(view.update_model, None, str(sweet_id), {"price": 555})
+
+    response = client.get(f"/api/sweets/{sweet_id}")
+    assert response.json()["price"] == 555
+    assert response.headers["etag"] != etag
+    response = client.patch(f"/api/profile/sweets/{sweet_id}", json={"price": 1},
+                            headers={**auth_headers, "If-Match": etag})
+    assert response.status_code == 412
+
+
+def test_if_match_forms(client, auth_headers, catalog):
+    sweet_id = catalog["sweets"][0]
+    for if_match, status_code in (("*", 200), ('W/"2"', 200), ("2", 412), ('"abc"', 412)):
+        response = client.patch(f"/api/profile/sweets/{sweet_id}", json={"in_stock": False},
+                                headers={**auth_headers, "If-Match": if_match})
+        assert response.status_code == status_code, (if_match, response.text)